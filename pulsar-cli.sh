@@ -39,13 +39,34 @@ LOGOPT=("--log-opt" "max-size=100m" "--log-opt" "max-file=50")
 DOCKEROPT=("--restart" "always")
 PORTS="2001,8089,8090"
 BADGER_API="https://api.microbadger.com/v1/images/"
-RPC_NODE="https://apidev.blkcc.xyz"
+#Comma separated http(s)/ws(s) endpoints, ranked by latency and head block lag (see: nodes probe)
+: "${RPC_NODES="https://apidev.blkcc.xyz,${REMOTE_WS}"}"
+export PULSAR_NODES="${RPC_NODES}"
+: "${PULSAR_SOCKET="${HOME}/.pulsar-cli.sock"}"
+export PULSAR_SOCKET
+: "${BLOCKLOG_URL="https://seed.blkcc.xyz/pulsar"}"
+: "${EXPORTER_LISTEN="127.0.0.1:9192"}"
+#Caching JSON-RPC proxy in front of the RPC node (empty: not started with rpcnode)
+: "${PROXY_LISTEN="0.0.0.0:8080"}"
 BEEM_VER="0.21.0"
+#Node instances on this host (see: fleet), INSTANCE=name runs the other commands on one of them
+: "${INSTANCES="${DATADIR}/instances.json"}"
+: "${INSTANCE=""}"
+#Seconds the signing agent keeps the keys unlocked (see: agent)
+: "${AGENT_TTL="3600"}"
+
+if [[ -n "${INSTANCE}" ]]; then
+    #DOCKER_NAME, DATADIR, PORTS and the CPU/memory limits of the instance
+    instance_env=$(PYTHONPATH="${DIR}/scripts/python" python3 -m pulsar fleet env "${INSTANCE}" --profiles "${INSTANCES}") || exit 1
+    eval "${instance_env}"
+fi
 
 IFS=","
 DPORTS=()
 for i in $PORTS; do
-    if [[ $i != "" ]]; then
+    if [[ $i == *:* ]]; then
+        DPORTS+=("-p$i")
+    elif [[ $i != "" ]]; then
         DPORTS+=("-p0.0.0.0:$i:$i")
     fi
 done
@@ -63,29 +84,61 @@ help() {
     echo "    start - starts PULSAR container"
     echo "    stop - stops PULSAR container"
     echo "    status - show status of PULSAR container"
+    echo "    proxy - caching JSON-RPC proxy on PROXY_LISTEN in front of the RPC node, started with rpcnode (proxy [start|stop|status|stats|test])"
+    echo "    exporter - serve Prometheus metrics (head block lag, missed blocks, RPC latency) on EXPORTER_LISTEN"
     echo "    restart - restarts PULSAR container"
+    echo "    fleet - seed, witness and RPC instances from data/instances.json, all at once (fleet status, fleet restart [NAME...]); INSTANCE=NAME runs any command on one instance"
     echo "    witness - witness node setup"
     echo "    disable_witness - disable a witness"
     echo "    enable_witness - re-enable a witness"
+    echo "    watchdog - switch the signing key to a backup node when blocks are missed (watchdog --backup-key KEY [--backup-key KEY2] [--disable-last])"
     echo "    publish_feed - publish a new feed base price as a witness"
+    echo "    feed_daemon - keep witness price feeds up to date from the sources in data/feed.json"
     echo "    wallet - open cli_wallet in the container"
     echo "    remote_wallet - open cli_wallet in the container connecting to a remote seed"
     echo "    rpcnode - setup and configure an RPC node"
     echo "    enter - enter a bash session in the container"
     echo "    logs - show all logs inc. docker logs, and PULSAR logs"
+    echo "    logstore - index the docker and p2p logs into events and search them (logstore summary --by hour, logstore last, logstore query --type fork --since 7d)"
+    echo "    monitor - follow a replay: blocks/s, ETA, shared_memory use (monitor [--label NAME], monitor runs, monitor compare [ID1 ID2])"
     echo "    change_password - change the password of an PULSAR account"
+    echo "    agent - encrypted keystore and a signing agent: keys unlocked once for a TTL, used by witness, disable_witness, publish_feed, watchdog and feed_daemon (\"agent\": true in feed.json), AGENT_TTL=0 for the daemons (agent import .credentials.json --remove, agent start, agent lock)"
+    echo "    verify_keys - derive and verify keys for many accounts from a CSV/NDJSON file (account,password)"
+    echo "    witnesses - list witnesses from a cache refreshed incrementally: sort, filter, top N, JSON/CSV (witnesses --top 21 --sort missed, witnesses diff)"
+    echo "    history - export the operation history of an account to NDJSON (.gz) or Parquet, only new operations on later runs (history ACCOUNT FILE)"
+    echo "    stream - follow the chain as NDJSON blocks or operations, with parallel catch-up and reconnects (stream follow --start -100 --ops)"
+    echo "    plan - prepare, sign (offline) and broadcast a plan of operations for several accounts (see data/plan.json.example)"
     echo "    cleanup - remove block_log & shared_memory file"
+    echo "    snapshot - save shared_memory with its block_log height (snapshot [NAME], snapshot list, snapshot verify [NAME])"
+    echo "    restore - put a snapshot back (the latest, or restore NAME) and start the node without replaying"
     echo "    info - query information about the blockchain, a block, an account, a post/comment and/or public keys"
-    echo "    optimize - modify kernel parameters for better disk caching"
+    echo "    blocks - print blocks START [END] from the local block_log as JSON lines, or 'blocks bench' to measure read speed"
+    echo "    verify_blocks - check block_log against its index and the block chain, offer to truncate it to the last good block"
+    echo "    optimize - set kernel writeback parameters sized for this host's RAM and disk"
+    echo "    seeds - probe the seed nodes and the peers from the p2p log, rank them with their past probes and rewrite p2p-seed-node in config.ini (seeds --apply, seeds history)"
+    echo "    tune - measure the host and show a tuned config.ini and vm settings (tune --apply, tune history)"
+    echo "    nodes - probe the RPC nodes in RPC_NODES (probe), print the fastest one (best) or make a call (call METHOD PARAMS)"
+    echo "    resident - start/stop/status of the resident python helper (keeps a warm interpreter and RPC connection)"
+    echo "    bench - benchmark the python commands against a local mock node, fail on drift from the baseline (bench run [CMD..] [--save], bench list)"
     echo
     exit
 }
 
 optimize() {
-    echo    75 | sudo tee /proc/sys/vm/dirty_background_ratio
-    echo  1000 | sudo tee /proc/sys/vm/dirty_expire_centisecs
-    echo    80 | sudo tee /proc/sys/vm/dirty_ratio
-    echo 30000 | sudo tee /proc/sys/vm/dirty_writeback_centisecs
+    tune --vm-only --apply "${@}"
+}
+
+tune() {
+    #config.ini and vm settings sized for this host; vm settings are applied with --apply
+    local vm; vm="$(mktemp)"
+    if ! pulsarpy tune "${@}" --dir "${DATADIR}/witness/blockchain" --config "${DATADIR}/witness/config.ini" --sysctl "${vm}"; then rm -f "${vm}"; return 1; fi
+    if [[ " ${*} " == *" --apply "* && -s "${vm}" ]]; then sudo /sbin/sysctl -q -p "${vm}"; fi
+    rm -f "${vm}"
+}
+
+seeds() {
+    #The fastest reachable seeds, from config.ini, the p2p log and the peers probed before
+    pulsarpy seeds "${@}" --config "${DATADIR}/witness/config.ini" --logs "${DATADIR}/logs.db" --p2p "${DATADIR}/witness/logs/p2p/p2p.log"
 }
 
 spin() {
@@ -125,26 +178,103 @@ dlblocks() {
     if [[ ! -d "${DATADIR}/witness/blockchain" ]]; then
         /bin/mkdir -p "${DATADIR}/witness/blockchain"
     fi
-    echo "${RED}Removing old block log${RESET}"
-    /usr/bin/sudo rm -f "${DATADIR}/witness/blockchain/block_log"
+    echo "${RED}Removing old block log index${RESET}"
     /usr/bin/sudo rm -f "${DATADIR}/witness/blockchain/block_log.index"
-    echo "Downloading PULSAR block logs..."
-    /usr/bin/wget --quiet "https://seed.blkcc.xyz/pulsar/block_log" -O "${DATADIR}/witness/blockchain/block_log"
-    /usr/bin/wget --quiet "https://seed.blkcc.xyz/pulsar/MD5SUM" -O "${DATADIR}/witness/blockchain/MD5SUM"
-    echo "Verifying MD5 checksum... this may take a while..."
-    cd "${DATADIR}/witness/blockchain" ; md5sum -c MD5SUM ; cd -
+    # A block_log (or the directory) left by root, E.G. an older setup, is taken over: the resumed download opens it for writing
+    local f
+    for f in "${DATADIR}/witness/blockchain" "${DATADIR}/witness/blockchain/block_log" "${DATADIR}/witness/blockchain/block_log.journal"; do
+        if [[ -e "${f}" && ! -w "${f}" ]]; then
+            echo "${YELLOW}${f} isn't writable, changing its owner to $(whoami)${RESET}"
+            if ! /usr/bin/sudo /bin/chown "$(id -u):$(id -g)" "${f}"; then { printf "%s\\n" "${RED}ERROR: Can't take over ${f}, remove it and run '$0 dlblocks' again.${RESET}"; return 1; } fi
+        fi
+    done
+    echo "Downloading PULSAR block logs... (interrupted downloads are resumed)"
+    if ! pulsarpy dlblocks "${BLOCKLOG_URL}/block_log" "${DATADIR}/witness/blockchain/block_log" --md5-url "${BLOCKLOG_URL}/MD5SUM"; then
+        printf "%s\\n" "${RED}ERROR: Block log download or verification failed. Run '$0 dlblocks' again to resume.${RESET}"
+        return 1
+    fi
     echo "${GREEN}FINISHED. Blockchain ledger downloaded and verified${RESET}"
     echo "$ pulsar-cli.sh replay"
 }
 
+verifyblocks() {
+    if [[ ! -s "${DATADIR}/witness/blockchain/block_log" ]]; then { printf "%s\\n" "${RED}ERROR: There's no block_log to verify.${RESET}" "$ pulsar-cli.sh dlblocks"; return 1; } fi
+    local opts=()
+    if seed_running; then
+        echo "${YELLOW}Container is running, the block_log is only checked. Stop it to be able to truncate.${RESET}"
+        opts=("--no-truncate")
+    fi
+    pulsarpy verify_blocklog --dir "${DATADIR}/witness/blockchain" "${opts[@]}" "${@}"
+}
+
+pulsarpy() {
+    PYTHONPATH="${DIR}/scripts/python" python3 -m pulsar "${@}"
+}
+
+resident() {
+    case "${1:-status}" in
+        start)
+            if [[ -S "${PULSAR_SOCKET}" ]]; then { echo "${GREEN}Resident helper already running on ${PULSAR_SOCKET}${RESET}"; return 0; } fi
+            nohup env PYTHONPATH="${DIR}/scripts/python" python3 -m pulsar serve --idle-timeout "${RESIDENT_IDLE:-3600}" &>/dev/null &
+            echo "${GREEN}Resident helper starting on ${PULSAR_SOCKET}${RESET}"
+            ;;
+        stop)
+            pulsarpy serve --stop
+            ;;
+        status)
+            if [[ -S "${PULSAR_SOCKET}" ]]; then { echo "Resident helper running?: ${GREEN}YES${RESET}"; } else { echo "Resident helper running?: ${RED}NO${RESET}"; } fi
+            ;;
+        bench)
+            pulsarpy bench_startup "${@:2}"
+            ;;
+        *)
+            echo "Usage: $0 resident [start|stop|status|bench COMMAND]"
+            ;;
+    esac
+}
+
+proxy() {
+    local pidfile="${DATADIR}/rpcproxy.pid"
+    case "${1:-status}" in
+        start)
+            if [[ -s "${pidfile}" ]] && kill -0 "$(cat "${pidfile}")" 2>/dev/null; then { echo "${GREEN}RPC proxy already running on ${PROXY_LISTEN}${RESET}"; return 0; } fi
+            nohup env PYTHONPATH="${DIR}/scripts/python" python3 -m pulsar rpcproxy --listen "${PROXY_LISTEN}" --backend "http://127.0.0.1:8090" "${@:2}" &>>"${DATADIR}/rpcproxy.log" &
+            echo $! > "${pidfile}"
+            echo "${GREEN}RPC proxy starting on ${PROXY_LISTEN} (log: ${DATADIR}/rpcproxy.log)${RESET}"
+            ;;
+        stop)
+            if [[ -s "${pidfile}" ]]; then { kill "$(cat "${pidfile}")" 2>/dev/null; rm -f "${pidfile}"; } fi
+            ;;
+        status)
+            if [[ -s "${pidfile}" ]] && kill -0 "$(cat "${pidfile}")" 2>/dev/null; then { echo "RPC proxy running?: ${GREEN}YES${RESET}"; } else { echo "RPC proxy running?: ${RED}NO${RESET}"; } fi
+            ;;
+        stats)
+            /usr/bin/curl -s "http://127.0.0.1:${PROXY_LISTEN##*:}/stats"
+            ;;
+        test)
+            pulsarpy rpcproxy --self-test
+            ;;
+        *)
+            echo "Usage: $0 proxy [start|stop|status|stats|test]"
+            ;;
+    esac
+}
+
 getkeys() {
     read -r -p "Please enter your PULSAR account name (without the @): " user
     read -r -p "Please enter your PULSAR master password: " pass
     [[ -f "${DIR}/.credentials.json" ]] && { rm "${DIR}/.credentials.json"; }
-    "${DIR}/scripts/python/get_user_keys.py" "${user}" "${pass}" > "${DIR}/.credentials.json"
+    pulsarpy get_user_keys "${user}" "${pass}" > "${DIR}/.credentials.json"
 }
 
 getinfo() {
+    #Block lookups are answered from the local block_log when there is one
+    if (( $# == 1 )) && [[ "${1}" =~ ^[0-9]+$ ]] && [[ -s "${DATADIR}/witness/blockchain/block_log" ]]; then
+        pulsarpy blocklog info "${1}" --dir "${DATADIR}/witness/blockchain"
+        return
+    fi
+    local RPC_NODE
+    RPC_NODE="$(pulsarpy nodes best --http)"
     if [[ -e "${HOME}"/.local/bin/beempy ]]; then
         local_version="$("${HOME}"/.local/bin/beempy --version)"
         if [[ x"${local_version}" == "xbeempy, version ${BEEM_VER}" ]]; then
@@ -172,11 +302,37 @@ initwit() {
     case ${yn} in [Yy]* ) return;; [Nn]* ) rm "${DIR}/.credentials.json" ;; * ) echo "Please answer yes or no.";; esac
 }
 
+agent() {
+    case "${1:-status}" in
+        start|unlock) pulsarpy agent "${@}" --ttl "${AGENT_TTL}" ;;
+        *) pulsarpy agent "${@:-status}" ;;
+    esac
+}
+
+#The signing agent is running with unlocked keys
+agent_ready() {
+    pulsarpy agent status --quiet &>/dev/null
+}
+
+#The keystore line (name, then public keys) of the witness set in config.ini, never just any account
+agent_witness() {
+    local name
+    name=$(/bin/sed -n 's/^witness *= *"\{0,1\}\([^" ]*\)"\{0,1\} *$/\1/p' "${DATADIR}/witness/config.ini" 2>/dev/null | head -n1)
+    [[ -z "${name}" ]] && { printf "%s\\n" "Error. No witness = \"name\" line in ${DATADIR}/witness/config.ini, the agent can't tell which account to use" >&2; return 1; }
+    pulsarpy agent accounts --account "${name}"
+}
+
 updatewit() {
     do_update() {
         printf "%s\\n" "The properties of the witness account will be updated and broadcasted to the network"
         read -r -p "Are you sure you want to proceed? (yes/no) " yn
         case ${yn} in [Yy]* ) ;; [Nn]* ) exit ;; * ) echo "Please answer yes or no.";; esac
+        if agent_ready; then
+            witness_keys=$(agent_witness) || exit 1
+            IFS=$'\t' read -r user owner_pubkey _ <<< "${witness_keys}"
+            pulsarpy update_witness update "${user}" --agent --publicownerkey "${owner_pubkey}" --blocksize 131072 --url "https://condenser.pulsar.eu/@${user}" --creationfee "0.100 PULSE" --interestrate 0
+            return
+        fi
         if [[ ! -s "${DIR}/.credentials.json" ]]; then
             getkeys
             [[ ! -s "${DIR}/.credentials.json" ]] && { printf "%s\\n" "Error. ${DIR}/.credentials.json doesn't exist or is empty"; exit 1; }
@@ -184,7 +340,7 @@ updatewit() {
         user="$(/usr/bin/jq -r '.name' "${DIR}/.credentials.json")"
         owner_pubkey="$(/usr/bin/jq -r '.owner[] | select(.type == "public") | .value' "${DIR}/.credentials.json")"
         active_privkey="$(/usr/bin/jq -r '.active[] | select(.type == "private") | .value' "${DIR}/.credentials.json")"
-        "${DIR}/scripts/python/update_witness.py" update "${user}" "${active_privkey}" --publicownerkey "${owner_pubkey}" --blocksize 131072 --url "https://condenser.pulsar.eu/@${user}" --creationfee "0.100 PULSE" --interestrate 0
+        pulsarpy update_witness update "${user}" "${active_privkey}" --publicownerkey "${owner_pubkey}" --blocksize 131072 --url "https://condenser.pulsar.eu/@${user}" --creationfee "0.100 PULSE" --interestrate 0
     }
     if seed_running; then
         do_update
@@ -203,20 +359,40 @@ disablewit() {
     printf "%s\\n" "This operation will disable your witness"
     read -r -p "Are you sure you want to proceed? (yes/no) " yn
     case ${yn} in [Yy]* ) ;; [Nn]* ) exit ;; * ) echo "Please answer yes or no.";; esac
+    if agent_ready; then
+        witness_keys=$(agent_witness) || exit 1
+        IFS=$'\t' read -r user _ <<< "${witness_keys}"
+        pulsarpy update_witness disable "${user}" --agent
+        return
+    fi
     if [[ ! -s "${DIR}/.credentials.json" ]]; then
         getkeys
         [[ ! -s "${DIR}/.credentials.json" ]] && { printf "%s\\n" "Error. ${DIR}/.credentials.json doesn't exist or is empty"; exit 1; }
     fi
     user="$(/usr/bin/jq -r '.name' "${DIR}/.credentials.json")"
     active_privkey="$(/usr/bin/jq -r '.active[] | select(.type == "private") | .value' "${DIR}/.credentials.json")"
-    "${DIR}/scripts/python/update_witness.py" disable "${user}" "${active_privkey}"
+    pulsarpy update_witness disable "${user}" "${active_privkey}"
+}
+
+watchdog() {
+    #With the signing agent no plaintext key is needed (or written again by getkeys)
+    if agent_ready; then
+        witness_keys=$(agent_witness) || exit 1
+        pulsarpy witness_watchdog --agent --witness "${witness_keys%%$'\t'*}" "${@}"
+        return
+    fi
+    if [[ ! -s "${DIR}/.credentials.json" ]]; then
+        getkeys
+        [[ ! -s "${DIR}/.credentials.json" ]] && { printf "%s\\n" "Error. ${DIR}/.credentials.json doesn't exist or is empty"; exit 1; }
+    fi
+    pulsarpy witness_watchdog --credentials "${DIR}/.credentials.json" "${@}"
 }
 
 updatefeed() {
     printf "%s\\n" "This operation will publish a new feed base price for your witness"
     read -r -p "Are you sure you want to proceed? (yes/no) " yn
     case ${yn} in [Yy]* ) ;; [Nn]* ) exit ;; * ) echo "Please answer yes or no.";; esac
-    if [[ ! -s "${DIR}/.credentials.json" ]]; then
+    if ! agent_ready && [[ ! -s "${DIR}/.credentials.json" ]]; then
         getkeys
         [[ ! -s "${DIR}/.credentials.json" ]] && { printf "%s\\n" "Error. ${DIR}/.credentials.json doesn't exist or is empty"; exit 1; }
     fi
@@ -226,9 +402,23 @@ updatefeed() {
         [Nn]* ) read -r -p "What feed price would you like to publish ? (Provide a value with three decimals without the EUR symbol, e.g.: 1.000) : " my_feed ;;
         * ) echo "Please answer yes or no.";;
     esac
+    if agent_ready; then
+        witness_keys=$(agent_witness) || exit 1
+        IFS=$'\t' read -r user _ <<< "${witness_keys}"
+        pulsarpy pricefeed_update "${user}" "${my_feed}" --agent
+        return
+    fi
     user="$(/usr/bin/jq -r '.name' "${DIR}/.credentials.json")"
     active_privkey="$(/usr/bin/jq -r '.active[] | select(.type == "private") | .value' "${DIR}/.credentials.json")"
-    "${DIR}/scripts/python/pricefeed_update.py" "${user}" "${active_privkey}" "${my_feed}"
+    pulsarpy pricefeed_update "${user}" "${active_privkey}" "${my_feed}"
+}
+
+feeddaemon() {
+    if [[ ! -f "${DATADIR}/feed.json" ]]; then
+        printf "%s\\n" "${RED}ERROR: ${DATADIR}/feed.json doesn't exist.${RESET}" "Copy ${DATADIR}/feed.json.example and set your witnesses and price sources."
+        return 1
+    fi
+    pulsarpy feed_daemon "${DATADIR}/feed.json" "${@}"
 }
 
 chgpass() {
@@ -237,11 +427,11 @@ chgpass() {
     case ${yn} in
         [Yy]* )
             read -r -p "Please enter your PULSAR account name (without the @): " user
-            "${DIR}/scripts/python/change_password.py" "${user}" --store-credentials "${DIR}/.credentials.json"
+            pulsarpy change_password "${user}" --store-credentials "${DIR}/.credentials.json"
             ;;
         [Nn]* )
             read -r -p "Please enter your PULSAR account name (without the @): " user
-            "${DIR}/scripts/python/change_password.py" "${user}"
+            pulsarpy change_password "${user}"
             ;;
         * ) echo "Please answer yes or no.";;
     esac
@@ -450,21 +640,69 @@ installme() {
 }
 
 seed_exists() {
-    seedcount=$(docker ps -a -f name="^/${DOCKER_NAME}$" | wc -l)
-    if [[ $seedcount -eq 2 ]]; then
-        return 0
+    docker inspect --type container "${DOCKER_NAME}" &>/dev/null
+}
+
+node_run() {
+    #Same binary choice as replay: the full node for the RPC config
+    if /usr/bin/diff -q "${DATADIR}/witness/config.ini" "${DATADIR}/witness/config.rpc.ini.example" &>/dev/null; then
+        docker run -u "$(id -u)" "${DOCKEROPT[@]}" "${DPORTS[@]}" -v "${DATADIR}":/pulsar "${LOGOPT[@]}" -d --name "${DOCKER_NAME}" -t pulsar_img "${PULSAR_FULL}"/pulsard -d /pulsar/witness "${@}"
     else
-        return 1
+        docker run -u "$(id -u)" "${DOCKEROPT[@]}" "${DPORTS[@]}" -v "${DATADIR}":/pulsar "${LOGOPT[@]}" -d --name "${DOCKER_NAME}" -t pulsar_img "${PULSAR_DEF}"/pulsard -d /pulsar/witness "${@}"
     fi
 }
 
-seed_running() {
-    seedcount=$(docker ps -f 'status=running' -f name=$DOCKER_NAME | wc -l)
-    if [[ $seedcount -eq 2 ]]; then
-        return 0
-    else
+snapshot() {
+    local replay_secs was_running=0 opts=()
+    #pulsard logs the duration of a replay when it's done, keep it to report the time a restore saves
+    replay_secs=$(docker logs "${DOCKER_NAME}" 2>&1 | grep -o "Done reindexing, elapsed time: [0-9.]*" | tail -n 1 | grep -o "[0-9.]*$" || true)
+    if [[ -n "${replay_secs}" ]]; then opts=("--replay-seconds" "${replay_secs}"); fi
+    if seed_running; then
+        echo "${RED}WARNING: Your ($DOCKER_NAME) container is currently running${RESET}"
+        read -r -p "A consistent snapshot needs the node stopped. Stop it now and start it again afterwards? (y/n) > " shouldstop
+        if [[ "$shouldstop" == "y" ]]; then
+                stop
+                was_running=1
+        else
+                echo "${GREEN}Did not say 'y'. Quitting.${RESET}"
+                return
+        fi
+    fi
+    if ! pulsarpy snapshot create "${@}" --dir "${DATADIR}/witness/blockchain" --snapshots "${DATADIR}/snapshots" --config "${DATADIR}/witness/config.ini" "${opts[@]}"; then
+        printf "%s\\n" "${RED}ERROR: Snapshot failed.${RESET}"
+    fi
+    if (( was_running == 1 )); then
+        echo "${GREEN}Starting container...${RESET}"
+        node_run
+    fi
+}
+
+restore() {
+    if seed_running; then
+        echo "${RED}WARNING: Your ($DOCKER_NAME) container is currently running${RESET}"
+        read -r -p "Do you want to stop the container and restore a snapshot? (y/n) > " shouldstop
+        if [[ "$shouldstop" == "y" ]]; then
+                stop
+        else
+                echo "${GREEN}Did not say 'y'. Quitting.${RESET}"
+                return
+        fi
+    elif seed_exists; then
+        #A stopped container may have been created with --replay-blockchain
+        docker rm ${DOCKER_NAME}
+    fi
+    if ! pulsarpy snapshot restore "${@}" --dir "${DATADIR}/witness/blockchain" --snapshots "${DATADIR}/snapshots" --config "${DATADIR}/witness/config.ini"; then
+        printf "%s\\n" "${RED}ERROR: Restore failed, shared_memory was left untouched.${RESET}"
         return 1
     fi
+    echo "Running container without replay..."
+    node_run
+    echo "Started."
+}
+
+seed_running() {
+    #Exact name: pulsar-seed and the other instances aren't this container
+    [[ "$(docker inspect --type container --format '{{.State.Running}}' "${DOCKER_NAME}" 2>/dev/null)" == "true" ]]
 }
 
 replay() {
@@ -479,7 +717,7 @@ replay() {
         fi
     fi
     if [[ ! -s "${DATADIR}/witness/blockchain/block_log" ]]; then { printf "%s\\n" "${RED}ERROR: There's no ledger available to replay.${RESET}" "$ pulsar-cli.sh dlblocks"; return 1; } fi
-    echo "Running container & replay..."
+    echo "Running container & replay... (follow it with: $0 monitor)"
     if [[ $(/usr/bin/diff -q "${DATADIR}/witness/config.ini" "${DATADIR}/witness/config.rpc.ini.example" &>/dev/null) -eq 0 ]]; then
         docker run -u "$(id -u)" "${DOCKEROPT[@]}" "${DPORTS[@]}" -v "${DATADIR}":/pulsar "${LOGOPT[@]}" -d --name "${DOCKER_NAME}" -t pulsar_img "${PULSAR_FULL}"/pulsard -d /pulsar/witness --replay-blockchain
     else
@@ -508,6 +746,7 @@ rpcnode() {
         docker run -u "$(id -u)" "${DOCKEROPT[@]}" "${DPORTS[@]}" -v "${DATADIR}":/pulsar "${LOGOPT[@]}" -d --name "${DOCKER_NAME}" -t pulsar_img "${PULSAR_FULL}"/pulsard -d /pulsar/witness
     fi
     echo "Started."
+    if [[ -n "${PROXY_LISTEN}" ]]; then proxy start; fi
 }
 
 start() {
@@ -537,6 +776,8 @@ wallet() {
 remote_wallet() {
     if (( $# == 1 )); then
         REMOTE_WS=$1
+    else
+        REMOTE_WS="$(pulsarpy nodes best --ws 2>/dev/null || echo "${REMOTE_WS}")"
     fi
     docker run -u "$(id -u)" -v "${DATADIR}":/pulsar --rm -it pulsar_img "${PULSAR_DEF}"/cli_wallet -s "$REMOTE_WS" -w /pulsar/wallet.json
 }
@@ -546,6 +787,26 @@ logs() {
     docker logs -f --tail=30 ${DOCKER_NAME}
 }
 
+logstore() {
+    local src=(--db "${DATADIR}/logs.db" --p2p "${DATADIR}/witness/logs/p2p/p2p.log") dlog
+    dlog=$(docker inspect --format '{{.LogPath}}' "${DOCKER_NAME}" 2>/dev/null || true)
+    [[ -n "${dlog}" ]] && src+=(--docker "${dlog}")
+    #Docker's log files are only readable by root, the store stays ours
+    if [[ -n "${dlog}" ]] && ! [[ -r "${dlog}" ]]; then
+        sudo env PYTHONPATH="${DIR}/scripts/python" python3 -m pulsar logstore "${@:-summary}" "${src[@]}"
+        sudo chown "$(id -u):$(id -g)" "${DATADIR}/logs.db"
+        return
+    fi
+    pulsarpy logstore "${@:-summary}" "${src[@]}"
+}
+
+replaymonitor() {
+    if ! seed_exists; then { printf "%s\\n" "${RED}ERROR: There's no container to monitor.${RESET}" "$ pulsar-cli.sh replay"; return 1; } fi
+    echo "${BLUE}REPLAY MONITOR: (press ctrl-c to exit) ${RESET}"
+    #The whole log, with timestamps, so a replay that started earlier is measured from its beginning
+    docker logs -f --timestamps ${DOCKER_NAME} 2>&1 | pulsarpy replay_monitor watch - --dir "${DATADIR}/witness/blockchain" "${@}"
+}
+
 status() {
 
     if seed_exists; then
@@ -565,7 +826,8 @@ status() {
     fi
 }
 
-if [[ ! -f "${DATADIR}/witness/config.ini" ]]; then
+#Instances get theirs from their profile's template on their first start
+if [[ -z "${INSTANCE}" && ! -f "${DATADIR}/witness/config.ini" ]]; then
     echo "config.ini not found. copying example (seed)";
     cp "${DATADIR}/witness/config.ini.example" "${DATADIR}/witness/config.ini"
 fi
@@ -598,32 +860,60 @@ case $1 in
     disable_witness)
         disablewit
         ;;
+    watchdog)
+        watchdog "${@:2}"
+        ;;
     publish_feed)
         updatefeed
         ;;
-    start)
-        start
+    feed_daemon)
+        feeddaemon "${@:2}"
         ;;
-    replay)
-        replay
+    start|stop|restart|replay)
+        if [[ -n "${INSTANCE}" ]]; then
+            pulsarpy fleet "$1" "${INSTANCE}" --profiles "${INSTANCES}"
+        elif [[ $1 == restart ]]; then
+            #docker stop only returns once pulsard has exited
+            stop
+            start
+        else
+            $1
+        fi
         ;;
-    stop)
-        stop
+    fleet)
+        pulsarpy fleet "${@:2}" --profiles "${INSTANCES}"
         ;;
     setup)
         setup
         ;;
-    restart)
-        stop
-        sleep 5
-        start
-        ;;
     optimize)
-        echo "Applying recommended dirty write settings..."
-        optimize
+        echo "Applying dirty write settings tuned for this host..."
+        optimize "${@:2}"
+        ;;
+    tune)
+        tune "${@:2}"
+        ;;
+    seeds)
+        seeds "${@:2}"
+        ;;
+    resident)
+        resident "${@:2}"
+        ;;
+    bench)
+        pulsarpy bench "${@:2}"
+        ;;
+    nodes)
+        pulsarpy nodes "${@:2}"
         ;;
     status)
-        status
+        if [[ -n "${INSTANCE}" ]]; then pulsarpy fleet status "${INSTANCE}" --profiles "${INSTANCES}"; else status; fi
+        ;;
+    proxy)
+        proxy "${@:2}"
+        ;;
+    exporter)
+        #Witnesses default to the ones in config.ini, more can be added with --witness NAME
+        pulsarpy exporter --listen "${EXPORTER_LISTEN}" --local "http://127.0.0.1:8090" --config "${DATADIR}/witness/config.ini" "${@:2}"
         ;;
     wallet)
         wallet
@@ -643,15 +933,63 @@ case $1 in
     logs)
         logs
         ;;
+    logstore)
+        logstore "${@:2}"
+        ;;
+    monitor)
+        if [[ "${2:-}" == "runs" || "${2:-}" == "compare" ]]; then
+            pulsarpy replay_monitor "${@:2}"
+        else
+            replaymonitor "${@:2}"
+        fi
+        ;;
     info)
         getinfo "${@:2}"
         ;;
+    blocks)
+        if [[ "${2:-}" == "bench" ]]; then
+            pulsarpy blocklog bench "${@:3}" --dir "${DATADIR}/witness/blockchain"
+        else
+            pulsarpy blocklog dump "${@:2}" --dir "${DATADIR}/witness/blockchain"
+        fi
+        ;;
+    verify_blocks)
+        verifyblocks "${@:2}"
+        ;;
     change_password)
         chgpass
         ;;
+    agent)
+        agent "${@:2}"
+        ;;
+    verify_keys)
+        pulsarpy verify_keys "${@:2}"
+        ;;
+    witnesses)
+        pulsarpy witnesses "${@:2}"
+        ;;
+    history)
+        pulsarpy history "${@:2}"
+        ;;
+    stream)
+        pulsarpy stream "${@:2}"
+        ;;
+    plan)
+        pulsarpy plan "${@:2}"
+        ;;
     cleanup)
         cleanup "${@:2}"
         ;;
+    snapshot)
+        if [[ "${2:-}" == "list" || "${2:-}" == "verify" ]]; then
+            pulsarpy snapshot "${@:2}" --dir "${DATADIR}/witness/blockchain" --snapshots "${DATADIR}/snapshots"
+        else
+            snapshot "${@:2}"
+        fi
+        ;;
+    restore)
+        restore "${@:2}"
+        ;;
     *)
         echo "Invalid cmd"
         help
@@ -1,7 +1,7 @@
 #/usr/bin/env bash
 
 _pulsar_completion() {
-    COMPREPLY=($(compgen -W "setup install_docker install_dependencies install dlblocks replay start stop status restart witness disable_witness enable_witness publish_feed wallet remote_wallet rpcnode enter logs change_password cleanup info optimize" "${COMP_WORDS[1]}"))
+    COMPREPLY=($(compgen -W "setup install_docker install_dependencies install dlblocks replay start stop status restart fleet proxy exporter witness disable_witness enable_witness watchdog publish_feed feed_daemon wallet remote_wallet rpcnode enter logs logstore monitor change_password agent verify_keys witnesses history stream plan cleanup snapshot restore info blocks verify_blocks optimize tune seeds nodes resident bench" "${COMP_WORDS[1]}"))
 }
 
 complete -F _pulsar_completion pulsar-cli.sh
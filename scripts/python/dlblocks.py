@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+#Kept for compatibility, the command lives in the pulsar package: python3 -m pulsar dlblocks
+import sys
+from pulsar.cli import main
+
+sys.exit(main(["dlblocks"] + sys.argv[1:]))
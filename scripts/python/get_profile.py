@@ -1,38 +1,6 @@
 #!/usr/bin/env python3
-import json, sys
-from beem import Steem
-from beem.account import Account
-from beemgraphenebase.account import PrivateKey, PublicKey 
-from argparse import ArgumentParser
-from beem.instance import set_shared_steem_instance
+#Kept for compatibility, the command lives in the pulsar package: python3 -m pulsar get_profile
+import sys
+from pulsar.cli import main
 
-stmf = Steem(node=["https://apidev.blkcc.xyz"])
-
-def checkacc(username):
-    try:
-        acc = Account(username, steem_instance=stmf)
-    except Exception as exception:
-        assert type(exception).__name__ == 'AccountDoesNotExistsException'
-        assert exception.__class__.__name__ == 'AccountDoesNotExistsException'
-        return False
-    else:
-        return True
-
-parser = ArgumentParser()
-parser.add_argument('account', help="Name of the Pulsar account", type=str, nargs=1)
-parser.add_argument('--all', help="If used, all information regarding the account will be displayed", action='store_true')
-args = parser.parse_args()
-
-if checkacc(args.account[0]):
-
-    acc = Account(args.account[0], steem_instance=stmf)
-
-    if args.all:
-        print(json.dumps(acc.json(), indent=4))
-    else:
-        print(json.dumps(acc.profile, indent=4))
-
-else:
-    sys.exit("The account provided is not a valid account in the Pulsar Blockchain. Wrong account " + args.account[0])
-
-# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
+sys.exit(main(["get_profile"] + sys.argv[1:]))
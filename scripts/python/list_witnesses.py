@@ -1,10 +1,6 @@
 #!/usr/bin/env python3
-from beem.witness import ListWitnesses
-from beem.instance import set_shared_steem_instance
+#Kept for compatibility, the command lives in the pulsar package: python3 -m pulsar list_witnesses
+import sys
+from pulsar.cli import main
 
-from beem import Steem
-stm = Steem(node=["https://apidev.blkcc.xyz"])
-
-set_shared_steem_instance(stm)
-
-print(ListWitnesses())
+sys.exit(main(["list_witnesses"] + sys.argv[1:]))
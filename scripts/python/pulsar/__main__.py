@@ -0,0 +1,4 @@
+import sys
+from pulsar.cli import main
+
+sys.exit(main())
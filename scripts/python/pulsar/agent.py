@@ -0,0 +1,350 @@
+from getpass import unix_getpass
+import json, os, socket, struct, sys, threading, time
+from pulsar.util import human
+
+RESIDENT = False
+
+#Encrypted keystore and a signing agent. The keystore keeps the public keys of each account in
+#the clear and the private keys BIP38 encrypted (scrypt + AES, like beem's own wallet) under one
+#passphrase. The agent decrypts them once, holds them in memory for --ttl seconds and signs
+#transactions sent over a unix socket, a batch per request, so the shell functions and the
+#daemons never read a key file or derive a key again. Requests and replies are JSON lines, a
+#connection can be kept open for many requests:
+#
+#    {"op": "sign", "chain": {...chain_params}, "transactions": [tx, ...], "signers": [[["account", "active"]], ...]}
+#    {"op": "status"} {"op": "unlock", "passphrase": "..."} {"op": "lock"} {"op": "stop"}
+
+HOME = os.path.expanduser("~")
+KEYSTORE = os.environ.get("PULSAR_KEYSTORE") or os.path.join(HOME, ".pulsar-cli.keystore.json")
+SOCKET = os.environ.get("PULSAR_AGENT") or os.path.join(HOME, ".pulsar-cli-agent.sock")
+ROLES = ['owner', 'active', 'posting', 'memo']
+#Owner authority satisfies active, owner and active satisfy posting
+AUTHORITY = {"owner": ["owner"], "active": ["active", "owner"], "posting": ["posting", "active", "owner"], "memo": ["memo"]}
+
+def add_arguments(parser):
+    parser.add_argument('action', help="import: add .credentials.json files to the keystore, list: keys in the keystore, accounts: public keys per account (tab separated), "
+                                       "start: unlock and serve, unlock/lock/status/stop: the running agent",
+                        choices=['import', 'list', 'accounts', 'start', 'unlock', 'lock', 'status', 'stop'])
+    parser.add_argument('files', help="import: .credentials.json files", type=str, nargs='*')
+    parser.add_argument('--keystore', help="Encrypted keystore. Default: PULSAR_KEYSTORE or " + KEYSTORE, type=str, default=KEYSTORE)
+    parser.add_argument('--socket', help="Agent socket. Default: PULSAR_AGENT or " + SOCKET, type=str, default=SOCKET)
+    parser.add_argument('--roles', help="import: private keys to keep, the public keys of all roles are always kept", type=str, default="active,posting,memo")
+    parser.add_argument('--verify', help="import: also check the keys against the account on chain", action='store_true')
+    parser.add_argument('--prefix', help="import: the chain's public key prefix. Default: the node's", type=str)
+    parser.add_argument('--remove', help="import: overwrite and delete the plaintext files once imported", action='store_true')
+    parser.add_argument('--ttl', help="start, unlock: seconds the keys stay unlocked, 0: until stopped", type=int, default=3600)
+    parser.add_argument('--locked', help="start: start without keys, unlock later", action='store_true')
+    parser.add_argument('--foreground', help="start: don't detach", action='store_true')
+    parser.add_argument('--account', help="accounts: only this account, fails when it isn't in the keystore", type=str)
+    parser.add_argument('--quiet', help="status: no output, exit code 0 when unlocked", action='store_true')
+
+class AgentError(Exception):
+    pass
+
+def load_keystore(path):
+    try:
+        with open(path) as f: return json.load(f)
+    except FileNotFoundError:
+        return {"version": 1, "keys": []}
+    except (OSError, ValueError) as e:
+        raise AgentError("%s: %s" % (path, e))
+
+def save_keystore(path, store):
+    #Only ever encrypted keys in it, still nobody else's business
+    tmp = path + ".%d" % os.getpid()
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f: json.dump(store, f, indent=4)
+    os.replace(tmp, path)
+
+def decrypt(entry, passphrase):
+    from beemgraphenebase import bip38
+    try:
+        return format(bip38.decrypt(entry["encrypted"], passphrase), "wif")
+    except bip38.SaltException:
+        raise AgentError("Wrong passphrase")
+
+def decrypt_all(store, passphrase):
+    #(account, role) -> wif
+    return {(e["account"], e["role"]): decrypt(e, passphrase) for e in store["keys"] if e.get("encrypted")}
+
+def ask_passphrase(new=False):
+    passphrase = unix_getpass(prompt="Keystore passphrase: ")
+    if new:
+        if len(passphrase) < 8: raise AgentError("Use a passphrase of at least 8 characters")
+        if unix_getpass(prompt="Repeat the passphrase: ") != passphrase: raise AgentError("The passphrases don't match")
+    return passphrase
+
+def wipe(path):
+    #Best effort: overwritten before it's unlinked
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.write(b"\0" * size)
+        f.flush()
+        os.fsync(f.fileno())
+    os.unlink(path)
+
+def import_credentials(args):
+    from beemgraphenebase import bip38
+    from beemgraphenebase.account import PrivateKey
+    if not args.files: raise AgentError("import needs .credentials.json files")
+    roles = [r for r in args.roles.split(",") if r]
+    if any(r not in ROLES for r in roles): raise AgentError("Roles are: " + ", ".join(ROLES))
+    store = load_keystore(args.keystore)
+    encrypted = [e for e in store["keys"] if e.get("encrypted")]
+    passphrase = ask_passphrase(new=not encrypted)
+    #All keys share the passphrase
+    if encrypted: decrypt(encrypted[0], passphrase)
+    prefix = args.prefix
+    if prefix is None:
+        from pulsar.client import get_steem
+        prefix = get_steem().prefix
+    added = []
+    for path in args.files:
+        try:
+            with open(path) as f: creds = json.load(f)
+        except (OSError, ValueError) as e:
+            raise AgentError("%s: %s" % (path, e))
+        name = creds["name"]
+        keys = {role: {k["type"]: k["value"] for k in creds[role]} for role in ROLES}
+        for role in roles:
+            if str(PrivateKey(keys[role]["private"], prefix=prefix).pubkey) != keys[role]["public"]: raise AgentError("%s: the private %s key doesn't match its public key" % (path, role))
+        if args.verify:
+            from pulsar.client import get_account, chain_auths
+            account = get_account(name)
+            if account is None: raise AgentError("Wrong username " + name)
+            auths = chain_auths(account)
+            wrong = [r for r in ROLES if auths[r] != keys[r]["public"]]
+            if wrong: raise AgentError("%s: the %s keys aren't @%s's on chain" % (path, ", ".join(wrong), name))
+        store["keys"] = [e for e in store["keys"] if e["account"] != name]
+        for role in ROLES:
+            entry = {"account": name, "role": role, "public": keys[role]["public"]}
+            if role in roles: entry["encrypted"] = format(bip38.encrypt(PrivateKey(keys[role]["private"], prefix=prefix), passphrase), "encwif")
+            store["keys"].append(entry)
+        added.append(name)
+    save_keystore(args.keystore, store)
+    print("Imported %s (%s keys) into %s" % (", ".join("@" + n for n in added), ", ".join(roles), args.keystore))
+    if args.remove:
+        for path in args.files: wipe(path)
+        print("Removed " + ", ".join(args.files))
+
+def sign_transactions(chain, items):
+    #items: (transaction, wifs). Only beembase, no node: the chain parameters come with the request
+    from beembase import operations
+    from beembase.signedtransactions import Signed_Transaction
+    from beemgraphenebase.chains import known_chains
+    #Amounts are parsed by symbol through the known chains, this one may not be among them offline
+    if not any(c.get("chain_id") == chain["chain_id"] for c in known_chains.values()): known_chains["PULSAR"] = chain
+    #As beem's TransactionBuilder.sign: the transaction's prefix doesn't reach the operations, which
+    #otherwise read keys and amounts as STM
+    operations.default_prefix = chain["prefix"]
+    out = []
+    for tx, wifs in items:
+        body = {k: v for k, v in tx.items() if k != "signatures"}
+        body["operations"] = [[name, dict(op, prefix=chain["prefix"])] for name, op in tx["operations"]]
+        stx = Signed_Transaction(prefix=chain["prefix"], **body)
+        stx.sign(wifs, chain=chain)
+        out.append(stx.json())
+    return out
+
+class Agent:
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+        self.keys = {}
+        self.expires = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def unlock(self, keys, ttl):
+        with self.lock:
+            self.keys = keys
+            self.expires = time.monotonic() + ttl if ttl else None
+
+    def forget(self):
+        with self.lock:
+            self.keys = {}
+            self.expires = None
+
+    def expire(self):
+        if self.expires is not None and time.monotonic() >= self.expires: self.forget()
+
+    def wif(self, account, role):
+        for r in AUTHORITY.get(role, []):
+            if (account, r) in self.keys: return self.keys[(account, r)]
+        raise AgentError("No %s key of @%s in the agent" % (role, account))
+
+    def handle(self, req):
+        self.expire()
+        op = req.get("op")
+        if op == "status":
+            left = None if self.expires is None else max(0, int(self.expires - time.monotonic()))
+            return {"unlocked": bool(self.keys), "keys": sorted("%s/%s" % k for k in self.keys), "expires_in": left}
+        if op == "unlock":
+            self.unlock(decrypt_all(self.store, req.get("passphrase", "")), req.get("ttl", self.ttl))
+            return {"unlocked": True, "keys": len(self.keys)}
+        if op == "lock":
+            self.forget()
+            return {"unlocked": False}
+        if op == "stop":
+            self.forget()
+            self.stopping.set()
+            return {}
+        if op == "sign":
+            if not self.keys: raise AgentError("The agent is locked, unlock it with: agent unlock")
+            with self.lock:
+                items = [(tx, list(dict.fromkeys(self.wif(a, r) for a, r in signers))) for tx, signers in zip(req["transactions"], req["signers"])]
+            return {"transactions": sign_transactions(req["chain"], items)}
+        raise AgentError("Unknown request %r" % op)
+
+    def serve_connection(self, conn):
+        with conn:
+            #Only this user (or root) talks to the agent, whatever the socket's mode
+            _, uid, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+            if uid not in (os.getuid(), 0): return
+            f = conn.makefile("rb")
+            for line in f:
+                try:
+                    reply = self.handle(json.loads(line.decode()))
+                except (AgentError, ValueError, KeyError, TypeError) as e:
+                    reply = {"error": str(e)}
+                except Exception as e:
+                    reply = {"error": "%s: %s" % (type(e).__name__, e)}
+                conn.sendall(json.dumps(reply).encode() + b"\n")
+                if self.stopping.is_set(): return
+
+    def serve(self, path):
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            srv.bind(path)
+        finally:
+            os.umask(umask)
+        srv.listen(16)
+        srv.settimeout(1)
+        try:
+            while not self.stopping.is_set():
+                self.expire()
+                try:
+                    conn, _ = srv.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            srv.close()
+            if os.path.exists(path): os.unlink(path)
+
+class AgentClient:
+    #One connection, kept for all the requests of this process
+    def __init__(self, path=None):
+        self.path = path or SOCKET
+        self.sock = None
+        self.reader = None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise AgentError("No signing agent on %s, start one with: agent start" % self.path)
+        self.sock, self.reader = sock, sock.makefile("rb")
+
+    def request(self, req):
+        #A daemon's connection may be from an agent since restarted: one retry on a fresh one
+        for attempt in (0, 1):
+            if self.sock is None: self.connect()
+            try:
+                self.sock.sendall(json.dumps(req).encode() + b"\n")
+                line = self.reader.readline()
+            except OSError:
+                line = b""
+            if line: break
+            self.close()
+            if attempt: raise AgentError("The signing agent closed the connection")
+        reply = json.loads(line.decode())
+        if "error" in reply: raise AgentError(reply["error"])
+        return reply
+
+    def sign(self, chain, transactions, signers):
+        #signers: for each transaction, the [account, role] pairs it needs
+        return self.request({"op": "sign", "chain": chain, "transactions": transactions, "signers": signers})["transactions"]
+
+    def close(self):
+        if self.sock is not None: self.sock.close()
+        self.sock = self.reader = None
+
+def harden():
+    #No core dumps and no ptrace by the user's other processes: the keys only live in this memory
+    import resource
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    try:
+        import ctypes
+        ctypes.CDLL(None).prctl(4, 0, 0, 0, 0) #PR_SET_DUMPABLE
+    except (OSError, AttributeError):
+        pass
+
+def start(args):
+    if os.path.exists(args.socket):
+        try:
+            AgentClient(args.socket).request({"op": "status"})
+        except AgentError:
+            os.unlink(args.socket)
+        else:
+            raise AgentError("An agent is already listening on " + args.socket)
+    store = load_keystore(args.keystore)
+    if not any(e.get("encrypted") for e in store["keys"]): raise AgentError("No keys in %s, add some with: agent import .credentials.json" % args.keystore)
+    harden()
+    agent = Agent(store, args.ttl)
+    if not args.locked: agent.unlock(decrypt_all(store, ask_passphrase()), args.ttl)
+    if not args.foreground:
+        if os.fork():
+            #The parent returns once the socket is there
+            for _ in range(50):
+                if os.path.exists(args.socket): break
+                time.sleep(0.1)
+            print("Signing agent listening on %s, %s" % (args.socket, "locked" if args.locked else "%d keys unlocked" % len(agent.keys) + (" for %ds" % args.ttl if args.ttl else "")))
+            return 0
+        os.setsid()
+        with open(os.devnull, "r+") as null:
+            for fd in (0, 1, 2): os.dup2(null.fileno(), fd)
+    agent.serve(args.socket)
+    return 0
+
+def run(args):
+    try:
+        if args.action == "import": return import_credentials(args)
+        if args.action in ("list", "accounts"):
+            store = load_keystore(args.keystore)
+            accounts = {}
+            for e in store["keys"]: accounts.setdefault(e["account"], {})[e["role"]] = e
+            if args.account:
+                if args.account not in accounts: raise AgentError("@%s isn't in %s, add it with: agent import" % (args.account, args.keystore))
+                accounts = {args.account: accounts[args.account]}
+            for name, roles in accounts.items():
+                if args.action == "accounts": print("\t".join([name] + [roles.get(r, {}).get("public", "") for r in ROLES]))
+                else: print("@%-16s " % name + "  ".join("%s%s" % (r, "*" if roles.get(r, {}).get("encrypted") else "") for r in ROLES if r in roles))
+            if args.action == "list": print("(* private key held, encrypted)" if accounts else "No keys in " + args.keystore)
+            return 0
+        if args.action == "start": return start(args)
+        client = AgentClient(args.socket)
+        if args.action == "unlock":
+            reply = client.request({"op": "unlock", "passphrase": ask_passphrase(), "ttl": args.ttl})
+            print("%d keys unlocked%s" % (reply["keys"], " for %ds" % args.ttl if args.ttl else ""))
+        elif args.action in ("lock", "stop"):
+            client.request({"op": args.action})
+            print("Agent " + ("locked" if args.action == "lock" else "stopped"))
+        else:
+            try:
+                reply = client.request({"op": "status"})
+            except AgentError:
+                if args.quiet: return 1
+                raise
+            if args.quiet: return 0 if reply["unlocked"] else 1
+            if not reply["unlocked"]: print("Agent on %s: locked" % args.socket)
+            else: print("Agent on %s: %d keys unlocked (%s)%s" % (args.socket, len(reply["keys"]), ", ".join(reply["keys"]),
+                                                                 ", locks in " + human(reply["expires_in"]) if reply["expires_in"] is not None else ""))
+        return 0
+    except AgentError as e:
+        sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,341 @@
+from http.server import BaseHTTPRequestHandler
+from collections import Counter
+import json, os, random, shutil, statistics, subprocess, sys, tempfile, threading, time
+from pulsar.util import cache_path, http_server
+
+RESIDENT = False
+
+#Runs the commands against a local stand-in node instead of a public one, so a change that makes
+#them slower or chattier shows up: wall time, JSON-RPC calls, bytes on the wire and peak RSS per
+#command, compared with a saved baseline. The node answers from fixtures after a configurable
+#latency with jitter, once per HTTP request like a real node (a batch pays it once).
+
+BASELINE = cache_path("bench.json")
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#The real chain id and version: beem only knows the EUR/PULSE assets for the PULSAR chain it has in known_chains
+CHAIN_ID = "07c687c01f134adaf217a9b9367d1cef679c3c020167fdd25ee8c403f687528e"
+VERSION = "0.101.0"
+PASSWORD = "P5bench-password-not-a-secret"
+WITNESS = "benchwitness"
+USER = "benchuser"
+#name -> (argv, stdin). {url} {witness} {user} {wif} {wif_user} {password} are filled in; commands with a .py script in
+#scripts/python run through it, like the shell does
+SUITE = {
+    "get_profile": (["get_profile", "{user}"], None),
+    "get_profile_all": (["get_profile", "{user}", "--all"], None),
+    "list_witnesses": (["list_witnesses"], None),
+    "update_witness": (["update_witness", "update", "{witness}", "{wif}", "--url", "https://bench.example"], None),
+    "update_profile": (["update_profile", "{user}", "{wif_user}", "--about", "bench"], None),
+    "pricefeed_update": (["pricefeed_update", "{witness}", "{wif}", "1.000"], None),
+    "change_password": (["change_password", "{user}"], "{password}\nnew-{password}\nnew-{password}\n"),
+    "witnesses": (["witnesses", "list", "--top", "21", "--max-age", "0"], None),
+    "nodes_call": (["nodes", "call", "condenser_api.get_accounts", "[[\"{user}\"]]"], None),
+    "exporter_once": (["exporter", "--once", "--local", "{url}", "--reference", "{url}", "--witness", "{witness}"], None),
+}
+#Allowed drift before a run fails. Calls must not grow at all
+TOLERANCE = {"wall": 0.25, "bytes": 0.10, "rss": 0.15}
+MIN_WALL_DRIFT = 0.05
+
+def add_arguments(parser):
+    parser.add_argument('action', help="run: benchmark the commands, serve: only run the mock node, list: show the commands", choices=['run', 'serve', 'list'], nargs='?', default='run')
+    parser.add_argument('commands', help="Commands of the suite to run. Default: all", type=str, nargs='*')
+    parser.add_argument('--latency', help="Mock node latency per request, in ms", type=float, default=20.0)
+    parser.add_argument('--jitter', help="Standard deviation of the latency, in ms", type=float, default=5.0)
+    parser.add_argument('--witnesses', help="Number of witnesses the mock node knows", type=int, default=50)
+    parser.add_argument('--repeat', help="Runs per command, the median is kept", type=int, default=3)
+    parser.add_argument('--baseline', help="Baseline file. Default: " + BASELINE, type=str, default=BASELINE)
+    parser.add_argument('--save', help="Store the results as the new baseline", action='store_true')
+    parser.add_argument('--port', help="Port for serve. Default: any free port", type=int, default=0)
+    parser.add_argument('--seed', help="Seed of the jitter", type=int, default=1)
+    parser.add_argument('--timeout', help="Seconds a command may run before it's killed and counted as failed", type=float, default=60)
+
+def derived_keys(name):
+    #Real keys when beem is there, so the commands' key checks pass; without it they can't run anyway
+    try:
+        from pulsar.client import derive_keys
+        return derive_keys(name, PASSWORD)
+    except ImportError:
+        return {role: ("EUR" + "1" * 50, "5" + "K" * 50) for role in ("owner", "active", "posting", "memo")}
+
+def auth(key):
+    return {"weight_threshold": 1, "account_auths": [], "key_auths": [[key, 1]]}
+
+class Fixtures:
+    def __init__(self, witnesses):
+        self.start = time.time()
+        self.keys = {WITNESS: derived_keys(WITNESS), USER: derived_keys(USER)}
+        self.accounts = {name: self.account(i, name) for i, name in enumerate([WITNESS, USER] + ["witness%03d" % i for i in range(witnesses)])}
+        self.witnesses = {name: self.witness(i, name) for i, name in enumerate([WITNESS] + ["witness%03d" % i for i in range(witnesses)])}
+
+    def account(self, i, name):
+        keys = self.keys.get(name) or {role: ("EUR" + "1" * 50, None) for role in ("owner", "active", "posting", "memo")}
+        return {"id": i, "name": name, "owner": auth(keys["owner"][0]), "active": auth(keys["active"][0]), "posting": auth(keys["posting"][0]), "memo_key": keys["memo"][0],
+             "json_metadata": json.dumps({"profile": {"name": name, "about": "Benchmark account", "website": "https://bench.example"}}), "proxy": "",
+             "created": "2018-06-01T00:00:00", "last_owner_update": "1970-01-01T00:00:00", "last_account_update": "2018-06-01T00:00:00", "last_vote_time": "1970-01-01T00:00:00",
+             "last_post": "1970-01-01T00:00:00", "last_root_post": "1970-01-01T00:00:00", "next_vesting_withdrawal": "1969-12-31T23:59:59",
+             "balance": "100.000 PULSE", "savings_balance": "0.000 PULSE", "sbd_balance": "10.000 EUR", "savings_sbd_balance": "0.000 EUR",
+             "reward_sbd_balance": "0.000 EUR", "reward_steem_balance": "0.000 PULSE", "reward_vesting_balance": "0.000000 VESTS", "reward_vesting_steem": "0.000 PULSE",
+             "vesting_shares": "1000000.000000 VESTS", "delegated_vesting_shares": "0.000000 VESTS", "received_vesting_shares": "0.000000 VESTS",
+             "vesting_withdraw_rate": "0.000000 VESTS", "withdrawn": 0, "to_withdraw": 0, "voting_power": 10000, "post_count": 0, "can_vote": True,
+             "witness_votes": [], "witnesses_voted_for": 0, "recovery_account": "pulsar", "reputation": 0}
+
+    def witness(self, i, name):
+        key = self.keys[name]["active"][0] if name in self.keys else "EUR" + "1" * 50
+        return {"id": i, "owner": name, "created": "2018-06-01T00:00:00", "url": "https://%s.example" % name, "votes": str(10 ** 12 - i * 10 ** 9),
+                "virtual_last_update": "0", "virtual_position": "0", "virtual_scheduled_time": "0", "total_missed": i, "last_aslot": 0,
+                "last_confirmed_block_num": 1000000 - i, "pow_worker": 0, "signing_key": key,
+                "props": {"account_creation_fee": "0.100 PULSE", "maximum_block_size": 65536, "sbd_interest_rate": 0},
+                "sbd_exchange_rate": {"base": "1.000 EUR", "quote": "1.000 PULSE"}, "last_sbd_exchange_update": "2018-06-01T00:00:00",
+                "last_work": "0000000000000000000000000000000000000000000000000000000000000000", "running_version": VERSION,
+                "hardfork_version_vote": VERSION, "hardfork_time_vote": "2018-06-01T00:00:00"}
+
+    def head(self):
+        return 1000000 + int((time.time() - self.start) / 3)
+
+    def props(self):
+        head = self.head()
+        return {"id": 0, "head_block_number": head, "head_block_id": "%08x" % head + "ab" * 16, "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+                "current_witness": WITNESS, "total_pow": 0, "num_pow_witnesses": 0, "virtual_supply": "1000000.000 PULSE", "current_supply": "1000000.000 PULSE",
+                "confidential_supply": "0.000 PULSE", "current_sbd_supply": "1000.000 EUR", "confidential_sbd_supply": "0.000 EUR",
+                "total_vesting_fund_steem": "500000.000 PULSE", "total_vesting_shares": "1000000000.000000 VESTS", "total_reward_fund_steem": "0.000 PULSE",
+                "total_reward_shares2": "0", "pending_rewarded_vesting_shares": "0.000000 VESTS", "pending_rewarded_vesting_steem": "0.000 PULSE",
+                "sbd_interest_rate": 0, "sbd_print_rate": 10000, "maximum_block_size": 65536, "current_aslot": head, "recent_slots_filled": "340282366920938463463374607431768211455",
+                "participation_count": 128, "last_irreversible_block_num": head - 15, "vote_power_reserve_rate": 10, "average_block_size": 200,
+                "current_reserve_ratio": 200000000, "max_virtual_bandwidth": "0"}
+
+    def config(self):
+        return {"STEEM_CHAIN_ID": CHAIN_ID, "STEEM_ADDRESS_PREFIX": "EUR", "STEEM_BLOCKCHAIN_VERSION": VERSION, "STEEM_BLOCK_INTERVAL": 3,
+                "STEEM_SYMBOL": "PULSE", "SBD_SYMBOL": "EUR", "VESTS_SYMBOL": "VESTS", "STEEM_100_PERCENT": 10000, "STEEM_1_PERCENT": 100,
+                "STEEM_VOTE_REGENERATION_SECONDS": 432000, "STEEM_MAX_TIME_UNTIL_EXPIRATION": 3600}
+
+    def ranked(self, start, limit):
+        names = sorted(self.witnesses, key=lambda n: -int(self.witnesses[n]["votes"]))
+        return [self.witnesses[n] for n in names[start:start + limit]]
+
+    def call(self, method, params):
+        #condenser_api style params (a list), database_api style ones (a dict)
+        api, _, name = method.rpartition(".")
+        p = params if isinstance(params, (list, dict)) else []
+        arg = lambda i, key, default=None: p.get(key, default) if isinstance(p, dict) else (p[i] if len(p) > i else default)
+        if name == "get_dynamic_global_properties": return self.props()
+        if name == "get_config": return self.config()
+        if name == "get_version": return {"blockchain_version": VERSION, "steem_revision": "0" * 40, "fc_revision": "0" * 40, "chain_id": CHAIN_ID}
+        if name == "get_hardfork_version": return VERSION
+        if name == "get_chain_properties": return {"account_creation_fee": "0.100 PULSE", "maximum_block_size": 65536, "sbd_interest_rate": 0}
+        if name in ("get_feed_history", "get_current_median_history_price"):
+            price = {"base": "1.000 EUR", "quote": "1.000 PULSE"}
+            return price if name == "get_current_median_history_price" else {"id": 0, "current_median_history": price, "price_history": [price]}
+        if name in ("get_reward_fund", "get_reward_funds"):
+            fund = {"id": 0, "name": "post", "reward_balance": "0.000 PULSE", "recent_claims": "1", "last_update": "2018-06-01T00:00:00",
+                    "content_constant": "2000000000000", "percent_curation_rewards": 2500, "percent_content_rewards": 10000,
+                    "author_reward_curve": "linear", "curation_reward_curve": "square_root"}
+            return fund if name == "get_reward_fund" else {"funds": [fund]}
+        if name == "get_hardfork_properties": return {"id": 0, "processed_hardforks": ["2018-06-01T00:00:00"] * 21, "last_hardfork": 20, "current_hardfork_version": VERSION,
+                                                       "next_hardfork": VERSION, "next_hardfork_time": "2018-06-01T00:00:00"}
+        if name == "get_witness_schedule": return {"id": 0, "current_virtual_time": "0", "next_shuffle_block_num": self.head() + 21, "current_shuffled_witnesses": sorted(self.witnesses)[:21],
+                                                    "num_scheduled_witnesses": 21, "median_props": self.call("get_chain_properties", []), "majority_version": VERSION}
+        if name in ("get_accounts", "find_accounts", "lookup_account_names"):
+            found = [self.accounts.get(n) for n in (arg(0, "accounts") or [])]
+            return {"accounts": [a for a in found if a]} if api == "database_api" else found
+        if name == "get_account_count": return len(self.accounts)
+        if name == "lookup_accounts": return sorted(n for n in self.accounts if n >= (arg(0, "lower_bound_name") or ""))[:arg(1, "limit", 1000)]
+        if name == "get_witness_by_account": return self.witnesses.get(arg(0, "account"))
+        if name == "find_witnesses": return {"witnesses": [self.witnesses[n] for n in arg(0, "owners") or [] if n in self.witnesses]}
+        if name == "get_witness_count": return len(self.witnesses)
+        if name == "lookup_witness_accounts": return sorted(n for n in self.witnesses if n >= (arg(0, "start") or ""))[:arg(1, "limit", 1000)]
+        if name == "get_active_witnesses": return sorted(self.witnesses)[:21]
+        if name == "get_witnesses_by_vote": return self.ranked(0, arg(1, "limit", 100))
+        if name == "list_witnesses": return {"witnesses": self.ranked(0, arg(0, "limit", 100))}
+        if name == "get_witnesses":
+            by_id = {w["id"]: w for w in self.witnesses.values()}
+            return [by_id.get(i) for i in arg(0, "ids") or []]
+        if name in ("broadcast_transaction", "broadcast_transaction_synchronous"):
+            return {} if name == "broadcast_transaction" else {"id": "0" * 40, "block_num": self.head() + 1, "trx_num": 0, "expired": False}
+        if name == "get_block":
+            n = arg(0, "block_num", 1)
+            return {"previous": "%08x" % (n - 1) + "ab" * 16, "block_id": "%08x" % n + "ab" * 16, "timestamp": self.props()["time"], "witness": sorted(self.witnesses)[n % 21],
+                    "transactions": [], "transaction_ids": []} if n <= self.head() else None
+        if name == "get_block_header": return {"previous": "%08x" % (arg(0, "block_num", 1) - 1) + "ab" * 16, "timestamp": self.props()["time"], "witness": WITNESS}
+        raise LookupError(method)
+
+class MockNode:
+    def __init__(self, fixtures, latency=0.02, jitter=0.005, port=0, seed=1):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.unknown = Counter()
+        self.requests = 0
+        self.bytes = 0
+        node = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    body = json.loads(data)
+                    reply = [node.answer(b) for b in body] if isinstance(body, list) else node.answer(body)
+                except ValueError:
+                    reply = {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}}
+                out = json.dumps(reply).encode()
+                with node.lock:
+                    node.requests += 1
+                    node.bytes += len(data) + len(out)
+                    delay = max(0.0, node.random.gauss(node.latency, node.jitter))
+                time.sleep(delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+        self.server = http_server(("127.0.0.1", port), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def answer(self, body):
+        method, params = body.get("method", ""), body.get("params", [])
+        #The old style: call(api, method, params)
+        if method == "call" and isinstance(params, list) and len(params) >= 2:
+            method, params = "%s.%s" % (params[0], params[1]), params[2] if len(params) > 2 else []
+        with self.lock: self.calls[method] += 1
+        try:
+            return {"jsonrpc": "2.0", "id": body.get("id"), "result": self.fixtures.call(method, params)}
+        except LookupError:
+            with self.lock: self.unknown[method] += 1
+            return {"jsonrpc": "2.0", "id": body.get("id"), "error": {"code": -32601, "message": "Method not found: " + method}}
+
+    def counters(self):
+        with self.lock: return self.requests, self.bytes, Counter(self.calls), Counter(self.unknown)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def command(argv):
+    script = os.path.join(SCRIPTS, argv[0] + ".py")
+    if os.path.exists(script): return [sys.executable, script] + argv[1:]
+    return [sys.executable, "-m", "pulsar", "--local"] + argv
+
+def measure(node, argv, stdin, env, timeout):
+    requests, nbytes, calls, unknown = node.counters()
+    start = time.perf_counter()
+    #A new session has no controlling terminal, so getpass reads the passwords from stdin
+    p = subprocess.Popen(command(argv), env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+    #beem retries a failing node for minutes, the whole session goes when it takes too long
+    timer = threading.Timer(timeout, os.killpg, (p.pid, 9))
+    timer.start()
+    try:
+        if stdin: p.stdin.write(stdin.encode())
+        p.stdin.close()
+        err = p.stderr.read()
+        _, status, usage = os.wait4(p.pid, 0)
+    finally:
+        timer.cancel()
+    wall = time.perf_counter() - start
+    #os.waitstatus_to_exitcode is 3.9+, beem 0.21 runs on older ones
+    p.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    p.stderr.close()
+    if p.returncode == -9 and wall >= timeout: err += b"\nkilled after %gs" % timeout
+    requests2, nbytes2, calls2, unknown2 = node.counters()
+    return {"wall": wall, "rss": usage.ru_maxrss * 1024, "requests": requests2 - requests, "bytes": nbytes2 - nbytes,
+            "calls": sum((calls2 - calls).values()), "methods": dict(calls2 - calls), "unknown": dict(unknown2 - unknown),
+            "code": p.returncode, "stderr": err.decode(errors="replace").strip()[-300:]}
+
+def bench(node, name, repeat, env, timeout):
+    argv, stdin = SUITE[name]
+    fill = {"url": node.url, "witness": WITNESS, "user": USER, "password": PASSWORD,
+            "wif": node.fixtures.keys[WITNESS]["active"][1], "wif_user": node.fixtures.keys[USER]["active"][1]}
+    argv = [a.format(**fill) for a in argv]
+    runs = [measure(node, argv, stdin.format(**fill) if stdin else None, env, timeout) for _ in range(repeat)]
+    last = runs[-1]
+    return {"wall": statistics.median(r["wall"] for r in runs), "rss": statistics.median(r["rss"] for r in runs), "calls": max(r["calls"] for r in runs),
+            "requests": max(r["requests"] for r in runs), "bytes": statistics.median(r["bytes"] for r in runs), "methods": last["methods"],
+            "unknown": last["unknown"], "code": max((r["code"] for r in runs), key=abs), "stderr": last["stderr"]}
+
+def drift(result, base):
+    out = []
+    if result["calls"] > base["calls"]: out.append("calls %d -> %d" % (base["calls"], result["calls"]))
+    for key in ("wall", "bytes", "rss"):
+        if base[key] and result[key] > base[key] * (1 + TOLERANCE[key]):
+            if key == "wall" and result[key] - base[key] < MIN_WALL_DRIFT: continue
+            out.append("%s +%.0f%%" % (key, (result[key] / base[key] - 1) * 100))
+    return out
+
+def load_baseline(path):
+    try:
+        with open(path) as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_baseline(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".%d" % os.getpid()
+    with open(tmp, "w") as f: json.dump(data, f, indent=4)
+    os.replace(tmp, path)
+
+def run(args):
+    if args.action == "list":
+        for name, (argv, _) in SUITE.items(): print("%-18s %s" % (name, " ".join(argv)))
+        return 0
+    unknown = [c for c in args.commands if c not in SUITE]
+    if unknown: sys.exit("Unknown commands: %s (see bench list)" % ", ".join(unknown))
+    node = MockNode(Fixtures(args.witnesses), args.latency / 1000, args.jitter / 1000, args.port, args.seed)
+    node.start()
+    if args.action == "serve":
+        print("Mock node on %s (witness @%s, account @%s, password %s)" % (node.url, WITNESS, USER, PASSWORD), flush=True)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        node.stop()
+        return 0
+
+    #A private cache and data directory: no node ranking, beem config or resident server from outside
+    home = tempfile.mkdtemp(prefix="pulsar-bench-")
+    env = dict(os.environ, PULSAR_NODES=node.url, XDG_CACHE_HOME=home, XDG_DATA_HOME=home, XDG_CONFIG_HOME=home, PULSAR_SOCKET=os.path.join(home, "none.sock"))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SCRIPTS, env.get("PYTHONPATH")]))
+    env.pop("PULSAR_RPC_STATS", None)
+    settings = {"latency": args.latency, "jitter": args.jitter, "witnesses": args.witnesses}
+    baseline = load_baseline(args.baseline)
+    if baseline and baseline.get("settings") != settings:
+        print("Warning: the baseline was taken with %s, wall times aren't comparable" % baseline.get("settings"))
+    results, failed = {}, 0
+    print("%-18s %9s %6s %5s %10s %9s  %s" % ("command", "wall", "calls", "reqs", "bytes", "peak RSS", "vs baseline"))
+    try:
+        for name in args.commands or SUITE:
+            r = results[name] = bench(node, name, args.repeat, env, args.timeout)
+            base = (baseline or {}).get("results", {}).get(name)
+            if r["code"] != 0:
+                status = "FAILED (exit %d): %s" % (r["code"], r["stderr"].splitlines()[-1] if r["stderr"] else "")
+                failed += 1
+            elif base is None:
+                status = "no baseline"
+            else:
+                d = drift(r, base)
+                status = "DRIFT: " + ", ".join(d) if d else "ok"
+                failed += bool(d)
+            print("%-18s %8.3fs %6d %5d %10d %8.1fM  %s" % (name, r["wall"], r["calls"], r["requests"], r["bytes"], r["rss"] / 1048576.0, status))
+            if r["unknown"]: print("%18s methods the mock node doesn't know: %s" % ("", ", ".join(sorted(r["unknown"]))))
+    finally:
+        node.stop()
+        shutil.rmtree(home, ignore_errors=True)
+    if args.save:
+        good = {n: r for n, r in results.items() if r["code"] == 0}
+        if not good: sys.exit("Nothing to save, every command failed")
+        data = baseline if baseline and baseline.get("settings") == settings else {"settings": settings, "results": {}}
+        data["results"].update(good)
+        data["saved"] = int(time.time())
+        save_baseline(args.baseline, data)
+        print("Baseline saved to %s (%d commands)" % (args.baseline, len(good)))
+        return 1 if len(good) < len(results) else 0
+    return 1 if failed else 0
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
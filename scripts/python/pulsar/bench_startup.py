@@ -0,0 +1,55 @@
+from argparse import REMAINDER
+import os, statistics, subprocess, sys, tempfile, time
+
+RESIDENT = False
+
+def add_arguments(parser):
+    parser.add_argument('--repeat', help="Number of timed runs per mode", type=int, default=5)
+    parser.add_argument('argv', help="Command to time, E.G.: \"get_profile pulsar\". Default: list_witnesses", nargs=REMAINDER)
+
+def timed(cmd, env):
+    start = time.perf_counter()
+    p = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return time.perf_counter() - start, p
+
+def series(cmd, env, repeat):
+    times = []
+    for _ in range(repeat):
+        elapsed, p = timed(cmd, env)
+        if p.returncode != 0: sys.stderr.write("Warning: %s exited with %d: %s\n" % (" ".join(cmd), p.returncode, p.stderr.decode().strip()[-200:]))
+        times.append(elapsed)
+    return times
+
+def report(name, times):
+    print("{:<28} min {:7.3f}s  median {:7.3f}s  max {:7.3f}s".format(name, min(times), statistics.median(times), max(times)))
+
+def run(args):
+    argv = args.argv or ["list_witnesses"]
+    if argv[0] == "--": argv = argv[1:]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env.get("PYTHONPATH")]))
+    base = [sys.executable, "-m", "pulsar"]
+
+    #--help only needs the interpreter and argparse: shows the cost of lazy imports
+    report("help (no imports)", series(base + ["--local"] + argv[:1] + ["--help"], env, args.repeat))
+    cold = series(base + ["--local"] + argv, env, args.repeat)
+    report("cold (new interpreter)", cold)
+
+    sock = os.path.join(tempfile.mkdtemp(prefix="pulsar-bench-"), "resident.sock")
+    server = subprocess.Popen(base + ["--socket", sock, "serve"], env=env, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 120
+        while not os.path.exists(sock):
+            if server.poll() is not None or time.monotonic() > deadline: sys.exit("The resident server didn't start")
+            time.sleep(0.05)
+        timed(base + ["--socket", sock] + argv, env)
+        warm = series(base + ["--socket", sock] + argv, env, args.repeat)
+        report("warm (resident server)", warm)
+    finally:
+        subprocess.run(base + ["--socket", sock, "serve", "--stop"], env=env, stderr=subprocess.DEVNULL)
+        server.wait(timeout=30)
+        os.rmdir(os.path.dirname(sock))
+
+    print("Speedup (median): {:.1f}x".format(statistics.median(cold) / statistics.median(warm)))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,253 @@
+from datetime import datetime, timezone
+import hashlib, json, mmap, os, struct, sys, time
+
+RESIDENT = True
+
+#block_log is a sequence of [signed_block][uint64 offset of that block], block_log.index holds
+#the uint64 offset of block n at (n - 1) * 8. Both are memory-mapped and blocks are decoded
+#from memoryview slices, nothing is copied until a field is turned into a Python value.
+
+DEFAULT_DIR = os.environ.get("PULSAR_BLOCKCHAIN_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "data", "witness", "blockchain"))
+
+def add_arguments(parser):
+    parser.add_argument('action', help="info: show a block (the head block by default), dump: print a range of blocks as NDJSON, bench: read a range and report blocks/s", choices=['info', 'dump', 'bench'])
+    parser.add_argument('start', help="First block number", type=int, nargs='?')
+    parser.add_argument('end', help="Last block number (inclusive). Default: start for info/dump, the head block for bench", type=int, nargs='?')
+    parser.add_argument('--dir', help="Directory with block_log and block_log.index. Default: " + os.path.normpath(DEFAULT_DIR), type=str, default=DEFAULT_DIR)
+    parser.add_argument('--raw', help="Include the serialized transactions as hex", action='store_true')
+
+class BlockLogError(Exception):
+    pass
+
+def read_varint(buf, pos):
+    value = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if not b & 0x80: return value, pos
+        shift += 7
+
+def write_varint(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7f
+        n >>= 7
+        out.append(b | (0x80 if n else 0))
+        if not n: return bytes(out)
+
+def num_from_id(block_id):
+    return struct.unpack_from(">I", block_id, 0)[0]
+
+class Block:
+    __slots__ = ("num", "offset", "data", "header_end", "previous", "timestamp", "witness", "merkle_root", "extensions", "signature", "tx_count", "tx_start")
+
+    def __init__(self, num, offset, data):
+        #data is a memoryview of the serialized signed_block
+        self.num = num
+        self.offset = offset
+        self.data = data
+        self.previous = data[0:20]
+        self.timestamp = struct.unpack_from("<I", data, 20)[0]
+        n, pos = read_varint(data, 24)
+        self.witness = data[pos:pos + n]
+        pos += n
+        self.merkle_root = data[pos:pos + 20]
+        pos += 20
+        count, pos = read_varint(data, pos)
+        self.extensions = []
+        for _ in range(count):
+            tag, pos = read_varint(data, pos)
+            if tag == 0:
+                self.extensions.append({"type": "void"})
+            elif tag == 1:
+                self.extensions.append({"type": "version", "version": version_string(struct.unpack_from("<I", data, pos)[0])})
+                pos += 4
+            elif tag == 2:
+                v, t = struct.unpack_from("<II", data, pos)
+                self.extensions.append({"type": "hardfork_version_vote", "hf_version": version_string(v), "hf_time": iso(t)})
+                pos += 8
+            else:
+                raise BlockLogError("Unknown block header extension %d in block %d" % (tag, num))
+        self.signature = data[pos:pos + 65]
+        self.header_end = pos + 65
+        self.tx_count, self.tx_start = read_varint(data, self.header_end)
+
+    @property
+    def id(self):
+        #sha224 of the signed header, first 4 bytes replaced by the block number, truncated to 160 bits
+        digest = hashlib.sha224(self.data[:self.header_end]).digest()
+        return struct.pack(">I", self.num) + digest[4:20]
+
+    @property
+    def transactions(self):
+        return self.data[self.tx_start:]
+
+    def json(self, raw=False):
+        out = {
+            "block_num": self.num,
+            "block_id": self.id.hex(),
+            "previous": bytes(self.previous).hex(),
+            "timestamp": iso(self.timestamp),
+            "witness": bytes(self.witness).decode(),
+            "transaction_merkle_root": bytes(self.merkle_root).hex(),
+            "extensions": self.extensions,
+            "witness_signature": bytes(self.signature).hex(),
+            "transaction_count": self.tx_count,
+            "size": len(self.data),
+            "offset": self.offset,
+        }
+        if raw: out["transactions_raw"] = bytes(self.transactions).hex()
+        return out
+
+def version_string(v):
+    return "%d.%d.%d" % (v >> 24, (v >> 16) & 0xff, v & 0xffff)
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: return None
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        m.madvise(mmap.MADV_RANDOM)
+    except (AttributeError, OSError):
+        pass
+    return m
+
+class BlockLog:
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "block_log")
+        self.index_path = os.path.join(directory, "block_log.index")
+        if not os.path.exists(self.path): raise BlockLogError("No block_log in " + directory)
+        self.log = _map(self.path)
+        self.index = _map(self.index_path) if os.path.exists(self.index_path) else None
+        self.view = memoryview(self.log) if self.log else memoryview(b"")
+        self.index_view = memoryview(self.index) if self.index else None
+
+    def close(self):
+        #Blocks still referenced keep slices of the maps alive, those are unmapped by the GC
+        try:
+            self.view.release()
+            if self.index_view is not None: self.index_view.release()
+            if self.log: self.log.close()
+            if self.index: self.index.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def head(self):
+        #The last 8 bytes of the log point at the last block. Its number is in the next block's
+        #previous id, so for the head use the index when it matches the log
+        if not self.log: return 0
+        if self.index_view is not None and len(self.index_view) >= 8:
+            n = len(self.index_view) // 8
+            if struct.unpack_from("<Q", self.index_view, (n - 1) * 8)[0] == self.last_offset: return n
+        return num_from_id(self._decode(0, self.last_offset).previous) + 1
+
+    @property
+    def last_offset(self):
+        return struct.unpack_from("<Q", self.view, len(self.view) - 8)[0]
+
+    def offset(self, num):
+        if self.index_view is not None and num * 8 <= len(self.index_view):
+            return struct.unpack_from("<Q", self.index_view, (num - 1) * 8)[0]
+        #No usable index: every block is followed by its own offset, walk back from the end
+        head = self.head
+        if num < 1 or num > head: raise BlockLogError("Block %d is out of range 1-%d" % (num, head))
+        offset = self.last_offset
+        for _ in range(head - num):
+            offset = struct.unpack_from("<Q", self.view, offset - 8)[0]
+        return offset
+
+    def _decode(self, num, offset, end=None):
+        if end is None: end = len(self.view) - 8
+        return Block(num, offset, self.view[offset:end])
+
+    def block(self, num):
+        head = self.head
+        if num < 1 or num > head: raise BlockLogError("Block %d is out of range 1-%d" % (num, head))
+        start = self.offset(num)
+        end = self.offset(num + 1) - 8 if num < head else len(self.view) - 8
+        return self._decode(num, start, end)
+
+    def blocks(self, start=1, end=None):
+        #Streaming iterator: sequential access, so switch the mappings to read-ahead
+        head = self.head
+        end = head if end is None else min(end, head)
+        for m in (self.log, self.index):
+            try:
+                if m: m.madvise(mmap.MADV_SEQUENTIAL)
+            except (AttributeError, OSError):
+                pass
+        if start > end: return
+        if self.index_view is None or end * 8 > len(self.index_view):
+            raise BlockLogError("block_log.index is missing or shorter than the log, it's rebuilt by a replay")
+        offsets = self.index_view[(start - 1) * 8:end * 8].cast("Q")
+        try:
+            for i, off in enumerate(offsets):
+                num = start + i
+                nxt = offsets[i + 1] if i + 1 < len(offsets) else (self.offset(num + 1) if num < head else len(self.view))
+                yield Block(num, off, self.view[off:nxt - 8])
+        finally:
+            offsets.release()
+
+class BlockLogWriter:
+    #Appends synthetic blocks, used to build small block_log fixtures
+    def __init__(self, directory):
+        self.log = open(os.path.join(directory, "block_log"), "ab")
+        self.index = open(os.path.join(directory, "block_log.index"), "ab")
+        self.previous = bytes(20)
+        self.num = self.index.tell() // 8
+
+    def append(self, timestamp, witness, transactions=b"", tx_count=0, extensions=b"\x00", signature=bytes(65)):
+        header = self.previous + struct.pack("<I", timestamp) + write_varint(len(witness)) + witness.encode() + bytes(20) + extensions + signature
+        offset = self.log.tell()
+        self.log.write(header + write_varint(tx_count) + transactions + struct.pack("<Q", offset))
+        self.index.write(struct.pack("<Q", offset))
+        self.num += 1
+        self.previous = struct.pack(">I", self.num) + hashlib.sha224(header).digest()[4:20]
+        return self.num
+
+    def close(self):
+        self.log.close()
+        self.index.close()
+
+def run(args):
+    try:
+        log = BlockLog(args.dir)
+    except (BlockLogError, OSError) as e:
+        sys.exit(str(e))
+    with log:
+        try:
+            head = log.head
+            if args.action == "info":
+                num = args.start if args.start is not None else head
+                print(json.dumps(log.block(num).json(raw=args.raw), indent=4))
+            elif args.action == "dump":
+                if args.start is None: sys.exit("dump needs a start block")
+                for b in log.blocks(args.start, args.end if args.end is not None else args.start):
+                    print(json.dumps(b.json(raw=args.raw)))
+            else:
+                start = args.start or 1
+                end = args.end or head
+                began = time.perf_counter()
+                count = size = txs = 0
+                for b in log.blocks(start, end):
+                    b.id
+                    count += 1
+                    size += len(b.data)
+                    txs += b.tx_count
+                elapsed = time.perf_counter() - began
+                print("%d blocks (%d transactions, %.1f MiB) in %.2fs: %.0f blocks/s, %.1f MiB/s" % (count, txs, size / 1048576.0, elapsed, count / elapsed if elapsed else 0, size / 1048576.0 / elapsed if elapsed else 0))
+        except BlockLogError as e:
+            sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
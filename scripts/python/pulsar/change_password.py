@@ -0,0 +1,90 @@
+from pulsar.client import ROLES, get_steem, get_account, chain_auths, derive_keys, cred_data, forget
+from getpass import unix_getpass
+import os.path, json, sys
+
+RESIDENT = False
+
+def add_arguments(parser):
+    parser.add_argument('account', help="Name of the Pulsar Account", type=str, nargs=1)
+    parser.add_argument('--store-credentials', help="If used, a file with all new credentials will be saved at the provided location. E.G.: \"/home/user/pulsar-cli/.credentials.json\"", type=str)
+
+def run(args):
+    from beem.transactionbuilder import TransactionBuilder
+    from beembase import operations
+
+    stm = get_steem()
+    prefix = stm.prefix
+
+    acc = get_account(args.account[0])
+    if acc is None:
+        sys.exit("The account provided is not a valid account in the Pulsar Blockchain. Wrong account " + args.account[0])
+
+    if args.store_credentials:
+        fullpath = args.store_credentials
+        if not os.path.exists(fullpath):
+            reldir = os.path.dirname(fullpath)
+            if not os.path.exists(reldir): sys.exit("There's no such directory " + reldir)
+
+    cur_password = unix_getpass(prompt='Current password for @%s: ' %
+                                (acc['name']))
+
+    cur_keys = derive_keys(acc['name'], cur_password, prefix=prefix)
+    blk_auths_public = chain_auths(acc)
+    if any(cur_keys[role][0] != blk_auths_public[role] for role in ROLES): sys.exit("Password provided is not correct.")
+
+    new_password = unix_getpass(prompt='New password for @%s: ' %
+                                (acc['name']))
+    repeat_pwd = unix_getpass(prompt='Repeat new password for @%s: ' %
+                              (acc['name']))
+
+    assert(new_password == repeat_pwd)
+
+    wif = cur_keys["owner"][1]
+
+    #Since we're going to build a transaction is simpler to do everything here instead of using a function
+    new_keys = derive_keys(acc['name'], new_password)
+    key_auths_public = {role: new_keys[role][0] for role in ROLES}
+
+    op = operations.Account_update(
+        **{
+            "account": acc["name"],
+            'owner': {
+                 'account_auths': [],
+                 'key_auths': [[key_auths_public['owner'], 1]],
+                 "address_auths": [],
+                 'weight_threshold': 1},
+            'active': {
+                 'account_auths': [],
+                 'key_auths': [[key_auths_public['active'], 1]],
+                 "address_auths": [],
+                 'weight_threshold': 1},
+            'posting': {
+                 'account_auths': acc['posting']['account_auths'],
+                 'key_auths': [[key_auths_public['posting'], 1]],
+                 "address_auths": [],
+                 'weight_threshold': 1},
+            'memo_key': key_auths_public['memo'],
+            "json_metadata": acc['json_metadata'],
+            "prefix": prefix,
+        })
+
+    ops = [op]
+    tb = TransactionBuilder(steem_instance=stm)
+    tb.appendOps(ops)
+    tb.appendWif(wif)
+    tb.sign()
+    output = tb.broadcast()
+    forget(acc['name'])
+
+    data = cred_data(acc['name'], new_password, new_keys)
+
+    print(json.dumps(output, indent=4))
+
+    if args.store_credentials:
+        #creds = getcred(acc['name'], new_password)
+        with open(fullpath, 'w') as f: json.dump(data, f)
+        print(json.dumps(data, indent=4))
+    else:
+        print(json.dumps(data, indent=4))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,84 @@
+from argparse import ArgumentParser
+from importlib import import_module
+import json, os, socket, sys
+
+#Command name -> (module, help). Only the module of the command being run is imported,
+#so --help and argument errors never pay for beem or open a connection.
+#Modules expose add_arguments(parser), run(args) and RESIDENT: whether the command may
+#run inside the resident server (no prompts, no long running output).
+COMMANDS = {
+    "get_user_keys": ("pulsar.get_user_keys", "print all keys of an account derived from its master password"),
+    "get_profile": ("pulsar.get_profile", "show the profile (or all information) of an account"),
+    "history": ("pulsar.history", "export the operation history of an account to NDJSON or Parquet, incrementally"),
+    "stream": ("pulsar.stream", "follow the chain: parallel catch-up, then live blocks with reconnects, gap filling and irreversibility events"),
+    "update_profile": ("pulsar.update_profile", "update the profile of an account"),
+    "update_witness": ("pulsar.update_witness", "update or disable a witness"),
+    "list_witnesses": ("pulsar.list_witnesses", "list the witnesses of the Pulsar blockchain"),
+    "witnesses": ("pulsar.witnesses", "query, sort and filter the witnesses from an incrementally refreshed cache, diff snapshots"),
+    "pricefeed_update": ("pulsar.pricefeed_update", "publish a feed base price as a witness"),
+    "feed_daemon": ("pulsar.feed_daemon", "keep the price feeds of several witnesses fresh from multiple price sources"),
+    "verify_keys": ("pulsar.verify_keys", "derive and verify the keys of many accounts from a CSV or NDJSON list"),
+    "change_password": ("pulsar.change_password", "change the password of an account"),
+    "agent": ("pulsar.agent", "encrypted keystore and a signing agent holding unlocked keys for a TTL, signs batches over a unix socket"),
+    "plan": ("pulsar.plan", "prepare, sign offline and broadcast a plan of operations for several accounts"),
+    "tune": ("pulsar.tune", "size config.ini and the kernel writeback settings for this host"),
+    "fleet": ("pulsar.fleet", "run several node instances (seed, witness, RPC) from profiles, start/stop/status them all at once"),
+    "nodes": ("pulsar.nodes", "probe the configured RPC nodes, show the ranking or make a hedged call"),
+    "blocklog": ("pulsar.blocklog", "read blocks straight from the local block_log, no node or network needed"),
+    "verify_blocklog": ("pulsar.verify_blocklog", "check block_log against its index and the block id chain, truncate it to the last good block"),
+    "snapshot": ("pulsar.snapshot", "snapshot and restore shared_memory with the block_log height it matches, to skip replays"),
+    "replay_monitor": ("pulsar.replay_monitor", "follow pulsard logs: replay progress, blocks/s, ETA, and compare saved replays"),
+    "logstore": ("pulsar.logstore", "index pulsard logs into a local event store: production, misses, forks, peers, replays; query and summarize"),
+    "seeds": ("pulsar.seeds", "probe p2p seed nodes and peers from the logs, rank them with their probe history and rewrite the p2p-seed-node lines"),
+    "exporter": ("pulsar.exporter", "serve node, witness and RPC latency metrics in Prometheus format"),
+    "rpcproxy": ("pulsar.rpcproxy", "caching JSON-RPC proxy in front of the RPC node: head aware cache, coalescing, batch unpacking"),
+    "witness_watchdog": ("pulsar.witness_watchdog", "switch the witness signing key to a backup node as soon as blocks are missed"),
+    "dlblocks": ("pulsar.dlblocks", "download and verify a block_log with parallel range requests"),
+    "serve": ("pulsar.server", "run a resident server so other invocations reuse a warm interpreter and connection"),
+    "bench_startup": ("pulsar.bench_startup", "compare cold and warm (resident) invocation time"),
+    "bench": ("pulsar.bench", "benchmark the commands against a local mock node and compare with a baseline"),
+}
+
+SOCKET = os.environ.get("PULSAR_SOCKET", os.path.join(os.path.expanduser("~"), ".pulsar-cli.sock"))
+
+def build_parser(command=None):
+    parser = ArgumentParser(prog="pulsar")
+    parser.add_argument('--socket', help="Unix socket of the resident server, used when it exists. Default: " + SOCKET, type=str, default=SOCKET)
+    parser.add_argument('--local', help="Never use the resident server", action='store_true')
+    sub = parser.add_subparsers(dest="command", metavar="COMMAND")
+    sub.required = True
+    for name, (module, help) in COMMANDS.items():
+        p = sub.add_parser(name, help=help)
+        if name == command: import_module(module).add_arguments(p)
+    return parser
+
+def forward(path, argv):
+    #Returns None when there is no resident server to talk to
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except OSError:
+        s.close()
+        return None
+    with s:
+        s.sendall(json.dumps({"argv": argv, "cwd": os.getcwd(), "stats": bool(os.environ.get("PULSAR_RPC_STATS"))}).encode() + b"\n")
+        data = b"".join(iter(lambda: s.recv(65536), b""))
+    reply = json.loads(data.decode())
+    sys.stdout.write(reply["stdout"])
+    sys.stdout.flush()
+    sys.stderr.write(reply["stderr"])
+    return reply["code"]
+
+def main(argv=None, resident=True):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    command = next((a for a in argv if a in COMMANDS), None)
+    args = build_parser(command).parse_args(argv)
+    module = import_module(COMMANDS[args.command][0])
+
+    if resident and not args.local and getattr(module, "RESIDENT", False) and os.path.exists(args.socket):
+        code = forward(args.socket, argv[argv.index(args.command):])
+        if code is not None: return code
+
+    return module.run(args)
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
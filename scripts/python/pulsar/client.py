@@ -0,0 +1,194 @@
+from collections import Counter
+import atexit, json, os, sys
+
+#beem and friends take most of the startup time, they are only imported once a command
+#actually needs the chain (see get_steem)
+
+#Every JSON-RPC call made by this process, by method. Printed on exit with PULSAR_RPC_STATS=1
+rpc_calls = Counter()
+
+ROLES = ['owner', 'active', 'posting', 'memo']
+
+_steem = None
+_accounts = {}
+_witnesses = {}
+
+def _method_name(payload):
+    method = payload.get("method", "")
+    params = payload.get("params") or []
+    if method == "call" and len(params) >= 2: return "%s.%s" % (params[0], params[1])
+    return method
+
+def _install_counter():
+    from beemapi.graphenerpc import GrapheneRPC
+    rpcexec = GrapheneRPC.rpcexec
+    def counted(self, payload):
+        for p in (payload if isinstance(payload, list) else [payload]):
+            rpc_calls[_method_name(p)] += 1
+        return rpcexec(self, payload)
+    GrapheneRPC.rpcexec = counted
+
+def stats_line():
+    detail = ", ".join("%s: %d" % (m, n) for m, n in sorted(rpc_calls.items()))
+    return "RPC calls: %d (%s)" % (sum(rpc_calls.values()), detail)
+
+def _print_stats():
+    if os.environ.get("PULSAR_RPC_STATS") and rpc_calls:
+        sys.stderr.write(stats_line() + "\n")
+
+atexit.register(_print_stats)
+
+def get_steem(keys=None):
+    #One instance per process: beem keeps a pooled keep-alive session per instance.
+    #Nodes come from PULSAR_NODES ranked by pulsar.nodes, beem fails over in that order
+    global _steem
+    if _steem is None:
+        from beem import Steem
+        from beem.instance import set_shared_steem_instance
+        from pulsar.nodes import beem_options
+        _install_counter()
+        _steem = Steem(keys=keys or [], **beem_options())
+        set_shared_steem_instance(_steem)
+    else:
+        if keys: _steem.wallet.setKeys(keys)
+        _follow_ranking()
+    return _steem
+
+def _follow_ranking():
+    #Long running processes re-rank the nodes in the background (NodeManager.start): beem is moved to
+    #the new best node, with fresh error counts, as a dead node stays out of beem's list for good
+    from pulsar.nodes import get_manager
+    manager = get_manager()
+    rpc = _steem.rpc
+    if manager.thread is None or rpc is None: return
+    urls = [ep.url for ep in manager.ranked(refresh=False)]
+    if rpc.url == urls[0]: return
+    from beemapi.node import Nodes
+    rpc.nodes = Nodes(urls, rpc.num_retries, rpc.num_retries_call)
+    rpc.rpcconnect()
+
+def get_account(username):
+    if username not in _accounts:
+        from beem.account import Account
+        from beem.exceptions import AccountDoesNotExistsException
+        try:
+            _accounts[username] = Account(username, steem_instance=get_steem())
+        except AccountDoesNotExistsException:
+            _accounts[username] = None
+    return _accounts[username]
+
+def get_accounts(usernames):
+    #Fills the cache for all missing names with a single get_accounts call
+    missing = [u for u in dict.fromkeys(usernames) if u not in _accounts]
+    if missing:
+        from beem.account import Account
+        stm = get_steem()
+        found = {a["name"]: a for a in stm.rpc.get_accounts(missing) or [] if a}
+        for u in missing:
+            _accounts[u] = Account(found[u], steem_instance=stm) if u in found else None
+    return [_accounts[u] for u in usernames]
+
+def get_witness(username):
+    if username not in _witnesses:
+        from beem.witness import Witness
+        from beem.exceptions import WitnessDoesNotExistsException
+        try:
+            _witnesses[username] = Witness(username, steem_instance=get_steem())
+        except WitnessDoesNotExistsException:
+            _witnesses[username] = None
+    return _witnesses[username]
+
+def forget(username=None):
+    #Drop cached objects after a broadcast changed them, or everything for a new request
+    if username is None:
+        _accounts.clear()
+        _witnesses.clear()
+    else:
+        _accounts.pop(username, None)
+        _witnesses.pop(username, None)
+
+def reset():
+    #Called by the resident server between requests: keep the connection, drop the rest
+    forget()
+    rpc_calls.clear()
+    if _steem is not None: _steem.wallet.clear_local_keys()
+
+def chain_auths(account):
+    data = account.json()
+    auths = {role: str(data[role]["key_auths"][0][0]) for role in ['owner', 'active', 'posting']}
+    auths["memo"] = str(data["memo_key"])
+    return auths
+
+def checkacc(username):
+    return get_account(username) is not None
+
+def checkwit(username):
+    return get_witness(username) is not None
+
+def checkkey(username, password, role):
+    from beemgraphenebase.account import PrivateKey
+    listOfValidRoles = ['owner' , 'active', 'posting', 'memo']
+    if role not in listOfValidRoles:
+        print(role + " NOT found in List : " , listOfValidRoles)
+        sys.exit("Wrong role " + role)
+
+    account = get_account(username)
+    if account is None: sys.exit("Wrong username " + username)
+
+    try:
+        publickey = str(PrivateKey(password, prefix="EUR").pubkey)
+    except:
+        sys.exit("Wrong password syntax " + password)
+
+    return publickey == chain_auths(account)[role]
+
+def derive_keys(username, password, prefix="EUR"):
+    #role -> (public, private). Plain function so it can run in a process pool
+    from beemgraphenebase.account import PasswordKey
+    keys = {}
+    for role in ROLES:
+        pk = PasswordKey(username, password, role=role, prefix=prefix)
+        keys[role] = (str(pk.get_public_key()), str(pk.get_private_key()))
+    return keys
+
+def cred_data(username, password, keys):
+    #Same layout as .credentials.json
+    data = {"name": username, "wif": password}
+    for role in ROLES:
+        data[role] = [{"type": "public", "value": keys[role][0]}, {"type": "private", "value": keys[role][1]}]
+    return data
+
+def checkwif(username, wif):
+    from beemgraphenebase.account import PasswordKey
+    account = get_account(username)
+    if account is None: return False
+
+    blk_auths_public = chain_auths(account)
+    for role in ROLES:
+        pk = PasswordKey(username, wif, role=role, prefix="EUR")
+        if str(pk.get_public_key()) != blk_auths_public[role]:
+            return False
+    return True
+
+def agent_broadcast(call, account, role="active"):
+    #call() builds the operation through beem as usual, unsigned; the signing agent (pulsar.agent)
+    #signs it, so this process never reads, derives or checks a private key
+    from pulsar.agent import AgentClient
+    stm = get_steem()
+    stm.unsigned = True
+    try:
+        tx = call()
+    finally:
+        stm.unsigned = False
+    try:
+        tx.constructTx()
+        signed = AgentClient().sign(dict(stm.chain_params), [tx.json()], [[[account, role]]])[0]
+    finally:
+        tx.clear()
+    stm.rpc.broadcast_transaction(signed, api="condenser_api")
+    return signed
+
+def getcred(username, wif):
+    print(json.dumps(cred_data(username, wif, derive_keys(username, wif)), indent=4))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
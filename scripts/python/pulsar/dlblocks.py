@@ -0,0 +1,269 @@
+import hashlib, json, os, re, sys, threading, time
+import urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+RESIDENT = False
+
+READ_SIZE = 256 * 1024
+
+class DownloadError(Exception):
+    pass
+
+def probe(url, timeout):
+    #Ask for a single byte, a 206 tells us the size and that ranges are supported
+    req = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        validator = r.headers.get("ETag") or r.headers.get("Last-Modified") or ""
+        if r.status == 206:
+            m = re.match(r"bytes 0-0/(\d+)", r.headers.get("Content-Range", ""))
+            if not m: raise DownloadError("Invalid Content-Range from " + url)
+            return int(m.group(1)), True, validator
+        return int(r.headers.get("Content-Length", -1)), False, validator
+
+class Journal:
+    #Records finished chunks so an interrupted download only fetches what is missing
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.done = set()
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path) as f: data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("meta") != self.meta: return False
+        self.done = set(data.get("done", []))
+        return True
+
+    def mark(self, index):
+        with self.lock:
+            self.done.add(index)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f: json.dump({"meta": self.meta, "done": sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path): os.remove(self.path)
+
+class OrderedHasher:
+    #Chunks arrive out of order, the digest needs them in order: buffer what is ahead of
+    #the hash position and make workers that run too far ahead wait for it to catch up.
+    #Regions already on disk (resumed chunks) are read back from the file when reached.
+    def __init__(self, algo, fd, max_ahead):
+        self.hash = hashlib.new(algo)
+        self.fd = fd
+        self.max_ahead = max_ahead
+        self.pos = 0
+        self.pending = {}
+        self.on_disk = {}
+        self.error = None
+        self.cond = threading.Condition()
+
+    def add_on_disk(self, offset, length):
+        with self.cond:
+            self.on_disk[offset] = length
+            self._drain()
+
+    def feed(self, offset, data):
+        with self.cond:
+            while offset - self.pos > self.max_ahead and self.error is None:
+                self.cond.wait()
+            if self.error is not None: raise DownloadError("Aborted: " + str(self.error))
+            if offset == self.pos:
+                self.hash.update(data)
+                self.pos += len(data)
+                self._drain()
+            else:
+                self.pending[offset] = data
+
+    def _drain(self):
+        while True:
+            if self.pos in self.pending:
+                data = self.pending.pop(self.pos)
+                self.hash.update(data)
+                self.pos += len(data)
+            elif self.pos in self.on_disk:
+                end = self.pos + self.on_disk.pop(self.pos)
+                while self.pos < end:
+                    data = os.pread(self.fd, min(READ_SIZE * 16, end - self.pos), self.pos)
+                    if not data: raise DownloadError("Short read while hashing resumed data")
+                    self.hash.update(data)
+                    self.pos += len(data)
+            else:
+                break
+        self.cond.notify_all()
+
+    def abort(self, error):
+        with self.cond:
+            self.error = error
+            self.cond.notify_all()
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+class Progress:
+    def __init__(self, total, done, quiet):
+        self.total = total
+        self.done = done
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.samples = [(time.monotonic(), done)]
+
+    def add(self, n):
+        with self.lock: self.done += n
+
+    def line(self):
+        now = time.monotonic()
+        self.samples.append((now, self.done))
+        #Throughput over the last ~5 seconds so the figure follows the link, not the history
+        while len(self.samples) > 2 and now - self.samples[0][0] > 5: self.samples.pop(0)
+        t0, d0 = self.samples[0]
+        rate = (self.done - d0) / (now - t0) if now > t0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0
+        pct = 100.0 * self.done / self.total if self.total else 100.0
+        return "\r{:6.2f}% {:>10} / {:<10} {:>10}/s ETA {}".format(pct, human(self.done), human(self.total), human(rate), time.strftime("%H:%M:%S", time.gmtime(eta)))
+
+    def run(self):
+        while not self.stop.wait(1):
+            if not self.quiet: sys.stderr.write(self.line()); sys.stderr.flush()
+
+    def finish(self):
+        self.stop.set()
+        if not self.quiet: sys.stderr.write(self.line() + "\n"); sys.stderr.flush()
+
+def human(n):
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if abs(n) < 1024 or unit == "TiB": return "{:.1f} {}".format(n, unit)
+        n /= 1024.0
+
+def preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+def fetch_chunk(url, fd, index, start, end, hasher, progress, journal, timeout, retries):
+    pos = start
+    attempt = 0
+    while pos <= end:
+        try:
+            req = urllib.request.Request(url, headers={"Range": "bytes=%d-%d" % (pos, end)})
+            with urllib.request.urlopen(req, timeout=timeout) as r:
+                if r.status != 206: raise DownloadError("Server ignored range request for " + url)
+                while pos <= end:
+                    data = r.read(min(READ_SIZE, end - pos + 1))
+                    if not data: raise DownloadError("Connection closed at offset %d" % pos)
+                    os.pwrite(fd, data, pos)
+                    hasher.feed(pos, data)
+                    progress.add(len(data))
+                    pos += len(data)
+        except (OSError, urllib.error.URLError, DownloadError) as e:
+            if hasher.error is not None: raise
+            attempt += 1
+            if attempt > retries: raise DownloadError("Chunk %d failed after %d retries: %s" % (index, retries, e))
+            time.sleep(min(2 ** attempt, 30))
+    journal.mark(index)
+
+def fetch_single(url, fd, hasher, progress, timeout):
+    #Fallback for servers without range support, one stream from the start
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        pos = 0
+        while True:
+            data = r.read(READ_SIZE)
+            if not data: break
+            os.pwrite(fd, data, pos)
+            hasher.feed(pos, data)
+            progress.add(len(data))
+            pos += len(data)
+    return pos
+
+def download(url, dest, workers=8, chunk_size=16 * 1024 * 1024, algo="md5", timeout=30, retries=5, quiet=False):
+    size, ranged, validator = probe(url, timeout)
+    journal = Journal(dest + ".journal", {"url": url, "size": size, "chunk_size": chunk_size, "validator": validator})
+    resumed = ranged and os.path.exists(dest) and journal.load()
+    if not resumed: journal.remove()
+
+    fd = os.open(dest, os.O_RDWR | os.O_CREAT | (0 if resumed else os.O_TRUNC), 0o644)
+    try:
+        hasher = OrderedHasher(algo, fd, max(workers, 1) * chunk_size * 2)
+        if not ranged or size < 0:
+            progress = Progress(size, 0, quiet)
+            threading.Thread(target=progress.run, daemon=True).start()
+            try:
+                fetch_single(url, fd, hasher, progress, timeout)
+            finally:
+                progress.finish()
+            os.fsync(fd)
+            return hasher.hexdigest()
+
+        preallocate(fd, size)
+        chunks = [(i, off, min(off + chunk_size, size) - 1) for i, off in enumerate(range(0, size, chunk_size))]
+        done_bytes = 0
+        for i, start, end in chunks:
+            if i in journal.done:
+                hasher.add_on_disk(start, end - start + 1)
+                done_bytes += end - start + 1
+        missing = [c for c in chunks if c[0] not in journal.done]
+        if resumed and not quiet:
+            sys.stderr.write("Resuming: %d of %d chunks already downloaded\n" % (len(chunks) - len(missing), len(chunks)))
+
+        progress = Progress(size, done_bytes, quiet)
+        threading.Thread(target=progress.run, daemon=True).start()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(fetch_chunk, url, fd, i, start, end, hasher, progress, journal, timeout, retries) for i, start, end in missing]
+                for f in futures:
+                    try:
+                        f.result()
+                    except BaseException as e:
+                        hasher.abort(e)
+                        for other in futures: other.cancel()
+                        raise
+        finally:
+            progress.finish()
+        os.fsync(fd)
+        if hasher.pos != size: raise DownloadError("Hashed %d bytes out of %d" % (hasher.pos, size))
+        journal.remove()
+        return hasher.hexdigest()
+    finally:
+        os.close(fd)
+
+def expected_digest(url, name, timeout):
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        for line in r.read().decode().splitlines():
+            parts = line.split()
+            if len(parts) == 2 and os.path.basename(parts[1].lstrip("*")) == name: return parts[0].lower()
+    raise DownloadError("No checksum for " + name + " in " + url)
+
+def add_arguments(parser):
+    parser.add_argument('url', help="URL of the block_log to download", type=str, nargs=1)
+    parser.add_argument('dest', help="Destination file. E.G.: \"/home/user/pulsar-cli/data/witness/blockchain/block_log\"", type=str, nargs=1)
+    parser.add_argument('--md5-url', help="URL of an MD5SUM file to verify the download against", type=str)
+    parser.add_argument('--workers', help="Number of concurrent range requests", type=int, default=8)
+    parser.add_argument('--chunk-size', help="Size of each range request in MiB", type=int, default=16)
+    parser.add_argument('--timeout', help="Socket timeout in seconds", type=int, default=30)
+    parser.add_argument('--retries', help="Retries per chunk before giving up", type=int, default=5)
+    parser.add_argument('--quiet', help="Don't show the progress line", action='store_true')
+
+def run(args):
+    dest = args.dest[0]
+    if not os.path.isdir(os.path.dirname(os.path.abspath(dest))): sys.exit("There's no such directory " + os.path.dirname(dest))
+
+    try:
+        expected = expected_digest(args.md5_url, os.path.basename(dest), args.timeout) if args.md5_url else None
+        digest = download(args.url[0], dest, workers=args.workers, chunk_size=args.chunk_size * 1024 * 1024,
+                          timeout=args.timeout, retries=args.retries, quiet=args.quiet)
+    except (OSError, urllib.error.URLError, DownloadError) as e:
+        sys.exit("Download failed, run the same command again to resume: " + str(e))
+
+    if expected is None:
+        print("%s  %s" % (digest, os.path.basename(dest)))
+    elif digest == expected:
+        print("%s: OK" % os.path.basename(dest))
+    else:
+        sys.exit("%s: FAILED, md5 %s doesn't match %s" % (os.path.basename(dest), digest, expected))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
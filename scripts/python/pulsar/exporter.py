@@ -0,0 +1,220 @@
+from http.server import BaseHTTPRequestHandler
+import os, re, sys, threading, time
+from pulsar.util import NULL_KEY, chain_time, http_server
+
+RESIDENT = False
+
+#Prometheus exporter. One thread polls the local node and a reference node with a single batched
+#JSON-RPC request each, over connections kept open between polls, and renders the metrics page.
+#Scrapes only return the last rendered page, so they never cause RPC traffic.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BLOCK_INTERVAL = 3
+
+def add_arguments(parser):
+    parser.add_argument('--listen', help="Address and port to serve /metrics on", type=str, default="127.0.0.1:9192")
+    parser.add_argument('--local', help="The node to watch", type=str, default="http://127.0.0.1:8090")
+    parser.add_argument('--reference', help="Node to compare the head block with. Default: the best of PULSAR_NODES", type=str)
+    parser.add_argument('--witness', help="Witness to track, can be repeated. Default: the witness in --config", type=str, action='append', default=[])
+    parser.add_argument('--config', help="config.ini to read witness names from", type=str)
+    parser.add_argument('--min-interval', help="Shortest time between polls, in seconds", type=float, default=1.0)
+    parser.add_argument('--max-interval', help="Longest time between polls, in seconds", type=float, default=30.0)
+    parser.add_argument('--once', help="Poll once, print the metrics and exit", action='store_true')
+
+def config_witnesses(path):
+    if not path or not os.path.exists(path): return []
+    with open(path) as f: return re.findall(r'^\s*witness\s*=\s*"?([a-z0-9.-]+)"?', f.read(), re.M)
+
+def labels(**kw):
+    if not kw: return ""
+    return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in sorted(kw.items())) + "}"
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, le in enumerate(BUCKETS):
+            if value <= le: self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, **kw):
+        out = ["%s_bucket%s %d" % (name, labels(le=le, **kw), n) for le, n in zip(BUCKETS, self.counts)]
+        out.append("%s_bucket%s %d" % (name, labels(le="+Inf", **kw), self.count))
+        out.append("%s_sum%s %f" % (name, labels(**kw), self.sum))
+        out.append("%s_count%s %d" % (name, labels(**kw), self.count))
+        return out
+
+class Exporter:
+    def __init__(self, local, reference, witnesses, min_interval=1.0, max_interval=30.0, follow=False):
+        from pulsar.nodes import Endpoint
+        self.nodes = {"local": Endpoint(local, timeout=5)}
+        if reference: self.nodes["reference"] = Endpoint(reference, timeout=5)
+        #Reference taken from PULSAR_NODES: it moves with the background ranking
+        self.follow = follow
+        self.witnesses = list(dict.fromkeys(witnesses))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.latency = {}
+        self.errors = {}
+        self.props = {}
+        self.witness_data = {}
+        self.missed_seen = {}
+        self.polls = 0
+        self.interval = min_interval
+        self.failures = 0
+        self.page = ""
+        self.lock = threading.Lock()
+
+    def batch(self, name, calls):
+        #One request for all calls; every method gets the round trip of the request that carried it
+        from pulsar.nodes import payload
+        ep = self.nodes[name]
+        body = [payload(method, params) for method, params in calls]
+        start = time.perf_counter()
+        try:
+            reply = ep.request(body)
+        except Exception:
+            for method, _ in calls: self.errors[(name, method)] = self.errors.get((name, method), 0) + 1
+            raise
+        elapsed = time.perf_counter() - start
+        by_id = {r.get("id"): r for r in reply} if isinstance(reply, list) else {}
+        results = []
+        for (method, _), p in zip(calls, body):
+            self.latency.setdefault((name, method), Histogram()).observe(elapsed)
+            r = by_id.get(p["id"], {})
+            if "result" not in r: self.errors[(name, method)] = self.errors.get((name, method), 0) + 1
+            results.append(r.get("result"))
+        return results
+
+    def follow_best(self):
+        from pulsar.nodes import Endpoint, get_manager
+        best = get_manager().best(ws=False, refresh=False)
+        if best is not None and ("reference" not in self.nodes or self.nodes["reference"].url != best.url): self.nodes["reference"] = Endpoint(best.url, timeout=5)
+
+    def poll(self):
+        now = time.time()
+        if self.follow: self.follow_best()
+        witnesses_from = None
+        for name in self.nodes:
+            calls = [("condenser_api.get_dynamic_global_properties", [])]
+            #Witnesses come from the local node, or from the reference one while the local is down
+            if witnesses_from is None: calls += [("condenser_api.get_witness_by_account", [w]) for w in self.witnesses]
+            try:
+                results = self.batch(name, calls)
+            except Exception:
+                self.props[name] = None
+                continue
+            self.props[name] = (results[0], now)
+            if witnesses_from is None and len(results) > 1:
+                witnesses_from = name
+                for w, data in zip(self.witnesses, results[1:]):
+                    if data is None: continue
+                    old = self.witness_data.get(w)
+                    if old is not None and int(data["total_missed"]) > int(old["total_missed"]):
+                        self.missed_seen[w] = self.missed_seen.get(w, 0) + int(data["total_missed"]) - int(old["total_missed"])
+                    self.witness_data[w] = data
+        self.polls += 1
+        self.adapt(now)
+        page = self.render(now)
+        with self.lock: self.page = page
+
+    def adapt(self, now):
+        #Poll just after the next block is due; back off while the local node doesn't answer
+        local = self.props.get("local")
+        if local is None or local[0] is None:
+            self.failures += 1
+            self.interval = min(self.max_interval, self.min_interval * 2 ** self.failures)
+            return
+        self.failures = 0
+        age = now - chain_time(local[0]["time"])
+        due = BLOCK_INTERVAL - age % BLOCK_INTERVAL + 0.25
+        #A node far behind (syncing or stuck) doesn't need polling every block
+        if age > 10 * BLOCK_INTERVAL: due = max(due, min(self.max_interval, age / 10))
+        self.interval = max(self.min_interval, min(self.max_interval, due))
+
+    def render(self, now):
+        out = []
+        def metric(name, kind, help, samples):
+            out.append("# HELP %s %s" % (name, help))
+            out.append("# TYPE %s %s" % (name, kind))
+            out.extend("%s%s %s" % (name, labels(**kw), v) for kw, v in samples)
+        heads = {n: int(p[0]["head_block_number"]) for n, p in self.props.items() if p and p[0]}
+        metric("pulsar_up", "gauge", "1 if the node answered the last poll", [({"node": n}, int(n in heads)) for n in self.nodes])
+        metric("pulsar_head_block_number", "gauge", "Head block number", [({"node": n}, h) for n, h in heads.items()])
+        metric("pulsar_head_block_age_seconds", "gauge", "Age of the head block", [({"node": n}, "%.1f" % (now - chain_time(p[0]["time"]))) for n, p in self.props.items() if p and p[0]])
+        metric("pulsar_last_irreversible_block_number", "gauge", "Last irreversible block number", [({"node": n}, p[0]["last_irreversible_block_num"]) for n, p in self.props.items() if p and p[0] and "last_irreversible_block_num" in p[0]])
+        if "local" in heads and "reference" in heads:
+            metric("pulsar_head_block_lag", "gauge", "Blocks the local node is behind the reference node", [({}, heads["reference"] - heads["local"])])
+        top = max(heads.values(), default=None)
+        ws = list(self.witness_data.items())
+        metric("pulsar_witness_total_missed", "gauge", "total_missed of the witness", [({"witness": w}, d["total_missed"]) for w, d in ws])
+        metric("pulsar_witness_missed_blocks_total", "counter", "Blocks missed since the exporter started", [({"witness": w}, self.missed_seen.get(w, 0)) for w, _ in ws])
+        metric("pulsar_witness_last_confirmed_block_num", "gauge", "Last block produced by the witness", [({"witness": w}, d["last_confirmed_block_num"]) for w, d in ws])
+        if top is not None:
+            metric("pulsar_witness_blocks_since_confirmed", "gauge", "Head block minus the last block produced by the witness", [({"witness": w}, top - int(d["last_confirmed_block_num"])) for w, d in ws])
+        metric("pulsar_witness_enabled", "gauge", "1 if the witness has a signing key", [({"witness": w}, int(not d["signing_key"].endswith(NULL_KEY))) for w, d in ws])
+        out.append("# HELP pulsar_rpc_latency_seconds Round trip of the JSON-RPC requests, per method")
+        out.append("# TYPE pulsar_rpc_latency_seconds histogram")
+        for (node, method), h in sorted(self.latency.items()): out.extend(h.render("pulsar_rpc_latency_seconds", node=node, method=method))
+        metric("pulsar_rpc_errors_total", "counter", "Failed JSON-RPC calls, per method", [({"node": n, "method": m}, c) for (n, m), c in sorted(self.errors.items())])
+        metric("pulsar_exporter_polls_total", "counter", "Polls done", [({}, self.polls)])
+        metric("pulsar_exporter_poll_interval_seconds", "gauge", "Current time between polls", [({}, "%.2f" % self.interval)])
+        return "\n".join(out) + "\n"
+
+    def loop(self, stop):
+        while not stop.is_set():
+            started = time.monotonic()
+            self.poll()
+            stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+def serve(exporter, listen):
+    host, _, port = listen.rpartition(":")
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            with exporter.lock: body = exporter.page.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return http_server((host or "127.0.0.1", int(port)), Handler)
+
+def run(args):
+    reference = args.reference
+    if reference is None:
+        from pulsar.nodes import get_manager
+        best = get_manager().best(ws=False)
+        reference = best.url if best is not None else None
+    witnesses = args.witness or config_witnesses(args.config)
+    exporter = Exporter(args.local, reference, witnesses, args.min_interval, args.max_interval, follow=args.reference is None)
+    if args.once:
+        exporter.poll()
+        sys.stdout.write(exporter.page)
+        return 0
+    try:
+        server = serve(exporter, args.listen)
+    except (OSError, ValueError) as e:
+        sys.exit("Can't listen on %s: %s" % (args.listen, e))
+    if exporter.follow: get_manager().start()
+    stop = threading.Event()
+    threading.Thread(target=exporter.loop, args=(stop,), daemon=True).start()
+    print("Serving metrics on http://%s/metrics (local %s, reference %s, witnesses: %s)" % (args.listen, args.local, reference or "-", ", ".join(witnesses) or "-"), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
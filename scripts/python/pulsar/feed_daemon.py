@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+import asyncio, json, statistics, sys, time
+import urllib.request
+
+RESIDENT = False
+
+def add_arguments(parser):
+    parser.add_argument('config', help="JSON configuration with witnesses, price sources and thresholds. E.G.: \"/home/user/pulsar-cli/data/feed.json\"", type=str, nargs=1)
+    parser.add_argument('--once', help="Run a single polling cycle and exit", action='store_true')
+    parser.add_argument('--dry-run', help="Decide and log, but never broadcast", action='store_true')
+
+def log(msg):
+    print(time.strftime("%Y-%m-%d %H:%M:%S ") + msg, flush=True)
+
+#Price sources: anything with a name and an async fetch() returning the price of 1 PULSE in EUR
+
+#Blocking sources run on their own threads: a stuck one can't take the default executor, which
+#the chain publishes through
+SOURCE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="feed-source")
+
+class StaticSource:
+    def __init__(self, name="static", price=1.0):
+        self.name = name
+        self.price = float(price)
+
+    async def fetch(self):
+        return self.price
+
+class HttpJsonSource:
+    #path is a dotted path into the JSON document, E.G.: "data.rates.EUR" or "0.price"
+    def __init__(self, url, path, name=None, invert=False, scale=1.0, timeout=10):
+        self.url = url
+        self.path = path
+        self.name = name or url
+        self.invert = invert
+        self.scale = float(scale)
+        self.timeout = float(timeout)
+
+    def _get(self):
+        #wait_for in the daemon only stops waiting, the timeout here is what frees the thread
+        req = urllib.request.Request(self.url, headers={"User-Agent": "pulsar-cli"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as r: data = json.loads(r.read().decode())
+        for key in self.path.split(".") if self.path else []:
+            data = data[int(key)] if isinstance(data, list) else data[key]
+        price = float(data)
+        return (1.0 / price if self.invert else price) * self.scale
+
+    async def fetch(self):
+        return await asyncio.get_event_loop().run_in_executor(SOURCE_POOL, self._get)
+
+SOURCES = {"static": StaticSource, "http_json": HttpJsonSource}
+
+def make_source(conf, timeout=10):
+    conf = dict(conf)
+    kind = conf.pop("type")
+    if kind == "http_json": conf.setdefault("timeout", timeout)
+    if kind in SOURCES: return SOURCES[kind](**conf)
+    #Anything else is "module:Class", so custom sources can be plugged in without touching this file
+    module, _, name = kind.partition(":")
+    return getattr(import_module(module), name)(**conf)
+
+def aggregate(prices, method="median", trim=0.2):
+    if not prices: raise ValueError("No prices to aggregate")
+    if method == "median": return statistics.median(prices)
+    if method == "trimmed_mean":
+        values = sorted(prices)
+        cut = int(len(values) * trim)
+        if cut and len(values) - 2 * cut > 0: values = values[cut:len(values) - cut]
+        return statistics.mean(values)
+    raise ValueError("Unknown aggregation " + method)
+
+def publish_reason(price, last_price, last_time, now, deviation, max_age):
+    if last_price is None: return "no previous feed"
+    if last_price > 0 and abs(price - last_price) / last_price >= deviation:
+        return "price moved {:.2%}".format((price - last_price) / last_price)
+    if last_time is None or now - last_time >= max_age: return "feed is about to go stale"
+    return None
+
+class BeemChain:
+    #Chain endpoint: last published feed of a witness and feed_publish, over the one
+    #connection kept by pulsar.client. beem isn't thread safe, calls are serialized.
+    def __init__(self, keys, agent=()):
+        from pulsar.client import get_steem
+        self.steem = get_steem(keys=keys)
+        #Witnesses whose feed is signed by the signing agent (pulsar.agent)
+        self.agent = set(agent)
+        #Made in the running loop by the first call (an asyncio.Lock binds the loop it's created in on 3.6)
+        self.lock = None
+
+    def _last_feed(self, witness):
+        from pulsar.client import get_witness, forget
+        from beem.amount import Amount
+        from beem.utils import formatTimeString
+        forget(witness)
+        wit = get_witness(witness)
+        if wit is None: raise ValueError("Not a witness: " + witness)
+        rate = wit.json()["sbd_exchange_rate"]
+        base, quote = Amount(rate["base"], steem_instance=self.steem), Amount(rate["quote"], steem_instance=self.steem)
+        if float(quote) == 0 or float(base) == 0: return None, None
+        return float(base) / float(quote), formatTimeString(wit.json()["last_sbd_exchange_update"]).timestamp()
+
+    def _publish(self, witness, price):
+        from pulsar.client import get_witness, forget, agent_broadcast
+        publish = lambda: get_witness(witness).feed_publish("{:.3f} EUR".format(price), account=witness)
+        output = agent_broadcast(publish, witness) if witness in self.agent else publish()
+        forget(witness)
+        return output
+
+    async def _call(self, fn, *args):
+        if self.lock is None: self.lock = asyncio.Lock()
+        async with self.lock:
+            return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+    async def last_feed(self, witness):
+        return await self._call(self._last_feed, witness)
+
+    async def publish(self, witness, price):
+        return await self._call(self._publish, witness, price)
+
+class FeedDaemon:
+    def __init__(self, config, sources, chain, dry_run=False):
+        self.sources = sources
+        self.chain = chain
+        self.dry_run = dry_run
+        self.witnesses = [w["name"] for w in config["witnesses"]]
+        self.method = config.get("aggregate", "median")
+        self.trim = float(config.get("trim", 0.2))
+        self.interval = float(config.get("interval", 300))
+        self.timeout = float(config.get("source_timeout", 10))
+        self.min_sources = int(config.get("min_sources", 1))
+        self.deviation = float(config.get("deviation", 0.03))
+        self.max_age = float(config.get("max_age", 12 * 3600))
+        #witness -> (price, unix time) of the feed on chain, fetched once then tracked locally
+        self.feeds = {}
+
+    async def poll(self):
+        async def one(source):
+            return await asyncio.wait_for(source.fetch(), self.timeout)
+        results = await asyncio.gather(*(one(s) for s in self.sources), return_exceptions=True)
+        prices = []
+        for source, result in zip(self.sources, results):
+            if isinstance(result, BaseException):
+                log("Source %s failed: %s" % (source.name, type(result).__name__ if isinstance(result, asyncio.TimeoutError) else result))
+            elif result > 0:
+                prices.append(result)
+        return prices
+
+    async def cycle(self):
+        prices = await self.poll()
+        if len(prices) < self.min_sources:
+            log("Only %d of %d sources answered, need %d. Not publishing" % (len(prices), len(self.sources), self.min_sources))
+            return {}
+        price = aggregate(prices, self.method, self.trim)
+        now = time.time()
+        published = {}
+        for witness in self.witnesses:
+            if witness not in self.feeds: self.feeds[witness] = await self.chain.last_feed(witness)
+            last_price, last_time = self.feeds[witness]
+            reason = publish_reason(price, last_price, last_time, now, self.deviation, self.max_age)
+            if reason is None: continue
+            log("Publishing {:.3f} EUR for @{} ({}, {} sources)".format(price, witness, reason, len(prices)))
+            if not self.dry_run:
+                try:
+                    await self.chain.publish(witness, price)
+                except Exception as e:
+                    log("Publishing for @%s failed: %s" % (witness, e))
+                    self.feeds.pop(witness, None)
+                    continue
+            self.feeds[witness] = (price, now)
+            published[witness] = price
+        return published
+
+    async def run(self, once=False):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.cycle()
+            except Exception as e:
+                log("Cycle failed: %s" % e)
+            if once: return
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+def load_witnesses(config):
+    #Each witness either carries its active key, points to a .credentials.json written by getkeys or
+    #has "agent": true to be signed by the signing agent
+    keys = []
+    for w in config["witnesses"]:
+        if w.get("agent"):
+            if "name" not in w: sys.exit("A witness signed by the agent needs a name")
+            continue
+        if "credentials" in w:
+            with open(w["credentials"]) as f: creds = json.load(f)
+            w.setdefault("name", creds["name"])
+            w.setdefault("key", next(k["value"] for k in creds["active"] if k["type"] == "private"))
+        if "name" not in w or "key" not in w: sys.exit("Every witness needs a name and an active key (or credentials)")
+        keys.append(w["key"])
+    return keys
+
+def run(args):
+    with open(args.config[0]) as f: config = json.load(f)
+    if not config.get("witnesses"): sys.exit("No witnesses configured in " + args.config[0])
+    if not config.get("sources"): sys.exit("No price sources configured in " + args.config[0])
+    keys = load_witnesses(config)
+    sources = [make_source(s, config.get("source_timeout", 10)) for s in config["sources"]]
+
+    agent = [w["name"] for w in config["witnesses"] if w.get("agent")]
+    daemon = FeedDaemon(config, sources, BeemChain(keys, agent), dry_run=args.dry_run)
+    from pulsar.nodes import get_manager
+    get_manager().start()
+    log("Feed daemon for %s with %d sources, every %ds" % (", ".join("@" + w for w in daemon.witnesses), len(sources), daemon.interval))
+    try:
+        asyncio.get_event_loop().run_until_complete(daemon.run(once=args.once))
+    except KeyboardInterrupt:
+        pass
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,253 @@
+from concurrent.futures import ThreadPoolExecutor
+import http.client, json, os, re, shlex, shutil, socket, sys, urllib.parse
+
+RESIDENT = False
+
+#Several pulsard containers on one host, E.G. a seed, a witness and an RPC node. Each instance has
+#a profile in data/instances.json: its own data directory (laid out like data/, created from a
+#config template on first start), host ports mapped to the node's fixed ones, the binary and
+#CPU/NUMA/memory limits. Actions run on all the selected instances at once through the docker
+#API; status is one container listing for the whole fleet.
+#
+#    {"rpc": {"ports": ["8190:8090", "8189:8089"], "config": "witness/config.rpc.ini.example",
+#             "binary": "full", "cpuset": "8-15", "numa": 1, "memory": "64g"}}
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "data"))
+PROFILES = os.path.join(ROOT, "instances.json")
+IMAGE = "pulsar_img"
+BINARIES = {"default": "/usr/local/pulsard-default/bin/pulsard", "full": "/usr/local/pulsard-full/bin/pulsard"}
+LABEL = "pulsar-cli.instance"
+#Same as LOGOPT in pulsar-cli.sh
+LOG_CONFIG = {"Type": "json-file", "Config": {"max-size": "100m", "max-file": "50"}}
+NAME = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+SIZE = re.compile(r"^(\d+(?:\.\d+)?)([kmgt]?)b?$")
+
+def add_arguments(parser):
+    parser.add_argument('action', help="status: state of every instance, start/stop/restart/replay: on all (or the named) instances at once, env: shell variables of one instance",
+                        choices=['status', 'start', 'stop', 'restart', 'replay', 'env'])
+    parser.add_argument('names', help="Instances, default: all of them", type=str, nargs='*')
+    parser.add_argument('--profiles', help="Instance profiles. Default: " + PROFILES, type=str, default=PROFILES)
+    parser.add_argument('--socket', help="Docker API socket. Default: DOCKER_HOST or /var/run/docker.sock", type=str)
+    parser.add_argument('--timeout', help="stop, restart: seconds pulsard gets to exit before it is killed", type=int, default=60)
+    parser.add_argument('--format', help="status output", choices=['table', 'json'], default='table')
+
+class FleetError(Exception):
+    pass
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+class Docker:
+    def __init__(self, path=None):
+        host = os.environ.get("DOCKER_HOST", "")
+        self.path = path or (host[len("unix://"):] if host.startswith("unix://") else "/var/run/docker.sock")
+
+    def request(self, method, path, body=None, timeout=60):
+        #A connection per request: the instances are handled from several threads
+        conn = UnixConnection(self.path, timeout)
+        try:
+            conn.request(method, path, json.dumps(body) if body is not None else None, {"Content-Type": "application/json"} if body is not None else {})
+            response = conn.getresponse()
+            data = response.read()
+        except OSError as e:
+            raise FleetError("Docker API (%s): %s" % (self.path, e.strerror or e))
+        finally:
+            conn.close()
+        result = json.loads(data) if data and response.getheader("Content-Type", "").startswith("application/json") else None
+        if response.status >= 400:
+            raise FleetError((result or {}).get("message") or "%s %s: HTTP %d" % (method, path, response.status))
+        return response.status, result
+
+    def containers(self):
+        #Every instance's container in one call, by instance name
+        filters = urllib.parse.quote(json.dumps({"label": [LABEL]}))
+        _, listing = self.request("GET", "/containers/json?all=1&filters=" + filters)
+        return {c["Labels"][LABEL]: c for c in listing}
+
+def size(value):
+    if isinstance(value, int): return value
+    m = SIZE.match(str(value).strip().lower())
+    if not m: raise FleetError("Can't read the size %r, use E.G. 512m or 16g" % value)
+    return int(float(m.group(1)) * 1024 ** " kmgt".index(m.group(2) or " "))
+
+def node_cpus(node):
+    try:
+        with open("/sys/devices/system/node/node%d/cpulist" % node) as f: return f.read().strip()
+    except OSError:
+        raise FleetError("There's no NUMA node %d on this host" % node)
+
+def load_profiles(path):
+    try:
+        with open(path) as f: raw = json.load(f)
+    except OSError as e:
+        raise FleetError("%s: %s, copy %s.example and describe your instances" % (path, e.strerror, path))
+    except ValueError as e:
+        raise FleetError("%s: %s" % (path, e))
+    base = os.path.dirname(os.path.abspath(path))
+    profiles, used = {}, {}
+    for name, p in raw.items():
+        if not NAME.match(name): raise FleetError("%s: instance names are lowercase letters, digits, - and _" % name)
+        ports = []
+        for spec in p.get("ports", []):
+            #"port", "host:container" or "ip:host:container" like docker run -p
+            parts = str(spec).split(":")
+            ip = parts.pop(0) if len(parts) == 3 else "0.0.0.0"
+            try:
+                host, container = int(parts[0]), int(parts[-1])
+            except ValueError:
+                raise FleetError("%s: can't read the port %r" % (name, spec))
+            if host in used: raise FleetError("Port %d is used by %s and %s" % (host, used[host], name))
+            used[host] = name
+            ports.append((ip, host, container))
+        if p.get("binary", "default") not in BINARIES: raise FleetError("%s: binary is one of %s" % (name, ", ".join(BINARIES)))
+        numa = p.get("numa")
+        profiles[name] = {
+            "name": name,
+            "container": "pulsar-" + name,
+            "datadir": os.path.join(base, p.get("datadir", os.path.join("instances", name))),
+            "config": os.path.join(base, p.get("config", os.path.join("witness", "config.ini.example"))),
+            "ports": ports,
+            "binary": p.get("binary", "default"),
+            "cpuset": p.get("cpuset") or (node_cpus(numa) if numa is not None else None),
+            "mems": str(numa) if numa is not None else None,
+            "memory": size(p["memory"]) if p.get("memory") else None,
+            "args": p.get("args", []),
+        }
+    return profiles
+
+def select(profiles, names):
+    unknown = [n for n in names if n not in profiles]
+    if unknown: raise FleetError("No instance %s in the profiles, there are: %s" % (", ".join(unknown), ", ".join(profiles) or "none"))
+    return [profiles[n] for n in names] if names else list(profiles.values())
+
+def prepare(p):
+    #Laid out like data/, so the other commands work on it with INSTANCE=name
+    os.makedirs(os.path.join(p["datadir"], "witness", "blockchain"), exist_ok=True)
+    config = os.path.join(p["datadir"], "witness", "config.ini")
+    if not os.path.exists(config):
+        try:
+            shutil.copyfile(p["config"], config)
+        except OSError as e:
+            raise FleetError("%s: %s" % (p["config"], e.strerror))
+
+def create(docker, p, replay=False):
+    prepare(p)
+    host = {
+        "Binds": ["%s:/pulsar" % p["datadir"]],
+        "PortBindings": {"%d/tcp" % c: [{"HostIp": ip, "HostPort": str(h)}] for ip, h, c in p["ports"]},
+        "RestartPolicy": {"Name": "always"},
+        "LogConfig": LOG_CONFIG,
+    }
+    if p["cpuset"]: host["CpusetCpus"] = p["cpuset"]
+    if p["mems"]: host["CpusetMems"] = p["mems"]
+    if p["memory"]: host.update(Memory=p["memory"], MemorySwap=p["memory"])
+    body = {
+        "Image": IMAGE,
+        "Cmd": [BINARIES[p["binary"]], "-d", "/pulsar/witness"] + p["args"] + (["--replay-blockchain"] if replay else []),
+        "User": str(os.getuid()),
+        "Tty": True,
+        "Labels": {LABEL: p["name"]},
+        "ExposedPorts": {"%d/tcp" % c: {} for _, _, c in p["ports"]},
+        "HostConfig": host,
+    }
+    try:
+        _, created = docker.request("POST", "/containers/create?name=" + p["container"], body)
+    except FleetError as e:
+        if "No such image" in str(e): raise FleetError("%s isn't installed, run: pulsar-cli.sh install" % IMAGE)
+        raise
+    return created["Id"]
+
+def stop(docker, container, timeout):
+    if container["State"] == "running": docker.request("POST", "/containers/%s/stop?t=%d" % (container["Id"], timeout), timeout=timeout + 30)
+    #Removed like the single container, the next start applies the profile again
+    docker.request("DELETE", "/containers/" + container["Id"])
+
+def act(docker, action, p, container, timeout):
+    running = container is not None and container["State"] == "running"
+    if action == "start":
+        if running: return "already running"
+        docker.request("POST", "/containers/%s/start" % (container["Id"] if container else create(docker, p)))
+        return "started"
+    if action == "stop":
+        if container is None: return "not created"
+        stop(docker, container, timeout)
+        return "stopped"
+    if action == "replay" and running: raise FleetError("running, stop it first")
+    #restart, replay: a fresh container, stop returns once pulsard has exited
+    if container is not None: stop(docker, container, timeout)
+    docker.request("POST", "/containers/%s/start" % create(docker, p, replay=action == "replay"))
+    return "replaying" if action == "replay" else "restarted"
+
+def head(p):
+    #Head block over the instance's published http port, when it has one
+    from pulsar.nodes import Endpoint
+    port = next((h for _, h, c in p["ports"] if c == 8090), None)
+    if port is None: return None
+    try:
+        return Endpoint("http://127.0.0.1:%d" % port, timeout=3).call("condenser_api.get_dynamic_global_properties")["head_block_number"]
+    except Exception:
+        return None
+
+def status(docker, selected, fmt):
+    containers = docker.containers()
+    running = [p for p in selected if containers.get(p["name"], {}).get("State") == "running"]
+    with ThreadPoolExecutor(max_workers=max(1, len(running))) as pool:
+        heads = dict(zip([p["name"] for p in running], pool.map(head, running)))
+    rows = []
+    for p in selected:
+        c = containers.get(p["name"])
+        rows.append({"name": p["name"], "container": p["container"], "state": c["State"] if c else "not created", "status": c["Status"] if c else "",
+                     "head": heads.get(p["name"]), "cpuset": p["cpuset"], "numa": p["mems"], "memory": p["memory"], "binary": p["binary"],
+                     "ports": ",".join("%s:%d:%d" % port for port in p["ports"]), "datadir": p["datadir"]})
+    if fmt == "json":
+        print(json.dumps(rows, indent=4))
+        return 0 if len(running) == len(selected) else 1
+    print("%-12s %-12s %-24s %10s %-10s %-5s %7s %-7s %s" % ("INSTANCE", "STATE", "STATUS", "HEAD", "CPUS", "NUMA", "MEMORY", "BINARY", "PORTS"))
+    for r in rows:
+        print("%-12s %-12s %-24s %10s %-10s %-5s %7s %-7s %s" % (r["name"], r["state"], r["status"], r["head"] or "-", r["cpuset"] or "all", r["numa"] or "-",
+                                                                 "%.0fG" % (r["memory"] / 1073741824.0) if r["memory"] else "-", r["binary"], r["ports"] or "-"))
+    print("%d of %d instances running" % (len(running), len(selected)))
+    return 0 if len(running) == len(selected) else 1
+
+def env(p):
+    #For pulsar-cli.sh: the other commands then work on this instance
+    print("DOCKER_NAME=%s" % shlex.quote(p["container"]))
+    print("DATADIR=%s" % shlex.quote(p["datadir"]))
+    print("PORTS=%s" % shlex.quote(",".join("%s:%d:%d" % port for port in p["ports"])))
+    opts = []
+    if p["cpuset"]: opts += ["--cpuset-cpus", p["cpuset"]]
+    if p["mems"]: opts += ["--cpuset-mems", p["mems"]]
+    if p["memory"]: opts += ["--memory", str(p["memory"]), "--memory-swap", str(p["memory"])]
+    if opts: print("DOCKEROPT+=(%s)" % " ".join(shlex.quote(o) for o in opts))
+
+def run(args):
+    try:
+        selected = select(load_profiles(args.profiles), args.names)
+        if args.action == "env":
+            if len(args.names) != 1: raise FleetError("env needs one instance")
+            env(selected[0])
+            return 0
+        docker = Docker(args.socket)
+        if args.action == "status": return status(docker, selected, args.format)
+        containers = docker.containers()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, len(selected))) as pool:
+            jobs = [(p, pool.submit(act, docker, args.action, p, containers.get(p["name"]), args.timeout)) for p in selected]
+            for p, job in jobs:
+                try:
+                    print("%s: %s" % (p["name"], job.result()), flush=True)
+                except FleetError as e:
+                    print("%s: %s" % (p["name"], e), file=sys.stderr, flush=True)
+                    failed += 1
+        return 1 if failed else 0
+    except FleetError as e:
+        sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
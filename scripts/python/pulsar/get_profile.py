@@ -0,0 +1,23 @@
+import json, sys
+from pulsar.client import get_account
+
+RESIDENT = True
+
+def add_arguments(parser):
+    parser.add_argument('account', help="Name of the Pulsar account", type=str, nargs=1)
+    parser.add_argument('--all', help="If used, all information regarding the account will be displayed", action='store_true')
+
+def run(args):
+    acc = get_account(args.account[0])
+
+    if acc is not None:
+
+        if args.all:
+            print(json.dumps(acc.json(), indent=4))
+        else:
+            print(json.dumps(acc.profile, indent=4))
+
+    else:
+        sys.exit("The account provided is not a valid account in the Pulsar Blockchain. Wrong account " + args.account[0])
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,27 @@
+from pulsar.client import ROLES, get_steem, get_account, chain_auths, derive_keys, cred_data
+import json, sys
+
+RESIDENT = True
+
+def add_arguments(parser):
+    parser.add_argument('account', type=str, nargs=1)
+    parser.add_argument('password', type=str, nargs=1)
+
+def run(args):
+    prefix = get_steem().prefix
+
+    account = get_account(args.account[0])
+    if account is None:
+        sys.exit("The account provided doesn't exist in the Pulsar Blockchain. Wrong account " + args.account[0])
+
+    password = args.password[0]
+
+    keys = derive_keys(account['name'], password, prefix=prefix)
+    blk_auths_public = chain_auths(account)
+    for role in ROLES:
+        if keys[role][0] != blk_auths_public[role]:
+            sys.exit("Password provided is not correct. Public " + role + " key " + keys[role][0] + " doesn't match the one in the Pulsar blockchain " + blk_auths_public[role])
+
+    print(json.dumps(cred_data(account['name'], password, keys), indent=4))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+import gzip, json, os, sys, time
+from pulsar.util import window
+
+RESIDENT = False
+
+#Exports the operation history of an account. The history index space is cut into pages that are
+#fetched concurrently over kept-alive connections and written strictly in index order, either as
+#NDJSON (gzip members with a .gz name) or as Parquet parts. The checkpoint next to the output
+#remembers the last exported index and the output size, so the next run only fetches new
+#operations and a run cut short resumes without duplicates.
+
+COLUMNS = ("index", "block", "trx_in_block", "op_in_trx", "virtual_op", "timestamp", "trx_id", "type", "op")
+
+def add_arguments(parser):
+    parser.add_argument('account', help="Name of the Pulsar account", type=str, nargs=1)
+    parser.add_argument('output', help="NDJSON file (.gz to compress) or, with --format parquet, a directory of parts", type=str, nargs=1)
+    parser.add_argument('--format', help="Output format", choices=['ndjson', 'parquet'], default='ndjson')
+    parser.add_argument('--workers', help="Pages fetched at the same time", type=int, default=8)
+    parser.add_argument('--page', help="Operations per request (at most 1000)", type=int, default=1000)
+    parser.add_argument('--chunk', help="Operations written between checkpoints", type=int, default=50000)
+    parser.add_argument('--node', help="http(s) node to use. Default: the best of PULSAR_NODES", type=str)
+    parser.add_argument('--include-reversible', help="Also export operations in blocks that aren't irreversible yet", action='store_true')
+
+class HistoryError(Exception):
+    pass
+
+def endpoint(url):
+    from pulsar.nodes import Endpoint, get_manager
+    if url: return Endpoint(url, timeout=30)
+    ep = get_manager().best(ws=False)
+    if ep is None: raise HistoryError("No http node in PULSAR_NODES")
+    return ep
+
+def fetch(ep, account, first, last, retries=3):
+    #Entries with first <= index <= last: the node returns [start - limit, start]
+    from pulsar.nodes import RPCError
+    for attempt in range(retries):
+        try:
+            page = ep.call("condenser_api.get_account_history", [account, last, last - first])
+            return [(i, e) for i, e in page if first <= i <= last]
+        except (RPCError, OSError, ValueError) as e:
+            if attempt == retries - 1: raise HistoryError("Operations %d-%d: %s" % (first, last, e))
+            time.sleep(2 ** attempt)
+
+def tip(ep, account):
+    #Last history index and last irreversible block, in one request
+    from pulsar.nodes import payload
+    calls = [payload("condenser_api.get_account_history", [account, -1, 0]), payload("condenser_api.get_dynamic_global_properties", [])]
+    by_id = {r.get("id"): r for r in ep.request(calls)}
+    history, props = (by_id.get(c["id"], {}) for c in calls)
+    if "result" not in history or "result" not in props: raise HistoryError("%s: %s" % (ep.url, (history.get("error") or props.get("error") or {}).get("message", "no reply")))
+    last = history["result"][-1][0] if history["result"] else -1
+    return last, props["result"]["last_irreversible_block_num"]
+
+def row(index, entry):
+    op = entry["op"]
+    return {"index": index, "block": entry["block"], "trx_in_block": entry["trx_in_block"], "op_in_trx": entry["op_in_trx"], "virtual_op": entry["virtual_op"],
+            "timestamp": entry["timestamp"], "trx_id": entry["trx_id"], "type": op[0], "op": op[1]}
+
+class NdjsonWriter:
+    def __init__(self, path, size):
+        self.path = path
+        self.gz = path.endswith(".gz")
+        #Anything after the checkpointed size is from a run that stopped before its checkpoint
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f: f.truncate(size)
+
+    def write(self, rows):
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in rows).encode()
+        with open(self.path, "ab") as f:
+            #One gzip member per chunk: the file stays valid, and can be cut back, at every checkpoint
+            f.write(gzip.compress(data) if self.gz else data)
+            f.flush()
+            os.fsync(f.fileno())
+        return os.path.getsize(self.path)
+
+class ParquetWriter:
+    def __init__(self, path, last):
+        try:
+            import pyarrow, pyarrow.parquet
+        except ImportError:
+            raise HistoryError("Parquet output needs pyarrow: pip3 install pyarrow")
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith("part-") and name.endswith(".parquet") and int(name.split("-")[1]) > last: os.unlink(os.path.join(path, name))
+
+    def write(self, rows):
+        columns = {c: [r[c] for r in rows] for c in COLUMNS}
+        columns["op"] = [json.dumps(o, separators=(",", ":")) for o in columns["op"]]
+        name = "part-%012d-%012d.parquet" % (rows[0]["index"], rows[-1]["index"])
+        tmp = os.path.join(self.path, "." + name)
+        self.pq.write_table(self.pa.table(columns), tmp, compression="zstd")
+        os.replace(tmp, os.path.join(self.path, name))
+        return sum(os.path.getsize(os.path.join(self.path, n)) for n in os.listdir(self.path) if n.startswith("part-"))
+
+def checkpoint_path(output):
+    return output.rstrip("/") + ".checkpoint.json"
+
+def load_checkpoint(path, account, fmt):
+    try:
+        with open(path) as f: cp = json.load(f)
+    except (OSError, ValueError):
+        return {"account": account, "format": fmt, "last_index": -1, "last_block": 0, "count": 0, "size": 0}
+    if cp.get("account") != account or cp.get("format") != fmt: raise HistoryError("%s is a checkpoint of @%s (%s), not @%s (%s)" % (path, cp.get("account"), cp.get("format"), account, fmt))
+    return cp
+
+def save_checkpoint(path, cp):
+    cp["updated"] = int(time.time())
+    tmp = path + ".%d" % os.getpid()
+    with open(tmp, "w") as f: json.dump(cp, f, indent=4)
+    os.replace(tmp, path)
+
+def export(args):
+    account, output = args.account[0], args.output[0]
+    cp_path = checkpoint_path(output)
+    cp = load_checkpoint(cp_path, account, args.format)
+    if "updated" not in cp and os.path.exists(output) and (os.path.isfile(output) and os.path.getsize(output) or os.path.isdir(output) and os.listdir(output)):
+        raise HistoryError("%s already exists without a checkpoint, use another name" % output)
+    writer = ParquetWriter(output, cp["last_index"]) if args.format == "parquet" else NdjsonWriter(output, cp["size"])
+    ep = endpoint(args.node)
+    last, irreversible = tip(ep, account)
+    first = cp["last_index"] + 1
+    if last < first:
+        print("@%s: nothing new after operation %d" % (account, cp["last_index"]))
+        return 0
+    page = max(1, min(args.page, 1000))
+    pages = [(a, min(a + page - 1, last)) for a in range(first, last + 1, page)]
+    start, done, pending, before = time.monotonic(), 0, [], cp["count"]
+
+    def flush():
+        cp["size"] = writer.write(pending)
+        cp.update(last_index=pending[-1]["index"], last_block=pending[-1]["block"], last_timestamp=pending[-1]["timestamp"], count=cp["count"] + len(pending))
+        save_checkpoint(cp_path, cp)
+        del pending[:]
+
+    #Pages come back in order however the requests finish; at most 2 * workers of them in memory
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        stopped = False
+        for entries in window(pool, lambda r: fetch(ep, account, *r), pages, max(1, args.workers) * 2):
+            for index, entry in entries:
+                if not args.include_reversible and entry["block"] > irreversible:
+                    stopped = True
+                    break
+                pending.append(row(index, entry))
+            done += len(entries)
+            if len(pending) >= args.chunk: flush()
+            rate = done / max(time.monotonic() - start, 1e-6)
+            sys.stderr.write("\r%d / %d operations, %.0f ops/s   " % (done, last - first + 1, rate))
+            if stopped: break
+    if pending: flush()
+    sys.stderr.write("\n")
+    print("@%s: %d operations exported up to #%d (block %d) in %.1fs, %d in total" % (account, cp["count"] - before, cp["last_index"], cp["last_block"], time.monotonic() - start, cp["count"]))
+    return 0
+
+def run(args):
+    try:
+        return export(args)
+    except (HistoryError, OSError) as e:
+        sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
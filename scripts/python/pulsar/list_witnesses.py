@@ -0,0 +1,12 @@
+from pulsar.client import get_steem
+
+RESIDENT = True
+
+def add_arguments(parser):
+    pass
+
+def run(args):
+    from beem.witness import ListWitnesses
+    print(ListWitnesses(steem_instance=get_steem()))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
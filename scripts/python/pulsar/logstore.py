@@ -0,0 +1,331 @@
+import calendar, json, os, re, sqlite3, sys, time
+from pulsar.util import cache_path, human, parse_time, split
+
+RESIDENT = False
+
+#Turns pulsard's logs (the docker json-file log with its rotated files, and logs/p2p/p2p.log) into
+#structured events in a small sqlite store indexed by time and by type. Only the bytes added since
+#the last run are read: files are tracked by inode, so a rotation (json.log -> json.log.1) is
+#neither read again nor missed. Chunks are searched with one regex for the interesting messages,
+#only the matching lines are decoded, and the events of a chunk are committed with the new offset.
+
+STORE = cache_path("logs.db")
+CHUNK = 16 * 1024 * 1024
+#Repeats of the same message (E.G. "Not producing block because..." every second) within that many
+#seconds are one event with a count
+MERGE = 60
+
+#type -> regex; group "block" and group "subject" (a peer or a witness) are stored when present
+EVENTS = (
+    ("produced", re.compile(r"Generated block #(?P<block>\d+) with timestamp")),
+    #A slot the node should have filled: it woke up late, saw too few witnesses or failed to build the block
+    ("missed", re.compile(r"Not producing block.*(?:didn't wake up|participation)|[Ee]xception while generating block")),
+    #Every other reason (stale production disabled, no key for the scheduled witness...) isn't a miss
+    ("not_producing", re.compile(r"Not producing block")),
+    ("received", re.compile(r"Got \d+ transactions on block (?P<block>\d+) by (?P<subject>[\w.-]+)")),
+    ("fork", re.compile(r"Switching to fork: (?P<subject>\w+)")),
+    ("peer_connect", re.compile(r"New peer is connected \((?P<subject>[^)]+)\)")),
+    ("peer_disconnect", re.compile(r"Remote peer (?P<subject>[\d.:]+) closed their connection|Peer (?P<subject2>[\d.:]+) is disconnecting us|"
+                                   r"Disconnecting from (?P<subject3>[\d.:]+)|Closing connection with peer (?P<subject4>[\d.:]+)")),
+    ("replay_start", re.compile(r"Reindexing Blockchain")),
+    ("replay_progress", re.compile(r"^\s*[\d.]+%\s+(?P<block>\d+) of \d+")),
+    ("replay_done", re.compile(r"Done reindexing, elapsed time: [\d.]+ sec")),
+    ("sync", re.compile(r"Syncing Blockchain --- Got block: #(?P<block>\d+)")),
+)
+TYPES = [name for name, _ in EVENTS]
+#Cheap search over whole chunks, a line is only decoded when this matches in it
+KEYWORDS = re.compile(rb"Generated block #|Not producing block|xception while generating block|transactions on block|Switching to fork|New peer is connected|"
+                      rb"closed their connection|is disconnecting us|Disconnecting from|Closing connection with peer|Reindexing Blockchain|% +\d+ of \d+|"
+                      rb"Done reindexing|Syncing Blockchain")
+#fc's prefixes: "1390432ms th_a witness_plugin.cpp:343 block_production_loo ] " on the console,
+#"2019-07-29T10:00:00 p2p:message read_loop on_closing_connectio ] ... node.cpp:2869" in files
+FC_TIME = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?\s")
+FC_PREFIX = re.compile(r"^(?:\d+ms\s+)?(?:[^\s\]]+\s+){1,5}\]\s+")
+FC_SOURCE = re.compile(r"\s+[\w.]+\.cpp:\d+\s*$")
+AGO = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def add_arguments(parser):
+    parser.add_argument('action', help="ingest: read what the logs gained since the last run, query: list events, last: latest event of each type, summary: counts, production and peers over a period",
+                        choices=['ingest', 'query', 'last', 'summary'])
+    parser.add_argument('--db', help="Event store. Default: " + STORE, type=str, default=STORE)
+    parser.add_argument('--docker', help="The container's json-file log (docker inspect --format '{{.LogPath}}'), its rotated files are read too", type=str)
+    parser.add_argument('--p2p', help="pulsard's p2p log file", type=str)
+    parser.add_argument('--no-ingest', help="query, last, summary: only use what is already in the store", action='store_true')
+    parser.add_argument('--follow', help="ingest: keep reading the logs as they grow", action='store_true')
+    parser.add_argument('--interval', help="ingest --follow: seconds between reads", type=float, default=5)
+    parser.add_argument('--type', help="Event type, can be repeated", choices=TYPES, action='append', default=[])
+    parser.add_argument('--since', help="Start of the period: 90m, 12h, 7d, a date or an ISO time (UTC). Default for summary: 24h", type=str)
+    parser.add_argument('--until', help="End of the period, same formats", type=str)
+    parser.add_argument('--block', help="Events about this block number", type=int)
+    parser.add_argument('--subject', help="Events about this peer or witness", type=str)
+    parser.add_argument('--grep', help="Events whose message contains this text", type=str)
+    parser.add_argument('--limit', help="query: most recent events to show", type=int, default=50)
+    parser.add_argument('--by', help="summary: also count events per hour or per day", choices=['hour', 'day'])
+    parser.add_argument('--format', help="query output", choices=['table', 'json'], default='table')
+
+class LogStoreError(Exception):
+    pass
+
+def open_store(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS events (t REAL NOT NULL, type TEXT NOT NULL, block INTEGER, subject TEXT, count INTEGER NOT NULL DEFAULT 1, source TEXT, message TEXT);
+        CREATE INDEX IF NOT EXISTS events_t ON events (t);
+        CREATE INDEX IF NOT EXISTS events_type_t ON events (type, t);
+        CREATE TABLE IF NOT EXISTS files (dev INTEGER, ino INTEGER, path TEXT, offset INTEGER, head BLOB, PRIMARY KEY (dev, ino));
+    """)
+    #Version 1: every "Not producing block" line used to be stored as missed. Moved once, not on each open
+    if db.execute("PRAGMA user_version").fetchone()[0] < 1:
+        with db:
+            db.execute("""UPDATE events SET type = 'not_producing' WHERE type = 'missed' AND message LIKE 'Not producing block%'
+                AND message NOT LIKE '%didn''t wake up%' AND message NOT LIKE '%participation%'""")
+            db.execute("PRAGMA user_version = 1")
+    return db
+
+def parse_when(value, now=None):
+    #Relative (90m, 12h, 7d), epoch seconds, a date or an ISO time, all UTC
+    now = time.time() if now is None else now
+    m = AGO.match(value)
+    if m: return now - float(m.group(1)) * UNITS[m.group(2)]
+    if re.match(r"^\d{9,}(\.\d+)?$", value): return float(value)
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return calendar.timegm(time.strptime(value.rstrip("Z"), fmt))
+        except ValueError:
+            pass
+    raise LogStoreError("Can't read the time %r, use E.G. 12h, 7d, 2024-05-01 or 2024-05-01T10:00:00" % value)
+
+def stamp(t):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t))
+
+def decode(line):
+    #(timestamp or None, message without fc's prefix and source location)
+    t, msg = split(line)
+    if t is None:
+        m = FC_TIME.match(msg)
+        if m:
+            t = parse_time(m.group(1) + (m.group(2) or "") + "Z")
+            msg = msg[m.end():]
+    m = FC_PREFIX.match(msg)
+    if m: msg = msg[m.end():]
+    return t, FC_SOURCE.sub("", msg).strip()
+
+def classify(msg):
+    for name, regex in EVENTS:
+        m = regex.search(msg)
+        if not m: continue
+        groups = m.groupdict()
+        block = groups.get("block")
+        subject = next((v for k, v in sorted(groups.items()) if k.startswith("subject") and v), None)
+        return name, int(block) if block else None, subject
+    return None
+
+def scan(data, source, fallback):
+    #Events of the complete lines in data, repeats merged
+    out, recent, last_line = [], {}, -1
+    for m in KEYWORDS.finditer(data):
+        start = data.rfind(b"\n", 0, m.start()) + 1
+        if start == last_line: continue
+        last_line = start
+        end = data.find(b"\n", m.end())
+        t, msg = decode(data[start:end if end >= 0 else len(data)].decode("utf-8", "replace"))
+        event = classify(msg)
+        if event is None: continue
+        t = t if t is not None else fallback
+        name, block, subject = event
+        key = (name, subject, msg)
+        row = recent.get(key)
+        if row is not None and t - row[0] <= MERGE:
+            row[4] += 1
+            continue
+        row = [t, name, block, subject, 1, source, msg[:400]]
+        recent[key] = row
+        out.append(row)
+    return out
+
+def sources(args):
+    #(name, path) oldest first: docker rotates json.log -> json.log.1 -> json.log.2 ...
+    out = []
+    if args.docker:
+        directory, base = os.path.split(os.path.abspath(args.docker))
+        try:
+            names = os.listdir(directory)
+        except OSError as e:
+            raise LogStoreError("%s: %s" % (directory, e.strerror))
+        rotated = sorted((int(n[len(base) + 1:]), n) for n in names if n.startswith(base + ".") and n[len(base) + 1:].isdigit())
+        out += [("docker", os.path.join(directory, n)) for _, n in reversed(rotated)]
+        if base in names: out.append(("docker", os.path.join(directory, base)))
+    if args.p2p and os.path.exists(args.p2p): out.append(("p2p", args.p2p))
+    return out
+
+def ingest_file(db, source, path, progress):
+    try:
+        f = open(path, "rb")
+    except OSError as e:
+        raise LogStoreError("%s: %s" % (path, e.strerror))
+    with f:
+        st = os.fstat(f.fileno())
+        head = f.read(256)
+        row = db.execute("SELECT offset, head FROM files WHERE dev = ? AND ino = ?", (st.st_dev, st.st_ino)).fetchone()
+        offset = 0
+        #Same inode but other content (a deleted file's inode reused) or truncated: from the start
+        if row is not None and bytes(row[1]) == head[:len(row[1])] and row[0] <= st.st_size: offset = row[0]
+        f.seek(offset)
+        events, start = 0, offset
+        while True:
+            data = f.read(CHUNK)
+            if not data: break
+            cut = data.rfind(b"\n") + 1
+            #The last line isn't complete yet, it's read again next time
+            if cut == 0:
+                if len(data) < CHUNK: break
+                cut = len(data)
+            elif cut < len(data):
+                f.seek(offset + cut)
+            rows = scan(data[:cut], source, st.st_mtime)
+            offset += cut
+            with db:
+                db.executemany("INSERT INTO events (t, type, block, subject, count, source, message) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                db.execute("INSERT OR REPLACE INTO files (dev, ino, path, offset, head) VALUES (?, ?, ?, ?, ?)", (st.st_dev, st.st_ino, path, offset, head))
+            events += len(rows)
+            progress(cut, len(rows))
+        #Nothing new: the file is remembered anyway, under the name it has now
+        if offset == start:
+            with db: db.execute("INSERT OR REPLACE INTO files (dev, ino, path, offset, head) VALUES (?, ?, ?, ?, ?)", (st.st_dev, st.st_ino, path, offset, head))
+    return (st.st_dev, st.st_ino), events
+
+def ingest(db, args, quiet=False):
+    files = sources(args)
+    start, total = time.monotonic(), [0, 0]
+    tty = sys.stderr.isatty() and not quiet
+
+    def progress(nbytes, nevents):
+        total[0] += nbytes
+        total[1] += nevents
+        if tty: sys.stderr.write("\r%.0f MiB read, %d events   " % (total[0] / 1048576.0, total[1]))
+
+    seen = set()
+    for source, path in files:
+        key, _ = ingest_file(db, source, path, progress)
+        seen.add(key)
+    #Rotated out of existence
+    with db:
+        for dev, ino in db.execute("SELECT dev, ino FROM files").fetchall():
+            if (dev, ino) not in seen and files: db.execute("DELETE FROM files WHERE dev = ? AND ino = ?", (dev, ino))
+    if tty and total[0]: sys.stderr.write("\n")
+    return total[0], total[1], time.monotonic() - start
+
+def where(args, since=None):
+    clauses, params = [], []
+    if args.type:
+        clauses.append("type IN (%s)" % ",".join("?" * len(args.type)))
+        params += args.type
+    since = args.since or since
+    if since:
+        clauses.append("t >= ?")
+        params.append(parse_when(since))
+    if args.until:
+        clauses.append("t < ?")
+        params.append(parse_when(args.until))
+    if args.block is not None:
+        clauses.append("block = ?")
+        params.append(args.block)
+    if args.subject:
+        clauses.append("subject = ?")
+        params.append(args.subject)
+    if args.grep:
+        clauses.append("instr(message, ?) > 0")
+        params.append(args.grep)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def line(t, name, block, subject, count, msg):
+    return "%s  %-15s %9s  %-20s %s%s" % (stamp(t), name, "#%d" % block if block is not None else "", subject or "", msg, "  (x%d)" % count if count > 1 else "")
+
+def query(db, args):
+    clause, params = where(args)
+    rows = db.execute("SELECT t, type, block, subject, count, message FROM (SELECT * FROM events%s ORDER BY t DESC LIMIT ?) ORDER BY t" % clause, params + [args.limit]).fetchall()
+    for t, name, block, subject, count, msg in rows:
+        if args.format == "json": print(json.dumps({"time": stamp(t), "t": t, "type": name, "block": block, "subject": subject, "count": count, "message": msg}))
+        else: print(line(t, name, block, subject, count, msg))
+    if not rows and args.format == "table": print("No events")
+
+def last(db, args):
+    now = time.time()
+    clause, params = where(args)
+    #One indexed lookup per type instead of grouping the whole table
+    for name in args.type or TYPES:
+        extra = " AND " if clause else " WHERE "
+        row = db.execute("SELECT t, type, block, subject, count, message FROM events%s%stype = ? ORDER BY t DESC LIMIT 1" % (clause, extra), params + [name]).fetchone()
+        if row is None: print("%-15s never" % name)
+        else: print("%-15s %s ago  %s" % (name, human(now - row[0]), line(*row)))
+
+def summary(db, args):
+    clause, params = where(args, "24h")
+    begin = parse_when(args.since or "24h")
+    end = parse_when(args.until) if args.until else time.time()
+    print("Events from %s to %s UTC (%s)" % (stamp(begin), stamp(end), human(end - begin)))
+    counts = dict(db.execute("SELECT type, SUM(count) FROM events%s GROUP BY type" % clause, params).fetchall())
+    for name in TYPES:
+        if counts.get(name): print("    %-15s %8d" % (name, counts[name]))
+    if not counts:
+        print("    no events")
+        return
+    produced, missed = counts.get("produced", 0), counts.get("missed", 0)
+    if produced or missed:
+        print("Production: %d blocks produced, %d missed (%.1f%% produced)" % (produced, missed, 100.0 * produced / (produced + missed)))
+        extra = " AND " if clause else " WHERE "
+        for msg, n in db.execute("SELECT message, SUM(count) FROM events%s%stype = 'missed' GROUP BY message ORDER BY 2 DESC LIMIT 5" % (clause, extra), params).fetchall():
+            print("    %6d  %s" % (n, msg))
+    extra = " AND " if clause else " WHERE "
+    if counts.get("not_producing"):
+        print("Not producing (not counted as missed): %d" % counts["not_producing"])
+        for msg, n in db.execute("SELECT message, SUM(count) FROM events%s%stype = 'not_producing' GROUP BY message ORDER BY 2 DESC LIMIT 5" % (clause, extra), params).fetchall():
+            print("    %6d  %s" % (n, msg))
+    for name in ("produced", "fork", "replay_done"):
+        row = db.execute("SELECT t, type, block, subject, count, message FROM events%s%stype = ? ORDER BY t DESC LIMIT 1" % (clause, extra), params + [name]).fetchone()
+        if row: print("Last %s: %s ago  %s" % (name.replace("_", " "), human(time.time() - row[0]), line(*row)))
+    peers = db.execute("SELECT subject, SUM(CASE type WHEN 'peer_connect' THEN count ELSE 0 END), SUM(CASE type WHEN 'peer_disconnect' THEN count ELSE 0 END) FROM events%s%s"
+                       "type IN ('peer_connect', 'peer_disconnect') GROUP BY subject ORDER BY 3 DESC, 2 DESC" % (clause, extra), params).fetchall()
+    if peers:
+        print("Peers: %d seen, %d connections, %d disconnections, most disconnects:" % (len(peers), sum(p[1] for p in peers), sum(p[2] for p in peers)))
+        for subject, connects, disconnects in peers[:5]: print("    %-24s %5d connects %5d disconnects" % (subject, connects, disconnects))
+    if args.by:
+        size = 3600 if args.by == "hour" else 86400
+        rows = db.execute("SELECT CAST(t / ? AS INTEGER), type, SUM(count) FROM events%s GROUP BY 1, 2" % clause, [size] + params).fetchall()
+        buckets = {}
+        for bucket, name, n in rows: buckets.setdefault(bucket, {})[name] = n
+        names = [n for n in TYPES if counts.get(n)]
+        print("\n%-19s " % ("UTC " + args.by) + " ".join("%15s" % n for n in names))
+        for bucket in sorted(buckets):
+            print("%-19s " % stamp(bucket * size)[:16 if size == 3600 else 10] + " ".join("%15d" % buckets[bucket].get(n, 0) for n in names))
+
+def run(args):
+    try:
+        db = open_store(args.db)
+    except (OSError, sqlite3.Error) as e:
+        sys.exit("%s: %s" % (args.db, e))
+    try:
+        if args.action == "ingest":
+            if not args.docker and not args.p2p: raise LogStoreError("Nothing to ingest, give --docker and/or --p2p")
+            while True:
+                nbytes, events, secs = ingest(db, args, args.follow)
+                if not args.follow or nbytes:
+                    print("%s%.1f MiB read, %d events in %.1fs, %d events in %s" % (stamp(time.time()) + "  " if args.follow else "", nbytes / 1048576.0, events, secs,
+                                                                                  db.execute("SELECT COUNT(*) FROM events").fetchone()[0], args.db), flush=True)
+                if not args.follow: break
+                time.sleep(args.interval)
+            return 0
+        if not args.no_ingest and (args.docker or args.p2p): ingest(db, args)
+        if args.action == "query": query(db, args)
+        elif args.action == "last": last(db, args)
+        else: summary(db, args)
+    except KeyboardInterrupt:
+        pass
+    except LogStoreError as e:
+        sys.exit(str(e))
+    finally:
+        db.close()
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
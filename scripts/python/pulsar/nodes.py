@@ -0,0 +1,257 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+import http.client, itertools, json, os, statistics, sys, threading, time
+from pulsar.util import cache_path
+
+RESIDENT = True
+
+#Ranking shared by all short lived commands, so they don't probe every node on each run
+CACHE = cache_path("nodes.json")
+CACHE_TTL = 600
+#beem gets the ranking with a timeout scaled to the best node's round trip and a few retries, instead of
+#60s and 100 reconnects per node: a slow first node costs seconds before beem moves to the next
+BEEM_TIMEOUT = (5, 30)
+BEEM_RETRIES = 2
+PROBE_METHOD = "condenser_api.get_dynamic_global_properties"
+
+def add_arguments(parser):
+    parser.add_argument('action', help="probe: probe all nodes and show the ranking, best: print the best node, call: hedged JSON-RPC call", choices=['probe', 'best', 'call'])
+    parser.add_argument('method', help="Method for call, E.G.: condenser_api.get_accounts", type=str, nargs='?')
+    parser.add_argument('params', help="JSON params for call, E.G.: '[[\"pulsar\"]]'", type=str, nargs='?', default="[]")
+    parser.add_argument('--nodes', help="Comma separated http(s)/ws(s) endpoints. Default: PULSAR_NODES", type=str)
+    parser.add_argument('--http', help="With best: only consider http(s) nodes", action='store_true')
+    parser.add_argument('--ws', help="With best: only consider ws(s) nodes", action='store_true')
+
+class RPCError(Exception):
+    pass
+
+_ids = itertools.count(1)
+
+def payload(method, params):
+    return {"jsonrpc": "2.0", "method": method, "params": params, "id": next(_ids)}
+
+def error_message(error):
+    #JSON-RPC errors are {"code", "message", "data"}, but some nodes and proxies answer a bare string
+    return error.get("message", error) if isinstance(error, dict) else error
+
+class Endpoint:
+    #One node. Connections are kept open per thread (keep-alive for http, the socket for ws)
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.ws = urlparse(url).scheme in ("ws", "wss")
+        self.timeout = timeout
+        self.rtts = deque(maxlen=8)
+        self.head = None
+        self.head_time = None
+        self.error = None
+        self.local = threading.local()
+
+    @property
+    def rtt(self):
+        return statistics.median(self.rtts) if self.rtts else None
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            if self.ws:
+                from pulsar.ws import WebSocket
+                conn = WebSocket(self.url, timeout=self.timeout)
+            else:
+                u = urlparse(self.url)
+                cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+                conn = cls(u.hostname, u.port, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self.local, "conn", None)
+        self.local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def request(self, body):
+        #body is a payload dict or a list of them (batch), returns the decoded response
+        data = json.dumps(body)
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                if self.ws:
+                    conn.send(data)
+                    raw = conn.recv()
+                else:
+                    conn.request("POST", urlparse(self.url).path or "/", data, {"Content-Type": "application/json"})
+                    r = conn.getresponse()
+                    raw = r.read()
+                    if r.status != 200: raise RPCError("HTTP %d from %s" % (r.status, self.url))
+                return json.loads(raw)
+            except (OSError, http.client.HTTPException, ValueError, RPCError) as e:
+                self._drop()
+                #A kept-alive connection may have been closed by the server, retry once on a fresh one
+                if attempt or isinstance(e, RPCError): raise
+
+    def call(self, method, params=None):
+        start = time.perf_counter()
+        reply = self.request(payload(method, params if params is not None else []))
+        self.rtts.append(time.perf_counter() - start)
+        if "error" in reply: raise RPCError("%s: %s" % (self.url, error_message(reply["error"])))
+        return reply["result"]
+
+    def probe(self):
+        try:
+            props = self.call(PROBE_METHOD)
+            self.head = int(props["head_block_number"])
+            self.head_time = props.get("time")
+            self.error = None
+        except Exception as e:
+            self.head = None
+            self.error = str(e) or type(e).__name__
+        return self
+
+class NodeManager:
+    def __init__(self, urls, cache=CACHE, ttl=CACHE_TTL, max_lag=20, timeout=5, hedge_min=0.25):
+        self.endpoints = [Endpoint(u, timeout=timeout) for u in dict.fromkeys(u.strip() for u in urls if u.strip())]
+        if not self.endpoints: raise ValueError("No RPC nodes configured")
+        self.cache = cache
+        self.ttl = ttl
+        self.max_lag = max_lag
+        self.hedge_min = hedge_min
+        self.probed = 0
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max(4, len(self.endpoints) * 2))
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        return cls(os.environ.get("PULSAR_NODES", "https://apidev.blkcc.xyz").split(","), **kwargs)
+
+    def probe(self):
+        list(self.pool.map(Endpoint.probe, self.endpoints))
+        self.probed = time.time()
+        self.save()
+
+    def healthy(self, ep, top):
+        return ep.head is not None and top - ep.head <= self.max_lag
+
+    def ranked(self, refresh=True):
+        #Healthy nodes by latency, then lagging ones, then the ones that didn't answer
+        if len(self.endpoints) == 1: return list(self.endpoints)
+        with self.lock:
+            if refresh and time.time() - self.probed > self.ttl and not self.load(): self.probe()
+            top = max((ep.head for ep in self.endpoints if ep.head is not None), default=0)
+            def key(ep):
+                if ep.head is None: return (2, 0)
+                if not self.healthy(ep, top): return (1, top - ep.head)
+                return (0, ep.rtt if ep.rtt is not None else float("inf"))
+            return sorted(self.endpoints, key=key)
+
+    def best(self, ws=None, refresh=True):
+        for ep in self.ranked(refresh):
+            if ws is None or ep.ws == ws: return ep
+        return None
+
+    def call(self, method, params=None, timeout=None):
+        #Ask the best node; if it hasn't answered after a couple of its usual round trips,
+        #ask the next one too and take whichever answers first. Errors move on immediately.
+        order = self.ranked()
+        timeout = timeout or max(ep.timeout for ep in order)
+        deadline = time.monotonic() + timeout
+        pending, errors = {}, []
+        remaining = iter(order)
+        def launch():
+            ep = next(remaining, None)
+            if ep is not None: pending[self.pool.submit(ep.call, method, params)] = ep
+            return ep is not None
+        launch()
+        while pending:
+            best = pending[next(iter(pending))]
+            hedge = max(self.hedge_min, 3 * best.rtt) if best.rtt else self.hedge_min
+            done, _ = wait(pending, timeout=min(hedge, max(0.0, deadline - time.monotonic())), return_when=FIRST_COMPLETED)
+            for f in done:
+                ep = pending.pop(f)
+                try:
+                    return f.result()
+                except Exception as e:
+                    errors.append(e)
+                    ep.error = str(e)
+            if time.monotonic() >= deadline: break
+            if not launch() and not pending: break
+        raise RPCError("All nodes failed for %s: %s" % (method, "; ".join(map(str, errors)) or "timeout"))
+
+    def start(self, interval=60):
+        #Background re-probing for long running processes (daemons, resident server), which also
+        #keeps the ranking on disk fresh for the short lived commands. Not under the lock, so
+        #ranked() never waits for a slow node
+        if self.thread is not None or len(self.endpoints) == 1: return self
+        def loop():
+            while not self.stop_event.wait(interval):
+                self.probe()
+        self.thread = threading.Thread(target=loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def save(self):
+        data = {"updated": self.probed, "nodes": [{"url": ep.url, "rtt": ep.rtt, "head": ep.head, "error": ep.error} for ep in self.endpoints]}
+        try:
+            os.makedirs(os.path.dirname(self.cache), exist_ok=True)
+            tmp = self.cache + ".%d" % os.getpid()
+            with open(tmp, "w") as f: json.dump(data, f)
+            os.replace(tmp, self.cache)
+        except OSError:
+            pass
+
+    def load(self):
+        try:
+            with open(self.cache) as f: data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        cached = {n["url"]: n for n in data.get("nodes", [])}
+        if time.time() - data.get("updated", 0) > self.ttl or set(cached) != {ep.url for ep in self.endpoints}: return False
+        for ep in self.endpoints:
+            n = cached[ep.url]
+            ep.rtts.clear()
+            if n["rtt"] is not None: ep.rtts.append(n["rtt"])
+            ep.head, ep.error = n["head"], n["error"]
+        self.probed = data["updated"]
+        return True
+
+_manager = None
+
+def get_manager():
+    global _manager
+    if _manager is None: _manager = NodeManager.from_env()
+    return _manager
+
+def beem_options():
+    #Steem(**beem_options()): beem fails over in list order, so it gets the ranking
+    ranked = get_manager().ranked()
+    rtt = next((ep.rtt for ep in ranked if ep.rtt is not None), None)
+    timeout = max(BEEM_TIMEOUT[0], min(BEEM_TIMEOUT[1], 20 * rtt)) if rtt is not None else BEEM_TIMEOUT[0] * 2
+    return {"node": [ep.url for ep in ranked], "timeout": timeout, "num_retries": BEEM_RETRIES, "num_retries_call": BEEM_RETRIES}
+
+def run(args):
+    manager = NodeManager(args.nodes.split(",")) if args.nodes else get_manager()
+    if args.action == "probe":
+        manager.probe()
+        top = max((ep.head for ep in manager.endpoints if ep.head is not None), default=0)
+        for ep in manager.ranked(refresh=False):
+            if ep.head is None:
+                print("{:<50} {}".format(ep.url, "DOWN: " + (ep.error or "")))
+            else:
+                print("{:<50} {:8.1f} ms  head {:>10}  lag {:>4}{}".format(ep.url, ep.rtt * 1000, ep.head, top - ep.head, "" if manager.healthy(ep, top) else "  (behind)"))
+    elif args.action == "best":
+        ep = manager.best(ws=True if args.ws else False if args.http else None)
+        if ep is None: sys.exit("No matching node")
+        print(ep.url)
+    else:
+        if not args.method: sys.exit("call needs a method")
+        print(json.dumps(manager.call(args.method, json.loads(args.params)), indent=4))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
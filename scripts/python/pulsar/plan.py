@@ -0,0 +1,273 @@
+from datetime import datetime, timedelta, timezone
+from getpass import unix_getpass
+import json, os, sys
+from pulsar.util import NULL_KEY, tapos
+
+RESIDENT = False
+
+#A plan lists operations for several accounts. "prepare" checks it against the chain with a single
+#batched request and packs the operations into as few transactions as the authorities allow,
+#"sign" needs nothing but the prepared file and the keys (it runs on an offline box), "broadcast"
+#sends every signed transaction in one batched request. "run" does the three in a row.
+
+OPERATIONS = ("profile", "witness_update", "witness_disable", "feed_publish", "set_keys", "raw")
+PROFILE_FIELDS = ("name", "about", "location", "profile_image", "cover_image", "website")
+#Steem refuses transactions over 64 KiB; the JSON form is larger than the binary one, so this is safe
+MAX_TX_JSON = 60 * 1024
+MAX_EXPIRATION = 3600
+
+def add_arguments(parser):
+    parser.add_argument('action', help="prepare: check a plan and write unsigned transactions, sign: sign a prepared file (offline), broadcast: send a signed file, run: all three", choices=['prepare', 'sign', 'broadcast', 'run'])
+    parser.add_argument('file', help="Plan (JSON, or YAML with PyYAML installed) for prepare/run, prepared file for sign, signed file for broadcast", type=str, nargs=1)
+    parser.add_argument('--out', help="Output file of prepare and sign. Default: FILE.unsigned.json / FILE.signed.json", type=str)
+    parser.add_argument('--keys', help="A .credentials.json or a JSON {\"account\": {\"active\": WIF, ...}}, can be repeated. Missing keys are asked for", type=str, action='append', default=[])
+    parser.add_argument('--agent', help="Sign with the keys held by the signing agent (see: agent), in one request", action='store_true')
+    parser.add_argument('--expiration', help="Seconds the prepared transactions stay valid (max 3600), the time there is to sign and broadcast them", type=int, default=MAX_EXPIRATION)
+
+class PlanError(Exception):
+    pass
+
+def load_plan(path):
+    with open(path) as f: text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise PlanError("YAML plans need PyYAML: pip3 install pyyaml")
+        plan = yaml.safe_load(text)
+    else:
+        plan = json.loads(text)
+    ops = plan.get("operations") if isinstance(plan, dict) else plan
+    if not isinstance(ops, list) or not ops: raise PlanError("The plan has no operations")
+    for i, op in enumerate(ops, 1):
+        if op.get("type") not in OPERATIONS: raise PlanError("Operation %d: type must be one of %s" % (i, ", ".join(OPERATIONS)))
+        if not op.get("account"): raise PlanError("Operation %d: no account" % i)
+    return ops
+
+def fetch(ops):
+    #Everything needed to check the plan, in one request
+    from pulsar.nodes import RPCError, get_manager, payload
+    accounts = sorted({op["account"] for op in ops})
+    witnesses = sorted({op["account"] for op in ops if op["type"] in ("witness_update", "witness_disable", "feed_publish")})
+    ep = get_manager().best(ws=False)
+    if ep is None: raise PlanError("No http node in PULSAR_NODES")
+    calls = [payload("condenser_api.get_dynamic_global_properties", []), payload("condenser_api.get_accounts", [accounts])]
+    calls += [payload("condenser_api.get_witness_by_account", [w]) for w in witnesses]
+    by_id = {r["id"]: r for r in ep.request(calls)}
+    results = []
+    for c in calls:
+        r = by_id.get(c["id"], {})
+        if "error" in r or "result" not in r: raise RPCError("%s failed: %s" % (c["method"], r.get("error")))
+        results.append(r["result"])
+    return results[0], {a["name"]: a for a in results[1] if a}, dict(zip(witnesses, results[2:]))
+
+def resolve(ops, accounts, witnesses, symbols, prefix):
+    #Plan entries -> (authority account, role, operation). Several entries for the same account's
+    #profile or witness are merged: each operation carries the whole object
+    errors, out = [], []
+    profiles, wit_ops = {}, {}
+    for i, op in enumerate(ops, 1):
+        name, kind = op["account"], op["type"]
+        acc = accounts.get(name)
+        if acc is None:
+            errors.append("Operation %d: account %s doesn't exist" % (i, name))
+            continue
+        wit = witnesses.get(name)
+        if kind == "profile":
+            if name not in profiles:
+                try:
+                    meta = json.loads(acc["json_metadata"] or "{}")
+                except ValueError:
+                    meta = {}
+                if not isinstance(meta, dict): meta = {}
+                body = {"account": name, "memo_key": acc["memo_key"]}
+                profiles[name] = (meta, body)
+                out.append((name, "active", ["account_update", body]))
+            profile = profiles[name][0].setdefault("profile", {})
+            unknown = set(op) - set(PROFILE_FIELDS) - {"type", "account"}
+            if unknown: errors.append("Operation %d: unknown profile fields %s" % (i, ", ".join(sorted(unknown))))
+            profile.update({k: str(op[k]) for k in PROFILE_FIELDS if k in op})
+        elif kind in ("witness_update", "witness_disable"):
+            if name not in wit_ops:
+                if wit is None and kind == "witness_disable":
+                    errors.append("Operation %d: %s isn't a witness" % (i, name))
+                    continue
+                body = {"owner": name, "url": wit["url"] if wit else None, "block_signing_key": wit["signing_key"] if wit else None,
+                        "props": dict(wit["props"]) if wit else {}, "fee": "0.000 " + symbols["steem"]}
+                wit_ops[name] = body
+                out.append((name, "active", ["witness_update", body]))
+            body = wit_ops[name]
+            if kind == "witness_disable":
+                body["block_signing_key"] = prefix + NULL_KEY
+            else:
+                if "url" in op: body["url"] = str(op["url"])
+                if "signing_key" in op: body["block_signing_key"] = str(op["signing_key"])
+                for k in ("account_creation_fee", "maximum_block_size", "sbd_interest_rate"):
+                    if k in op.get("props", {}): body["props"][k] = op["props"][k]
+                missing = [k for k in ("url", "block_signing_key") if not body[k]] + [k for k in ("account_creation_fee", "maximum_block_size", "sbd_interest_rate") if k not in body["props"]]
+                if missing: errors.append("Operation %d: %s isn't a witness yet, it needs %s" % (i, name, ", ".join(missing)))
+            if body["block_signing_key"] and not body["block_signing_key"].startswith(prefix): errors.append("Operation %d: signing key must start with %s" % (i, prefix))
+        elif kind == "feed_publish":
+            if wit is None:
+                errors.append("Operation %d: %s isn't a witness" % (i, name))
+                continue
+            try:
+                price = float(op["price"])
+            except (KeyError, TypeError, ValueError):
+                price = 0
+            if price <= 0:
+                errors.append("Operation %d: feed_publish needs a price above 0" % i)
+                continue
+            rate = {"base": "{:.3f} {}".format(price, symbols["sbd"]), "quote": "1.000 " + symbols["steem"]}
+            out.append((name, "active", ["feed_publish", {"publisher": name, "exchange_rate": rate}]))
+        elif kind == "set_keys":
+            #Public keys only, the plan never holds secrets. An empty json_metadata leaves it as it is
+            keys = op.get("keys", {})
+            if set(keys) != {"owner", "active", "posting", "memo"}: errors.append("Operation %d: set_keys needs owner, active, posting and memo public keys" % i)
+            elif any(not k.startswith(prefix) for k in keys.values()): errors.append("Operation %d: keys must start with %s" % (i, prefix))
+            else:
+                auth = lambda role, accounts=[]: {"weight_threshold": 1, "account_auths": accounts, "key_auths": [[keys[role], 1]]}
+                body = {"account": name, "owner": auth("owner"), "active": auth("active"), "posting": auth("posting", acc["posting"]["account_auths"]),
+                        "memo_key": keys["memo"], "json_metadata": ""}
+                out.append((name, "owner", ["account_update", body]))
+        else:
+            if not isinstance(op.get("operation"), list) or len(op["operation"]) != 2: errors.append("Operation %d: raw needs \"operation\": [name, {...}]" % i)
+            elif op.get("authority", "active") not in ("owner", "active", "posting"): errors.append("Operation %d: authority must be owner, active or posting" % i)
+            else: out.append((name, op.get("authority", "active"), op["operation"]))
+    for meta, body in profiles.values(): body["json_metadata"] = json.dumps(meta)
+    if errors: raise PlanError("\n".join(errors))
+    return out
+
+def pack(resolved):
+    #Posting operations can't share a transaction with active/owner ones. Authority changes go in
+    #their own transactions, last, so everything before them is signed with the keys in use today
+    groups = [[r for r in resolved if r[1] in ("active", "owner") and not is_key_change(r[2])],
+              [r for r in resolved if r[1] == "posting"]]
+    txs = []
+    for group in groups:
+        current, size = [], 0
+        for r in group:
+            n = len(json.dumps(r[2]))
+            if current and size + n > MAX_TX_JSON:
+                txs.append(current)
+                current, size = [], 0
+            current.append(r)
+            size += n
+        if current: txs.append(current)
+    txs += [[r] for r in resolved if is_key_change(r[2])]
+    return txs
+
+def is_key_change(op):
+    return op[0] == "account_update" and any(k in op[1] for k in ("owner", "active", "posting"))
+
+def chain_info():
+    from pulsar.client import get_steem
+    stm = get_steem()
+    return dict(stm.chain_params), {"steem": stm.steem_symbol, "sbd": stm.sbd_symbol}
+
+def prepare(path, expiration):
+    ops = load_plan(path)
+    chain, symbols = chain_info()
+    props, accounts, witnesses = fetch(ops)
+    resolved = resolve(ops, accounts, witnesses, symbols, chain["prefix"])
+    ref_num, ref_prefix = tapos(props)
+    expires = (datetime.strptime(props["time"], "%Y-%m-%dT%H:%M:%S") + timedelta(seconds=min(expiration, MAX_EXPIRATION))).strftime("%Y-%m-%dT%H:%M:%S")
+    txs = []
+    for group in pack(resolved):
+        signers = sorted({(acc, role) for acc, role, _ in group})
+        tx = {"ref_block_num": ref_num, "ref_block_prefix": ref_prefix, "expiration": expires, "operations": [op for _, _, op in group], "extensions": []}
+        txs.append({"signers": signers, "transaction": tx})
+    return {"chain": chain, "symbols": symbols, "prepared": props["time"], "head_block_number": props["head_block_number"], "transactions": txs}
+
+def load_keys(paths):
+    #account -> role -> wif
+    keys = {}
+    for path in paths:
+        with open(path) as f: data = json.load(f)
+        if "name" in data and "active" in data and isinstance(data["active"], list):
+            keys.setdefault(data["name"], {}).update({role: next(k["value"] for k in data[role] if k["type"] == "private") for role in ("owner", "active", "posting") if role in data})
+        else:
+            for account, roles in data.items(): keys.setdefault(account, {}).update(roles)
+    return keys
+
+def key_for(keys, account, role):
+    from pulsar.agent import AUTHORITY
+    for r in AUTHORITY[role]:
+        if keys.get(account, {}).get(r): return keys[account][r]
+    wif = unix_getpass(prompt="Private %s key of @%s: " % (role, account)).strip()
+    if not wif: raise PlanError("No %s key for @%s" % (role, account))
+    keys.setdefault(account, {})[role] = wif
+    return wif
+
+def sign(bundle, keys, agent=False):
+    #No node: the chain parameters come with the prepared file
+    from pulsar.agent import AgentClient, sign_transactions
+    entries = bundle.get("transactions", [])
+    #The prefix is what keys and amounts are read with, the chain id is signed
+    if not entries or not all(k in bundle.get("chain", {}) for k in ("chain_id", "prefix")): raise PlanError("Not a prepared file, prepare it first")
+    if agent:
+        signed = AgentClient().sign(bundle["chain"], [e["transaction"] for e in entries], [e["signers"] for e in entries])
+    else:
+        items = [(e["transaction"], list(dict.fromkeys(key_for(keys, a, r) for a, r in e["signers"]))) for e in entries]
+        try:
+            signed = sign_transactions(bundle["chain"], items)
+        except Exception as e:
+            raise PlanError("Can't sign for chain %s: %s" % (bundle["chain"]["prefix"], e))
+    for entry, tx in zip(entries, signed): entry["transaction"] = tx
+    bundle["signed"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    return bundle
+
+def broadcast(bundle):
+    from pulsar.nodes import get_manager, payload
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    txs = [e["transaction"] for e in bundle["transactions"]]
+    if any(not tx.get("signatures") for tx in txs): raise PlanError("The file has unsigned transactions, sign it first")
+    if min(tx["expiration"] for tx in txs) < now: raise PlanError("The transactions expired at %s, prepare the plan again" % min(tx["expiration"] for tx in txs))
+    ep = get_manager().best(ws=False)
+    if ep is None: raise PlanError("No http node in PULSAR_NODES")
+    calls = [payload("condenser_api.broadcast_transaction", [tx]) for tx in txs]
+    by_id = {r["id"]: r for r in ep.request(calls)}
+    failed = 0
+    for i, (c, e) in enumerate(zip(calls, bundle["transactions"]), 1):
+        r = by_id.get(c["id"], {})
+        ops = ", ".join(op[0] for op in e["transaction"]["operations"])
+        if "error" in r or "result" not in r:
+            failed += 1
+            print("Transaction %d (%s): FAILED %s" % (i, ops, (r.get("error") or {}).get("message", "no reply")))
+        else:
+            print("Transaction %d (%s): broadcast" % (i, ops))
+    return failed
+
+def write(path, data):
+    with open(path, "w") as f: json.dump(data, f, indent=4)
+    print("Written " + path)
+
+def summary(bundle):
+    ops = sum(len(e["transaction"]["operations"]) for e in bundle["transactions"])
+    print("%d operations in %d transactions, valid until %s" % (ops, len(bundle["transactions"]), bundle["transactions"][0]["transaction"]["expiration"]))
+    for i, e in enumerate(bundle["transactions"], 1):
+        print("  %d: %s signed by %s" % (i, ", ".join(op[0] for op in e["transaction"]["operations"]), ", ".join("@%s (%s)" % tuple(s) for s in e["signers"])))
+
+def run(args):
+    from pulsar.agent import AgentError
+    path = args.file[0]
+    base = os.path.splitext(path)[0]
+    try:
+        if args.action in ("prepare", "run"):
+            bundle = prepare(path, args.expiration)
+            summary(bundle)
+            if args.action == "prepare":
+                write(args.out or base + ".unsigned.json", bundle)
+                return 0
+        else:
+            with open(path) as f: bundle = json.load(f)
+        if args.action in ("sign", "run"):
+            bundle = sign(bundle, load_keys(args.keys), args.agent)
+            if args.action == "sign":
+                write(args.out or base.replace(".unsigned", "") + ".signed.json", bundle)
+                return 0
+        return 1 if broadcast(bundle) else 0
+    except (PlanError, AgentError, OSError, ValueError) as e:
+        sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
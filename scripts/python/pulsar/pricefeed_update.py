@@ -0,0 +1,36 @@
+import json, sys
+from pulsar.client import get_steem, get_witness, checkkey, forget, agent_broadcast
+
+RESIDENT = True
+
+def add_arguments(parser):
+    parser.add_argument('witness', help="Name of the Pulsar Witness", type=str, nargs=1)
+    parser.add_argument('privateactivekey', help="Private active key of the Witness, not needed with --agent", type=str, nargs='?')
+    parser.add_argument('baseprice', help="New feed price in EUR to publish for a 1.000 Pulsar quote. E.G.: \"4.700\"", type=float, nargs=1)
+    parser.add_argument('--agent', help="Sign with the active key held by the signing agent (see: agent)", action='store_true')
+    parser.set_defaults(parser=parser)
+
+def run(args):
+    from pulsar.agent import AgentError
+    if not args.agent and not args.privateactivekey: args.parser.error('The private active key is required, or --agent')
+    wit = get_witness(args.witness[0])
+
+    if wit is not None:
+        if not args.agent and not checkkey(args.witness[0], args.privateactivekey, "active"): sys.exit("Private active key " + args.privateactivekey + " doesn't prove authority for Witness " + args.witness[0])
+        #Witness exists
+        get_steem(keys=[] if args.agent else [args.privateactivekey])
+
+        my_feed = "{:.3f} EUR".format(args.baseprice[0])
+
+        try:
+            if args.agent: output = agent_broadcast(lambda: wit.feed_publish(my_feed, account=args.witness[0]), args.witness[0])
+            else: output = wit.feed_publish(my_feed, account=args.witness[0])
+        except AgentError as e:
+            sys.exit(str(e))
+        forget(args.witness[0])
+        print(json.dumps(output, indent=4))
+
+    else:
+        sys.exit("The account provided is not a valid witness in the Pulsar Blockchain. Wrong witness " + args.witness[0])
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
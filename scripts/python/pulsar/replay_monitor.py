@@ -0,0 +1,272 @@
+from datetime import datetime, timezone
+import json, os, re, sys, time
+from pulsar.util import cache_path, human, parse_time, split
+
+RESIDENT = False
+
+#Follows pulsard's output (docker logs, ideally with --timestamps) and keeps track of replays:
+#progress, block rate over sliding windows and ETA. Finished replays are saved so runs can be
+#compared, E.G. before and after 'optimize'.
+
+RESULTS = cache_path("replays.json")
+WINDOWS = (60, 300, 900)
+SEGMENT = 1000000
+VM_SETTINGS = ("dirty_background_ratio", "dirty_expire_centisecs", "dirty_ratio", "dirty_writeback_centisecs", "swappiness")
+
+REINDEX = re.compile(r"Reindexing Blockchain")
+PROGRESS = re.compile(r"^\s*[\d.]+%\s+(\d+) of (\d+)(?:\s+\((\d+)M free\))?")
+DONE = re.compile(r"Done reindexing, elapsed time: ([\d.]+) sec")
+SYNC = re.compile(r"Syncing Blockchain --- Got block: #(\d+) time: (\S+)")
+LIVE = re.compile(r"Got \d+ transactions on block (\d+) by")
+
+def add_arguments(parser):
+    parser.add_argument('action', help="watch: follow a log (\"-\" for stdin) and show progress, runs: list saved replays, compare: compare two saved replays", choices=['watch', 'runs', 'compare'])
+    parser.add_argument('args', help="watch: the log file (default: stdin), compare: two run ids (default: the last two)", type=str, nargs='*')
+    parser.add_argument('--dir', help="Blockchain directory, for shared_memory.bin disk use and the block_log head", type=str)
+    parser.add_argument('--label', help="Name the runs seen, E.G.: \"after optimize\"", type=str, default="")
+    parser.add_argument('--results', help="File with the saved runs. Default: " + RESULTS, type=str, default=RESULTS)
+    parser.add_argument('--no-save', help="Don't save finished replays", action='store_true')
+    parser.add_argument('--interval', help="Seconds between status lines when not on a terminal", type=float, default=30)
+
+def gib(n):
+    return "-" if n is None else "%.1fG" % (n / 1073741824.0)
+
+class Run:
+    def __init__(self, started, label):
+        self.started = started
+        self.label = label
+        self.samples = [] #(time, block)
+        self.target = None
+        self.free_mb = None
+        self.elapsed = None
+
+    @property
+    def block(self):
+        return self.samples[-1][1] if self.samples else 0
+
+    def add(self, t, block):
+        if not self.samples or block > self.samples[-1][1]: self.samples.append((t, block))
+
+    def rate(self, window):
+        #Blocks/s between the last sample and the first one inside the window
+        if len(self.samples) < 2: return None
+        t1, b1 = self.samples[-1]
+        t0, b0 = next(((t, b) for t, b in self.samples if t1 - t <= window), self.samples[0])
+        if (t0, b0) == (t1, b1): t0, b0 = self.samples[-2]
+        return (b1 - b0) / (t1 - t0) if t1 > t0 else None
+
+    def eta(self, target):
+        rate = self.rate(WINDOWS[1])
+        if not rate or not target: return None
+        return max(0, target - self.block) / rate
+
+    def segments(self):
+        #Average rate per SEGMENT blocks, so runs can be compared stage by stage
+        out = {}
+        for (t0, b0), (t1, b1) in zip(self.samples, self.samples[1:]):
+            seg = (b1 - 1) // SEGMENT * SEGMENT
+            blocks, secs = out.get(seg, (0, 0.0))
+            out[seg] = (blocks + b1 - b0, secs + t1 - t0)
+        return {str(k): round(b / s, 1) for k, (b, s) in sorted(out.items()) if s > 0}
+
+    def result(self):
+        last = self.samples[-1]
+        seconds = self.elapsed or (last[0] - self.started)
+        return {
+            "id": datetime.fromtimestamp(self.started, timezone.utc).strftime("%Y%m%d-%H%M%S"),
+            "label": self.label,
+            "started": self.started,
+            "seconds": round(seconds, 1),
+            "blocks": last[1],
+            "rate": round(last[1] / seconds, 1) if seconds else None,
+            "segments": self.segments(),
+            "vm": vm_settings(),
+            "cpus": os.cpu_count(),
+        }
+
+def vm_settings():
+    out = {}
+    for name in VM_SETTINGS:
+        try:
+            with open("/proc/sys/vm/" + name) as f: out[name] = f.read().strip()
+        except OSError:
+            pass
+    return out
+
+def pulsard_memory():
+    #RSS of pulsard as seen from the host, the file backed part is mostly shared_memory.bin
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open("/proc/%s/comm" % pid) as f:
+                if f.read().strip() != "pulsard": continue
+            with open("/proc/%s/status" % pid) as f: fields = dict(l.split(":", 1) for l in f if ":" in l)
+        except OSError:
+            continue
+        kb = lambda k: int(fields[k].split()[0]) * 1024 if k in fields else None
+        return kb("VmRSS"), kb("RssFile")
+    return None, None
+
+def shm_usage(directory):
+    #(apparent size, bytes allocated on disk) of shared_memory.bin
+    try:
+        st = os.stat(os.path.join(directory, "shared_memory.bin"))
+        return st.st_size, st.st_blocks * 512
+    except (OSError, TypeError):
+        return None, None
+
+def block_log_head(directory):
+    if not directory: return None
+    from pulsar.blocklog import BlockLog, BlockLogError
+    try:
+        with BlockLog(directory) as log: return log.head
+    except (BlockLogError, OSError):
+        return None
+
+class Monitor:
+    def __init__(self, label="", head=None):
+        self.label = label
+        self.head = head
+        self.run = None
+        self.phase = "waiting"
+        self.sync_block = None
+        self.sync_target = None
+        self.finished = []
+
+    def feed(self, line, now=None):
+        #Returns True when the state changed
+        t, msg = split(line)
+        t = t if t is not None else (now if now is not None else time.time())
+        m = PROGRESS.match(msg)
+        if m:
+            block, target = int(m.group(1)), int(m.group(2))
+            if self.run is None or block < self.run.block: self.start(t)
+            self.run.add(t, block)
+            self.run.target = target
+            if m.group(3): self.run.free_mb = int(m.group(3))
+            return True
+        if REINDEX.search(msg):
+            self.start(t)
+            return True
+        m = DONE.search(msg)
+        if m and self.run is not None:
+            self.run.elapsed = float(m.group(1))
+            self.run.add(self.run.started + self.run.elapsed, self.run.target or self.run.block)
+            self.finished.append(self.run.result())
+            self.run = None
+            self.phase = "synced"
+            return True
+        m = SYNC.search(msg)
+        if m:
+            self.phase = "sync"
+            self.sync_block = int(m.group(1))
+            block_time = parse_time(m.group(2) + "Z")
+            #Blocks are every 3s: the head is as far ahead as the block is old
+            if block_time: self.sync_target = self.sync_block + int(max(0, t - block_time) / 3)
+            return True
+        m = LIVE.search(msg)
+        if m:
+            self.phase = "live"
+            self.sync_block = int(m.group(1))
+            return True
+        return False
+
+    def start(self, t):
+        self.run = Run(t, self.label)
+        self.run.add(t, 0)
+        self.phase = "replay"
+
+    def status(self, directory=None):
+        size, disk = shm_usage(directory)
+        rss, rss_file = pulsard_memory()
+        parts = []
+        if self.phase == "replay" and self.run is not None:
+            target = self.run.target or self.head
+            parts.append("replay %d/%s %.1f%%" % (self.run.block, target or "?", 100.0 * self.run.block / target if target else 0.0))
+            parts += ["%dm %s b/s" % (w // 60, "%.0f" % r if r else "-") for w, r in ((w, self.run.rate(w)) for w in WINDOWS)]
+            parts.append("ETA " + human(self.run.eta(target)))
+        elif self.phase in ("sync", "live"):
+            behind = "%d blocks behind" % max(0, self.sync_target - self.sync_block) if self.phase == "sync" and self.sync_target else "at head"
+            parts.append("%s block %d, %s" % (self.phase, self.sync_block, behind))
+        else:
+            parts.append(self.phase)
+        if size is not None: parts.append("shm %s/%s on disk" % (gib(disk), gib(size)))
+        if self.phase == "replay" and self.run is not None and self.run.free_mb is not None: parts.append("%dM free" % self.run.free_mb)
+        if rss is not None: parts.append("pulsard rss %s (%s file)" % (gib(rss), gib(rss_file)))
+        return "  ".join(parts)
+
+def load_results(path):
+    try:
+        with open(path) as f: return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def save_result(path, result):
+    runs = load_results(path)
+    #Following a log from the start sees old replays again
+    if any(r["id"] == result["id"] for r in runs): return False
+    runs.append(result)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".%d" % os.getpid()
+    with open(tmp, "w") as f: json.dump(runs, f, indent=4)
+    os.replace(tmp, path)
+    return True
+
+def summary(result):
+    return "%s %-20s %10d blocks in %8s  %7.0f blocks/s" % (result["id"], result["label"] or "-", result["blocks"], human(result["seconds"]), result["rate"] or 0)
+
+def compare(a, b):
+    print("{:<28} {:>20} {:>20} {:>8}".format("", a["id"], b["id"], "change"))
+    def row(name, x, y, fmt="{:>20}"):
+        change = "%+.1f%%" % (100.0 * (y - x) / x) if isinstance(x, (int, float)) and isinstance(y, (int, float)) and x else ""
+        print(("{:<28} " + fmt + " " + fmt + " {:>8}").format(name, x if x is not None else "-", y if y is not None else "-", change))
+    row("label", a["label"] or "-", b["label"] or "-")
+    row("blocks", a["blocks"], b["blocks"])
+    row("seconds", a["seconds"], b["seconds"])
+    row("blocks/s", a["rate"], b["rate"])
+    for seg in sorted(set(a["segments"]) | set(b["segments"]), key=int):
+        row("blocks/s from %s" % seg, a["segments"].get(seg), b["segments"].get(seg))
+    for name in sorted(set(a.get("vm", {})) | set(b.get("vm", {}))):
+        x, y = a["vm"].get(name), b["vm"].get(name)
+        if x != y: row("vm." + name, x, y)
+
+def watch(args):
+    source = args.args[0] if args.args else "-"
+    stream = sys.stdin if source == "-" else open(source, errors="replace")
+    monitor = Monitor(args.label, block_log_head(args.dir))
+    tty = sys.stdout.isatty()
+    last = 0.0
+    try:
+        for line in stream:
+            if not monitor.feed(line): continue
+            while monitor.finished:
+                result = monitor.finished.pop(0)
+                saved = not args.no_save and save_result(args.results, result)
+                print(("\n" if tty else "") + "Replay finished: " + summary(result) + (" (saved)" if saved else ""), flush=True)
+            #Reading a recorded log, only the end result matters
+            if source != "-": continue
+            now = time.monotonic()
+            if tty:
+                sys.stdout.write("\r\033[K" + monitor.status(args.dir))
+                sys.stdout.flush()
+            elif now - last >= args.interval:
+                print(time.strftime("%Y-%m-%d %H:%M:%S ") + monitor.status(args.dir), flush=True)
+                last = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stream is not sys.stdin: stream.close()
+    if tty and source == "-": print()
+    print(monitor.status(args.dir))
+
+def run(args):
+    if args.action == "watch": return watch(args)
+    runs = load_results(args.results)
+    if args.action == "runs":
+        for r in runs: print(summary(r))
+        return 0
+    ids = args.args or [r["id"] for r in runs[-2:]]
+    by_id = {r["id"]: r for r in runs}
+    if len(ids) != 2 or any(i not in by_id for i in ids): sys.exit("compare needs two saved runs, see: runs")
+    compare(by_id[ids[0]], by_id[ids[1]])
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
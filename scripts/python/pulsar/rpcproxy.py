@@ -0,0 +1,376 @@
+from collections import Counter, OrderedDict
+from urllib.parse import urlparse
+import asyncio, json, signal, sys, time
+
+RESIDENT = False
+
+#Caching JSON-RPC proxy for an RPC node. Read calls are answered from an LRU cache: blocks at or
+#below the last irreversible block never change and stay until evicted, everything else is valid
+#for the head block it was fetched at. Identical calls in flight at the same time share one
+#backend request, batches are unpacked so each call can hit the cache and the misses go to the
+#node as one batch, and broadcasts (anything not a read) pass straight through.
+
+READ_PREFIXES = ("get_", "lookup_", "find_", "list_")
+#Methods whose answer is fixed once the block named in the first param is irreversible
+BLOCK_METHODS = ("get_block", "get_block_header", "get_ops_in_block")
+HEAD_METHOD = "condenser_api.get_dynamic_global_properties"
+
+def add_arguments(parser):
+    parser.add_argument('--listen', help="Address and port to serve on", type=str, default="0.0.0.0:8080")
+    parser.add_argument('--backend', help="The RPC node, or \"nodes\": the best http node of PULSAR_NODES, followed as their ranking changes", type=str, default="http://127.0.0.1:8090")
+    parser.add_argument('--connections', help="Connections kept open to the backend", type=int, default=16)
+    parser.add_argument('--cache-mb', help="Size of the response cache", type=int, default=256)
+    parser.add_argument('--head-interval', help="Seconds between head block polls", type=float, default=1.0)
+    parser.add_argument('--stats-interval', help="Seconds between statistics lines on stderr, 0 for none", type=float, default=60.0)
+    parser.add_argument('--timeout', help="Backend timeout, in seconds", type=float, default=30.0)
+    parser.add_argument('--self-test', help="Check the head tracking, coalescing and batches against the bench's mock node, then exit", action='store_true')
+
+class BackendError(Exception):
+    pass
+
+class Backend:
+    #HTTP/1.1 keep-alive connections to the node, at most `size` requests at a time
+    def __init__(self, url, size, timeout):
+        self.url = url
+        self.size = size
+        u = urlparse(url)
+        self.host, self.port, self.path = u.hostname, u.port or (443 if u.scheme == "https" else 80), u.path or "/"
+        self.ssl = u.scheme == "https"
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+        self.requests = 0
+
+    async def post(self, body):
+        async with self.slots:
+            self.requests += 1
+            for attempt in (0, 1):
+                fresh = not self.idle
+                conn = self.idle.pop() if self.idle else await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl or None), self.timeout)
+                try:
+                    data = await asyncio.wait_for(self.exchange(conn, body), self.timeout)
+                    self.idle.append(conn)
+                    return data
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, BackendError) as e:
+                    conn[1].close()
+                    #A kept-alive connection may have been closed by the node: retry once on a new one
+                    if attempt or fresh: raise BackendError(str(e) or type(e).__name__)
+
+    async def exchange(self, conn, body):
+        reader, writer = conn
+        writer.write(b"POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % (self.path.encode(), self.host.encode(), len(body)) + body)
+        await writer.drain()
+        status, headers = await read_head(reader)
+        if status != 200: raise BackendError("HTTP %d from the node" % status)
+        if "content-length" in headers: return await reader.readexactly(int(headers["content-length"]))
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    return b"".join(parts)
+                parts.append(await reader.readexactly(size))
+                await reader.readline()
+        raise BackendError("Response without a length")
+
+async def read_head(reader):
+    line = await reader.readline()
+    if not line: raise asyncio.IncompleteReadError(b"", None)
+    first = line.decode("latin-1").split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""): break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    return (int(first[1]) if len(first) > 1 and first[1].isdigit() else 0), headers
+
+def normalize(call):
+    #condenser style "call" [api, method, params] and "api.method" params are the same request
+    method, params = call.get("method", ""), call.get("params", [])
+    if method == "call" and isinstance(params, list) and len(params) >= 2: method, params = "%s.%s" % (params[0], params[1]), params[2] if len(params) > 2 else []
+    return method, params
+
+def block_number(params):
+    p = params[0] if isinstance(params, list) and params else params.get("block_num") if isinstance(params, dict) else None
+    return p if isinstance(p, int) else None
+
+class Proxy:
+    def __init__(self, backend, cache_bytes):
+        self.backend = backend
+        self.cache = OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.size = 0
+        self.inflight = {}
+        self.head = None
+        self.irreversible = 0
+        self.stats = Counter()
+        self.methods = {}
+        self.started = time.time()
+
+    def count(self, method, what):
+        self.stats[what] += 1
+        self.methods.setdefault(method, Counter())[what] += 1
+
+    def lifetime(self, method, params):
+        #None: not cacheable, "final": until evicted, otherwise the head block it is valid for
+        name = method.rpartition(".")[2]
+        if not name.startswith(READ_PREFIXES): return None
+        if name in BLOCK_METHODS:
+            n = block_number(params)
+            if n is not None and n <= self.irreversible: return "final"
+        return self.head if self.head is not None else -1
+
+    def lookup(self, key, life):
+        entry = self.cache.get(key)
+        if entry is None: return None
+        if entry[0] != "final" and entry[0] != life:
+            self.drop(key)
+            return None
+        self.cache.move_to_end(key)
+        return entry[1]
+
+    def store(self, key, life, result):
+        if life is None or key in self.cache: return
+        self.cache[key] = (life, result)
+        self.size += len(key) + len(result)
+        while self.size > self.cache_bytes and self.cache: self.drop(next(iter(self.cache)))
+
+    def drop(self, key):
+        life, result = self.cache.pop(key)
+        self.size -= len(key) + len(result)
+
+    def new_head(self, props):
+        head = props.get("head_block_number")
+        if head is None or head == self.head: return
+        self.head, self.irreversible = head, props.get("last_irreversible_block_num", self.irreversible)
+        #Entries of older heads can't be hit any more
+        for key in [k for k, (life, _) in self.cache.items() if life != "final"]: self.drop(key)
+
+    async def handle(self, calls):
+        #Returns one raw JSON result or error per call, in order
+        out = [None] * len(calls)
+        misses, waits = [], []
+        for i, call in enumerate(calls):
+            if not isinstance(call, dict):
+                out[i] = b'{"code":-32600,"message":"Invalid Request"}', True
+                continue
+            method, params = normalize(call)
+            life = self.lifetime(method, params)
+            if life is None:
+                self.count(method, "passthrough")
+                misses.append((i, call, None, None, method))
+                continue
+            key = method + json.dumps(params, sort_keys=True, separators=(",", ":"))
+            hit = self.lookup(key, life)
+            if hit is not None:
+                self.count(method, "hit")
+                out[i] = hit, False
+            elif key in self.inflight:
+                self.count(method, "coalesced")
+                waits.append((i, self.inflight[key]))
+            else:
+                self.count(method, "miss")
+                future = asyncio.get_event_loop().create_future()
+                self.inflight[key] = future
+                misses.append((i, call, key, life, method))
+        if misses:
+            try:
+                replies = await self.forward([c for _, c, _, _, _ in misses])
+            except BaseException as e:
+                #Nobody may be left waiting on a request that will never complete
+                for _, _, key, _, _ in misses:
+                    future = self.inflight.pop(key, None) if key else None
+                    if future and not future.done(): future.set_exception(BackendError(str(e) or type(e).__name__))
+                raise
+            for (i, call, key, life, method), (raw, error) in zip(misses, replies):
+                out[i] = raw, error
+                if key is None: continue
+                if not error:
+                    if method == HEAD_METHOD:
+                        self.new_head(json.loads(raw))
+                        life = self.head
+                    self.store(key, life, raw)
+                future = self.inflight.pop(key)
+                if not future.done(): future.set_result((raw, error))
+        for i, future in waits:
+            try:
+                out[i] = await future
+            except BackendError as e:
+                out[i] = json.dumps({"code": -32000, "message": "Backend: %s" % e}).encode(), True
+        return out
+
+    async def forward(self, calls):
+        #One backend request for all the misses, raw JSON back per call
+        body = [dict(c, id=n) for n, c in enumerate(calls)]
+        try:
+            reply = json.loads(await self.backend.post(json.dumps(body[0] if len(body) == 1 else body).encode()))
+        except (BackendError, ValueError) as e:
+            self.stats["backend_errors"] += 1
+            return [(json.dumps({"code": -32000, "message": "Backend: %s" % e}).encode(), True)] * len(calls)
+        by_id = {r.get("id"): r for r in (reply if isinstance(reply, list) else [reply])}
+        out = []
+        for n in range(len(calls)):
+            r = by_id.get(n, {"error": {"code": -32000, "message": "No reply from the node"}})
+            out.append((json.dumps(r["result"]).encode(), False) if "result" in r else (json.dumps(r.get("error")).encode(), True))
+        return out
+
+    async def poll_head(self):
+        #Straight to the node: through handle() the poll is a cache hit for the head already known,
+        #so the head would never move
+        (raw, error), = await self.forward([{"jsonrpc": "2.0", "method": HEAD_METHOD, "params": []}])
+        if error: raise BackendError(raw.decode())
+        self.new_head(json.loads(raw))
+        self.store(HEAD_METHOD + "[]", self.head, raw)
+
+    def summary(self):
+        served = self.stats["hit"] + self.stats["coalesced"] + self.stats["miss"]
+        return {"uptime": int(time.time() - self.started), "head": self.head, "irreversible": self.irreversible, "cache_entries": len(self.cache), "cache_bytes": self.size,
+                "hit_ratio": round((self.stats["hit"] + self.stats["coalesced"]) / served, 4) if served else None, "backend_requests": self.backend.requests,
+                "counters": dict(self.stats), "methods": {m: dict(c) for m, c in sorted(self.methods.items())}}
+
+def envelope(call, raw, error):
+    cid = json.dumps(call.get("id") if isinstance(call, dict) else None).encode()
+    return b'{"jsonrpc":"2.0","id":' + cid + (b',"error":' if error else b',"result":') + raw + b"}"
+
+async def serve_client(proxy, reader, writer):
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except (OSError, ValueError):
+                break
+            if not line: break
+            parts = line.decode("latin-1").split()
+            headers = {}
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b"\n", b""): break
+                key, _, value = h.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/stats":
+                out = json.dumps(proxy.summary(), indent=4).encode()
+            else:
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    request = None
+                if request is None or request == []:
+                    out = b'{"jsonrpc":"2.0","id":null,"error":{"code":-32700,"message":"Parse error"}}'
+                else:
+                    calls = request if isinstance(request, list) else [request]
+                    replies = [envelope(c, raw, err) for c, (raw, err) in zip(calls, await proxy.handle(calls))]
+                    out = b"[" + b",".join(replies) + b"]" if isinstance(request, list) else replies[0]
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(out) + out)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close" or (len(parts) > 2 and parts[2] == "HTTP/1.0"): break
+    except (OSError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+def follow_best(proxy):
+    #A new backend for new requests, the ones in flight finish on the old one
+    from pulsar.nodes import get_manager
+    best = get_manager().best(ws=False, refresh=False)
+    old = proxy.backend
+    if best is None or best.url == old.url: return
+    proxy.backend = Backend(best.url, old.size, old.timeout)
+    proxy.backend.requests = old.requests
+    for conn in old.idle: conn[1].close()
+    sys.stderr.write("Backend: %s\n" % best.url)
+
+async def follow_head(proxy, interval, follow=False):
+    #Keeps the head known even when no client asks for it; the answer also fills the cache
+    while True:
+        if follow: follow_best(proxy)
+        try:
+            await proxy.poll_head()
+        except Exception as e:
+            sys.stderr.write("Head poll failed: %s\n" % e)
+        await asyncio.sleep(interval)
+
+async def report(proxy, interval):
+    while True:
+        await asyncio.sleep(interval)
+        s = proxy.summary()
+        sys.stderr.write("head %s  hit ratio %s  %d cached (%.1f MiB)  %d backend requests  %s\n" % (s["head"], s["hit_ratio"], s["cache_entries"], s["cache_bytes"] / 1048576.0,
+                         s["backend_requests"], " ".join("%s=%d" % kv for kv in sorted(s["counters"].items()))))
+
+async def self_test():
+    #The proxy against the bench's mock node, whose head is moved by hand
+    from pulsar.bench import USER, Fixtures, MockNode
+    node = MockNode(Fixtures(5), latency=0.05, jitter=0)
+    node.start()
+    proxy = Proxy(Backend(node.url, 4, 10), 1048576)
+    failed = []
+    def check(name, ok):
+        sys.stdout.write("%-10s %s\n" % (name, "ok" if ok else "FAILED"))
+        if not ok: failed.append(name)
+    try:
+        await proxy.poll_head()
+        first = proxy.head
+        node.fixtures.start -= 3
+        await proxy.poll_head()
+        (raw, _), = await proxy.handle([{"jsonrpc": "2.0", "id": 1, "method": HEAD_METHOD, "params": []}])
+        check("head", proxy.head == first + 1 and json.loads(raw)["head_block_number"] == proxy.head)
+
+        requests = node.counters()[0]
+        accounts = {"jsonrpc": "2.0", "id": 1, "method": "condenser_api.get_accounts", "params": [[USER]]}
+        replies = await asyncio.gather(*[proxy.handle([dict(accounts, id=i)]) for i in range(10)])
+        check("coalesce", node.counters()[0] == requests + 1 and proxy.stats["coalesced"] == 9 and len(set(r[0] for r in replies)) == 1)
+
+        requests = node.counters()[0]
+        batch = [accounts, {"jsonrpc": "2.0", "id": 2, "method": "call", "params": ["condenser_api", "get_block_header", [proxy.irreversible]]},
+                 {"jsonrpc": "2.0", "id": 3, "method": "condenser_api.get_block_header", "params": [proxy.head]},
+                 {"jsonrpc": "2.0", "id": 4, "method": "condenser_api.broadcast_transaction", "params": [{}]}]
+        once, again = await proxy.handle(batch), await proxy.handle(batch)
+        #One backend request per batch: the 3 misses and the broadcast, then the broadcast alone
+        check("batch", node.counters()[0] == requests + 2 and once[:3] == again[:3] and not any(error for _, error in once)
+              and json.loads(once[1][0])["previous"].startswith("%08x" % (proxy.irreversible - 1))
+              and json.loads(once[2][0])["previous"].startswith("%08x" % (proxy.head - 1)))
+
+        #The irreversible block outlives the head it was fetched at, the head block doesn't
+        node.fixtures.start -= 3
+        await proxy.poll_head()
+        requests = node.counters()[0]
+        await proxy.handle(batch[1:2])
+        kept = node.counters()[0] == requests
+        await proxy.handle(batch[2:3])
+        check("final", kept and node.counters()[0] == requests + 1)
+    finally:
+        for conn in proxy.backend.idle: conn[1].close()
+        node.stop()
+    if failed: sys.exit("Self-test failed: %s" % ", ".join(failed))
+
+async def main(args):
+    follow = args.backend == "nodes"
+    if follow:
+        from pulsar.nodes import get_manager
+        best = get_manager().best(ws=False)
+        if best is None: sys.exit("No http node in PULSAR_NODES")
+        get_manager().start()
+    proxy = Proxy(Backend(best.url if follow else args.backend, args.connections, args.timeout), args.cache_mb * 1048576)
+    host, _, port = args.listen.rpartition(":")
+    server = await asyncio.start_server(lambda r, w: serve_client(proxy, r, w), host or "0.0.0.0", int(port))
+    tasks = [asyncio.ensure_future(follow_head(proxy, args.head_interval, follow))]
+    if args.stats_interval > 0: tasks.append(asyncio.ensure_future(report(proxy, args.stats_interval)))
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM): asyncio.get_event_loop().add_signal_handler(sig, stop.set)
+    sys.stderr.write("Proxying %s on %s (stats: GET /stats)\n" % (proxy.backend.url, args.listen))
+    await stop.wait()
+    for t in tasks: t.cancel()
+    server.close()
+    await server.wait_closed()
+
+def run(args):
+    #asyncio.run and get_running_loop are 3.7+, Ubuntu 18.04 has 3.6
+    if args.self_test: return asyncio.get_event_loop().run_until_complete(self_test())
+    try:
+        asyncio.get_event_loop().run_until_complete(main(args))
+    except (OSError, ValueError) as e:
+        sys.exit("Can't listen on %s: %s" % (args.listen, e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
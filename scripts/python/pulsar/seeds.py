@@ -0,0 +1,221 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse, difflib, json, os, re, socket, statistics, sys, time
+from pulsar.util import cache_path
+
+RESIDENT = False
+
+#Ranks p2p seed nodes from this host: the seeds of config.ini, the peers the node connected to
+#(from the log store, see: logstore) and every peer probed before, all probed at once. A probe is
+#a few TCP connects to the p2p port and, where the peer also serves RPC, its head block lag. Each
+#run is kept per peer, so a peer that often fails or is slow only on some runs is demoted rather
+#than ranked on its last good probe. --apply writes the best ones as the p2p-seed-node lines.
+
+HISTORY = cache_path("seeds.json")
+P2P_PORT = 2001
+#Probes kept per peer, and how much an older one counts compared to the next newer one
+KEEP = 20
+DECAY = 0.8
+#Peers without a successful probe for that long are forgotten
+FORGET = 30 * 86400
+#A block behind costs as much as this many ms of connect time
+LAG_MS = 50
+SEED_LINE = re.compile(r"^\s*p2p-seed-node\s*=\s*(\S+)\s*(#.*)?$")
+PEER = re.compile(r"(\d{1,3}(?:\.\d{1,3}){3}):(\d+)")
+
+def add_arguments(parser):
+    parser.add_argument('action', help="probe: probe and rank the candidates, history: past probes per peer", choices=['probe', 'history'], nargs='?', default='probe')
+    parser.add_argument('--config', help="config.ini whose p2p-seed-node lines are probed and rewritten", type=str)
+    parser.add_argument('--seed', help="Another candidate, host:port, can be repeated", type=str, action='append', default=[])
+    parser.add_argument('--logs', help="Log store to take the connected peers from (see: logstore)", type=str)
+    parser.add_argument('--p2p', help="pulsard's p2p log, ingested into --logs first", type=str)
+    parser.add_argument('--since', help="Peers seen in the logs over this period: 90m, 12h, 7d ...", type=str, default="7d")
+    parser.add_argument('--rpc-port', help="Port asked for the head block of a peer, 0: don't", type=int, default=8090)
+    parser.add_argument('--attempts', help="TCP connects per peer", type=int, default=3)
+    parser.add_argument('--timeout', help="Seconds per connect or RPC call", type=float, default=2.0)
+    parser.add_argument('--workers', help="Peers probed at the same time", type=int, default=32)
+    parser.add_argument('--count', help="Seeds to keep in config.ini", type=int, default=5)
+    parser.add_argument('--min-up', help="Share of recent probes a peer must have answered to be ranked with the reliable ones", type=float, default=0.75)
+    parser.add_argument('--apply', help="Write the ranked seeds to config.ini (the old one is kept as config.ini.bak)", action='store_true')
+    parser.add_argument('--history-file', help="Probe history. Default: " + HISTORY, type=str, default=HISTORY)
+
+def split(endpoint):
+    host, _, port = endpoint.rpartition(":")
+    return (host, int(port)) if host and port.isdigit() else (endpoint, P2P_PORT)
+
+def config_seeds(text):
+    #endpoint -> comment, in file order
+    out = {}
+    for line in text.splitlines():
+        m = SEED_LINE.match(line)
+        if m: out["%s:%d" % split(m.group(1))] = (m.group(2) or "").lstrip("#").strip()
+    return out
+
+def log_peers(args):
+    #Endpoints the node was connected to; inbound peers show their outgoing port, so the default p2p
+    #port of the same address is tried as well
+    from pulsar import logstore
+    try:
+        db = logstore.open_store(args.logs)
+    except (OSError, logstore.sqlite3.Error) as e:
+        sys.exit("%s: %s" % (args.logs, e))
+    try:
+        if args.p2p: logstore.ingest(db, argparse.Namespace(docker=None, p2p=args.p2p), quiet=True)
+        since = logstore.parse_when(args.since)
+        rows = db.execute("SELECT subject FROM events WHERE type = 'peer_connect' AND t >= ? GROUP BY subject ORDER BY MAX(t) DESC", (since,)).fetchall()
+    except (logstore.LogStoreError, OSError) as e:
+        sys.exit(str(e))
+    finally:
+        db.close()
+    out = []
+    for (subject,) in rows:
+        m = PEER.search(subject or "")
+        if m: out += ["%s:%s" % m.groups(), "%s:%d" % (m.group(1), P2P_PORT)]
+    return list(dict.fromkeys(out))
+
+def connect_time(host, port, timeout):
+    start = time.perf_counter()
+    with socket.create_connection((host, port), timeout=timeout):
+        return time.perf_counter() - start
+
+def probe(endpoint, args):
+    #Best of a few connects (the first may pay for ARP or a cold route), then the head over RPC
+    host, port = split(endpoint)
+    times, error = [], None
+    for _ in range(max(1, args.attempts)):
+        try:
+            times.append(connect_time(host, port, args.timeout))
+        except OSError as e:
+            error = str(e) or type(e).__name__
+    head = None
+    if times and args.rpc_port:
+        from pulsar.nodes import Endpoint
+        ep = Endpoint("http://%s:%d" % (host, args.rpc_port), timeout=args.timeout).probe()
+        ep._drop()
+        head = ep.head
+    return {"rtt": min(times) if times else None, "failed": max(1, args.attempts) - len(times), "head": head, "error": None if times else error}
+
+def reference_head():
+    #The network's head from the RPC nodes, so a group of lagging seeds isn't its own reference
+    from pulsar.nodes import get_manager, PROBE_METHOD
+    try:
+        return int(get_manager().call(PROBE_METHOD, timeout=5)["head_block_number"])
+    except Exception:
+        return None
+
+def load_history(path):
+    try:
+        with open(path) as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".%d" % os.getpid()
+    with open(tmp, "w") as f: json.dump(history, f)
+    os.replace(tmp, path)
+
+def rate(probes, min_up):
+    #probes: [t, rtt, lag, failed connects, attempts], oldest first
+    weights = [DECAY ** i for i in range(len(probes))][::-1]
+    up = sum(w * (1 - p[3] / p[4]) for w, p in zip(weights, probes)) / sum(weights)
+    rtts = [p[1] for p in probes if p[1] is not None]
+    rtt = statistics.median(rtts) * 1000 if rtts else None
+    latest = probes[-1]
+    lag = latest[2]
+    if latest[1] is None: status = "down"
+    elif up < min_up: status = "flaky"
+    else: status = "ok"
+    #Connect time plus head lag, scaled up by the probes that failed
+    score = (rtt + LAG_MS * max(0, lag or 0)) / max(up, 0.05) ** 2 if rtt is not None else float("inf")
+    return {"up": up, "rtt": rtt, "lag": lag, "status": status, "score": score, "probes": len(probes)}
+
+def seeded_config(text, seeds, comments):
+    #All the p2p-seed-node lines give way to seeds, written where the first one was
+    lines = text.splitlines(True)
+    new = []
+    for s in seeds:
+        comment = comments.get(s)
+        new.append(("p2p-seed-node = %-32s # %s\n" % (s, comment)) if comment else "p2p-seed-node = %s\n" % s)
+    found = [i for i, l in enumerate(lines) if SEED_LINE.match(l)]
+    if found: return "".join(lines[:found[0]] + new + [l for i, l in enumerate(lines) if i > found[0] and i not in found])
+    at = next((i + 1 for i, l in enumerate(lines) if re.match(r"^\s*p2p-endpoint\s*=", l)), len(lines))
+    if at == len(lines) and lines and not lines[-1].endswith("\n"): lines[-1] += "\n"
+    return "".join(lines[:at] + new + lines[at:])
+
+def show_history(history):
+    for endpoint, probes in sorted(history.get("peers", {}).items()):
+        print("%s (%s)" % (endpoint, history.get("sources", {}).get(endpoint, "")))
+        for t, rtt, lag, failed, attempts in probes[-10:]:
+            print("    %s  %s  lag %4s  %d/%d connects" % (time.strftime("%Y-%m-%d %H:%M", time.localtime(t)), "%8.1f ms" % (rtt * 1000) if rtt is not None else "    down   ",
+                                                          "-" if lag is None else lag, attempts - failed, attempts))
+
+def run(args):
+    history = load_history(args.history_file)
+    if args.action == "history":
+        show_history(history)
+        return 0
+    current, comments = "", {}
+    if args.config:
+        try:
+            with open(args.config) as f: current = f.read()
+        except OSError as e:
+            sys.exit("Can't read %s: %s" % (args.config, e))
+    configured = config_seeds(current)
+    comments.update({k: v for k, v in configured.items() if v})
+    sources = history.setdefault("sources", {})
+    peers = history.setdefault("peers", {})
+    candidates = {}
+    for s in configured: candidates[s] = "config"
+    for s in args.seed: candidates.setdefault("%s:%d" % split(s), "given")
+    if args.logs:
+        for s in log_peers(args): candidates.setdefault(s, "log")
+    fresh = set(candidates)
+    for s in peers: candidates.setdefault(s, sources.get(s, "history"))
+    if not candidates: sys.exit("No seeds to probe: give --config, --seed or --logs")
+
+    print("Probing %d peers..." % len(candidates), file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        top = pool.submit(reference_head) if args.rpc_port else None
+        results = dict(zip(candidates, pool.map(lambda s: probe(s, args), candidates)))
+        top = top.result() if top else None
+    heads = [r["head"] for r in results.values() if r["head"] is not None]
+    top = max(heads + ([top] if top else []), default=None)
+
+    now = time.time()
+    for s, r in results.items():
+        lag = top - r["head"] if r["head"] is not None and top is not None else None
+        peers[s] = (peers.get(s, []) + [[now, r["rtt"], lag, r["failed"], max(1, args.attempts)]])[-KEEP:]
+        if s in fresh and sources.get(s) != "config": sources[s] = candidates[s]
+    rated = {s: rate(peers[s], args.min_up) for s in results}
+    #Peers that stopped answering for good and are only known from the history
+    for s in [s for s, p in peers.items() if s not in fresh and not any(x[1] is not None and now - x[0] < FORGET for x in p)]:
+        del peers[s]
+        sources.pop(s, None)
+    save_history(args.history_file, history)
+
+    order = sorted(rated, key=lambda s: ({"ok": 0, "flaky": 1, "down": 2}[rated[s]["status"]], rated[s]["score"]))
+    chosen = [s for s in order if rated[s]["status"] != "down"][:args.count]
+    print("%-28s %-7s %10s %6s %6s %7s  %s" % ("peer", "source", "connect", "lag", "up", "probes", "status"))
+    for s in order:
+        r = rated[s]
+        print("%-28s %-7s %10s %6s %5.0f%% %7d  %s%s" % (s, candidates[s], "%.1f ms" % r["rtt"] if r["rtt"] is not None else "-", "-" if r["lag"] is None else r["lag"],
+                                                      r["up"] * 100, r["probes"], r["status"], "  *" if s in chosen else "" if r["status"] != "down" else "  " + (results[s]["error"] or "")))
+    if not args.config: return 0
+    if not chosen: sys.exit("No seed answered, %s left alone" % args.config)
+    for s in chosen:
+        if s not in comments and candidates[s] == "log": comments[s] = "seen in the p2p log"
+    seeded = seeded_config(current, chosen, comments)
+    diff = list(difflib.unified_diff(current.splitlines(True), seeded.splitlines(True), args.config, args.config + " (seeds)"))
+    sys.stdout.writelines(diff or ["The seeds of config.ini are already the best ones\n"])
+    if args.apply and diff:
+        try:
+            with open(args.config + ".bak", "w") as f: f.write(current)
+            tmp = args.config + ".%d" % os.getpid()
+            with open(tmp, "w") as f: f.write(seeded)
+            os.replace(tmp, args.config)
+        except OSError as e:
+            sys.exit("Can't write %s: %s" % (args.config, e))
+        print("Written %s (restart the node to use it)" % args.config)
+    return 0
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
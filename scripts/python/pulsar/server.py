@@ -0,0 +1,102 @@
+from contextlib import redirect_stdout, redirect_stderr
+from importlib import import_module
+import io, json, os, socket, sys, traceback
+
+RESIDENT = False
+
+def add_arguments(parser):
+    parser.add_argument('--stop', help="Stop the resident server listening on --socket", action='store_true')
+    parser.add_argument('--idle-timeout', help="Exit after this many seconds without a request, 0 means never", type=int, default=0)
+
+def execute(req):
+    #Runs one forwarded command in this process, the connection and imports stay warm
+    from pulsar import cli, client
+    argv = req["argv"]
+    out, err = io.StringIO(), io.StringIO()
+    command = next((a for a in argv if a in cli.COMMANDS), None)
+    if command is None or not getattr(import_module(cli.COMMANDS[command][0]), "RESIDENT", False):
+        return 2, "", "Command can't run in the resident server: " + " ".join(argv) + "\n"
+
+    cwd = os.getcwd()
+    try:
+        os.chdir(req.get("cwd") or cwd)
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                code = cli.main(argv, resident=False)
+            except SystemExit as e:
+                code = e.code
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            if code is not None and not isinstance(code, int):
+                print(code, file=sys.stderr)
+                code = 1
+            if req.get("stats") and client.rpc_calls: print(client.stats_line(), file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        client.reset()
+    return code or 0, out.getvalue(), err.getvalue()
+
+def alive(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+def stop(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except OSError:
+        sys.exit("No resident server listening on " + path)
+    with s:
+        s.sendall(json.dumps({"stop": True}).encode() + b"\n")
+        s.recv(65536)
+
+def run(args):
+    if args.stop: return stop(args.socket)
+
+    if os.path.exists(args.socket):
+        if alive(args.socket): sys.exit("A resident server is already listening on " + args.socket)
+        os.unlink(args.socket)
+
+    #Pay for the imports and the connection once
+    from pulsar import client
+    import beem.account, beem.witness, beem.transactionbuilder, beemgraphenebase.account
+    client.get_steem()
+    from pulsar.nodes import get_manager
+    get_manager().start()
+
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        srv.bind(args.socket)
+    finally:
+        os.umask(umask)
+    srv.listen(16)
+    if args.idle_timeout: srv.settimeout(args.idle_timeout)
+    print("Resident server listening on " + args.socket, file=sys.stderr)
+
+    try:
+        while True:
+            try:
+                conn, _ = srv.accept()
+            except socket.timeout:
+                break
+            with conn:
+                conn.settimeout(None)
+                req = json.loads(conn.makefile("rb").readline().decode() or "{}")
+                if req.get("stop"):
+                    conn.sendall(b'{"code": 0, "stdout": "", "stderr": ""}')
+                    break
+                code, out, err = execute(req)
+                conn.sendall(json.dumps({"code": code, "stdout": out, "stderr": err}).encode())
+    finally:
+        srv.close()
+        if os.path.exists(args.socket): os.unlink(args.socket)
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,314 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import errno, fcntl, hashlib, json, os, shutil, sys, time, zlib
+from pulsar.util import plugins, window
+
+RESIDENT = False
+
+#A snapshot is a directory with a copy of shared_memory.bin/.meta and a manifest.json holding the
+#block_log height it matches, the plugins that built it and a sha256 per chunk of every file.
+#The copy is a reflink when the filesystem can share extents (btrfs, xfs), otherwise shared_memory.bin
+#is stored as concatenated gzip members, one per chunk, compressed and restored by a thread pool
+#(zlib releases the GIL). Chunks without data (holes of the sparse file) are neither read nor stored.
+
+CHUNK = 32 * 1024 * 1024
+FICLONE = 0x40049409
+FILES = ("shared_memory.bin", "shared_memory.meta")
+
+def add_arguments(parser):
+    parser.add_argument('action', help="create: snapshot the (stopped) node state, restore: put a snapshot back, list: show snapshots, verify: check a snapshot's checksums", choices=['create', 'restore', 'list', 'verify'])
+    parser.add_argument('name', help="Snapshot name. Default: block height and date for create, the latest snapshot otherwise", type=str, nargs='?')
+    parser.add_argument('--dir', help="Directory with block_log and shared_memory.bin", type=str, required=True)
+    parser.add_argument('--snapshots', help="Directory holding the snapshots", type=str, required=True)
+    parser.add_argument('--config', help="config.ini of the node, its plugins are recorded and compared on restore", type=str)
+    parser.add_argument('--method', help="auto: reflink if supported, gzip otherwise", choices=['auto', 'reflink', 'sparse', 'gzip'], default='auto')
+    parser.add_argument('--level', help="gzip compression level", type=int, default=1)
+    parser.add_argument('--threads', help="Threads compressing, copying and hashing. Default: number of CPUs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--replay-seconds', help="Duration of the replay that built this state, to report the time saved on restore", type=float)
+    parser.add_argument('--force', help="Restore even if the plugins in config.ini differ from the snapshot's", action='store_true')
+
+class SnapshotError(Exception):
+    pass
+
+def chunks(fd, size):
+    #(offset, length, has data) for every chunk, using SEEK_DATA/SEEK_HOLE when the filesystem knows them
+    data = []
+    try:
+        pos = 0
+        while pos < size:
+            start = os.lseek(fd, pos, os.SEEK_DATA)
+            pos = os.lseek(fd, start, os.SEEK_HOLE)
+            data.append((start, pos))
+    except OSError as e:
+        if e.errno not in (errno.ENXIO, errno.EINVAL, errno.EOPNOTSUPP): raise
+        if e.errno != errno.ENXIO: data = [(0, size)]
+    except AttributeError:
+        data = [(0, size)]
+    out, i = [], 0
+    for off in range(0, size, CHUNK):
+        end = min(off + CHUNK, size)
+        while i < len(data) and data[i][1] <= off: i += 1
+        out.append((off, end - off, i < len(data) and data[i][0] < end))
+    return out
+
+def pread(fd, n, off):
+    parts = []
+    while n:
+        b = os.pread(fd, min(n, 8 * 1024 * 1024), off)
+        if not b: raise SnapshotError("Unexpected end of file")
+        parts.append(b)
+        n -= len(b)
+        off += len(b)
+    return b"".join(parts)
+
+_zeros = {}
+
+def zero_digest(n):
+    if n not in _zeros: _zeros[n] = hashlib.sha256(bytes(n)).hexdigest()
+    return _zeros[n]
+
+def hash_chunk(fd, off, n):
+    return hashlib.sha256(pread(fd, n, off)).hexdigest()
+
+def reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst)
+    return False
+
+def sparse_copy(pool, src, dst, table):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        size = os.fstat(s.fileno()).st_size
+        d.truncate(size)
+        def copy(c):
+            off, n, has_data = c
+            if not has_data: return
+            done = 0
+            while done < n:
+                try:
+                    k = os.copy_file_range(s.fileno(), d.fileno(), n - done, off + done, off + done)
+                except (AttributeError, OSError):
+                    k = os.pwrite(d.fileno(), pread(s.fileno(), n - done, off + done), off + done)
+                if not k: raise SnapshotError("Short copy of " + src)
+                done += k
+        list(pool.map(copy, table))
+
+def store(pool, src, dst, method, level, threads):
+    #Copies src into the snapshot, returns its manifest entry
+    with open(src, "rb") as s:
+        fd = s.fileno()
+        size = os.fstat(fd).st_size
+        table = chunks(fd, size)
+        entry = {"size": size, "chunks": [{"hole": not c[2]} for c in table]}
+        if method == "gzip":
+            #Each chunk is read once, hashed and compressed by the same thread
+            def compress(c):
+                if not c[2]: return zero_digest(c[1]), b""
+                data = pread(fd, c[1], c[0])
+                z = zlib.compressobj(level, zlib.DEFLATED, 31)
+                return hashlib.sha256(data).hexdigest(), z.compress(data) + z.flush()
+            entry["stored"] = os.path.basename(dst) + ".gz"
+            with open(dst + ".gz", "wb") as out:
+                for c, (digest, blob) in zip(entry["chunks"], window(pool, compress, table, threads + 2)):
+                    out.write(blob)
+                    c["sha256"], c["length"] = digest, len(blob)
+            return entry
+        digests = pool.map(lambda c: hash_chunk(fd, c[0], c[1]) if c[2] else zero_digest(c[1]), table)
+        for c, digest in zip(entry["chunks"], digests): c["sha256"] = digest
+    entry["stored"] = os.path.basename(dst)
+    if method != "reflink" or not reflink(src, dst):
+        if method == "reflink": raise SnapshotError("The filesystem can't reflink %s, use --method gzip or sparse" % src)
+        sparse_copy(pool, src, dst, table)
+    return entry
+
+def check_file(pool, path, entry):
+    with open(path, "rb") as f:
+        fd = f.fileno()
+        if os.fstat(fd).st_size != entry["size"]: raise SnapshotError("%s has the wrong size" % path)
+        offsets = range(0, entry["size"], CHUNK)
+        digests = pool.map(lambda off: hash_chunk(fd, off, min(CHUNK, entry["size"] - off)), offsets)
+        for i, (c, h) in enumerate(zip(entry["chunks"], digests)):
+            if c["sha256"] != h: raise SnapshotError("%s: checksum mismatch in chunk %d" % (path, i))
+
+def check_gzip(pool, path, entry):
+    for _ in unpack(pool, path, entry): pass
+
+def unpack(pool, path, entry, fd_out=None):
+    #Decompresses and checks every chunk in parallel, writes them to fd_out if given
+    with open(path, "rb") as f:
+        fd = f.fileno()
+        jobs, pos = [], 0
+        for i, c in enumerate(entry["chunks"]):
+            jobs.append((i, pos, c))
+            pos += c.get("length", 0)
+        def one(job):
+            i, pos, c = job
+            n = min(CHUNK, entry["size"] - i * CHUNK)
+            if c["hole"]: return i
+            try:
+                data = zlib.decompress(pread(fd, c["length"], pos), 31)
+            except zlib.error as e:
+                raise SnapshotError("%s: chunk %d doesn't decompress: %s" % (path, i, e))
+            if len(data) != n or hashlib.sha256(data).hexdigest() != c["sha256"]: raise SnapshotError("%s: checksum mismatch in chunk %d" % (path, i))
+            if fd_out is not None: os.pwrite(fd_out, data, i * CHUNK)
+            return i
+        yield from pool.map(one, jobs)
+
+def load(snapshots, name):
+    if name is None:
+        found = listing(snapshots)
+        if not found: raise SnapshotError("No snapshots in " + snapshots)
+        name = found[-1]["name"]
+    path = os.path.join(snapshots, name)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f: return path, json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError("Can't read the manifest of %s: %s" % (name, e))
+
+def listing(snapshots):
+    found = []
+    for name in os.listdir(snapshots) if os.path.isdir(snapshots) else []:
+        try:
+            path = os.path.join(snapshots, name, "manifest.json")
+            with open(path) as f: found.append((os.path.getmtime(path), json.load(f)))
+        except (OSError, ValueError):
+            pass
+    return [m for _, m in sorted(found, key=lambda t: t[0])]
+
+def allocated(snapshots, manifest):
+    #Disk space really used: reflinked and sparse copies are mostly shared extents and holes
+    return sum(os.stat(os.path.join(snapshots, manifest["name"], e["stored"])).st_blocks * 512 for e in manifest["files"].values())
+
+def block_log_head(directory):
+    from pulsar.blocklog import BlockLog, BlockLogError
+    try:
+        with BlockLog(directory) as log:
+            head = log.head
+            return head, log.block(head).id.hex() if head else None
+    except BlockLogError as e:
+        raise SnapshotError(str(e))
+
+def block_id(directory, num):
+    from pulsar.blocklog import BlockLog, BlockLogError
+    try:
+        with BlockLog(directory) as log: return log.block(num).id.hex()
+    except BlockLogError:
+        return None
+
+def replay_estimate(snapshots, head):
+    #Seconds a replay up to head would take, from the most recent measured replay
+    for m in reversed(listing(snapshots)):
+        if m.get("replay_seconds") and m["block_log"]["head"]:
+            return m["replay_seconds"] * head / m["block_log"]["head"], m
+    return None, None
+
+def create(args, pool):
+    for f in FILES:
+        if not os.path.exists(os.path.join(args.dir, f)): raise SnapshotError("No %s in %s" % (f, args.dir))
+    head, head_id = block_log_head(args.dir)
+    name = args.name or "%d-%s" % (head, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    path = os.path.join(args.snapshots, name)
+    if os.path.exists(path): raise SnapshotError("Snapshot %s already exists" % name)
+    tmp = path + ".partial"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    method = args.method
+    if method == "auto":
+        probe = os.path.join(tmp, ".reflink")
+        method = "reflink" if reflink(os.path.join(args.dir, "shared_memory.meta"), probe) else "gzip"
+        if os.path.exists(probe): os.remove(probe)
+    started = time.perf_counter()
+    try:
+        files = {}
+        for f in FILES:
+            #The small .meta file is always copied as is
+            files[f] = store(pool, os.path.join(args.dir, f), os.path.join(tmp, f), method if f == "shared_memory.bin" else "sparse", args.level, args.threads)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    manifest = {
+        "name": name,
+        "created": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+        "method": method,
+        "chunk_size": CHUNK,
+        "block_log": {"head": head, "head_id": head_id},
+        "plugins": plugins(args.config),
+        "replay_seconds": args.replay_seconds,
+        "snapshot_seconds": round(time.perf_counter() - started, 1),
+        "files": files,
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f: json.dump(manifest, f, indent=4)
+    os.rename(tmp, path)
+    print("Snapshot %s of block %d taken in %.1fs (%s, %.1f MiB on disk for %.1f MiB)" % (name, head, manifest["snapshot_seconds"], method, allocated(args.snapshots, manifest) / 1048576.0, files["shared_memory.bin"]["size"] / 1048576.0))
+
+def verify(path, manifest, pool):
+    for f, entry in manifest["files"].items():
+        stored = os.path.join(path, entry["stored"])
+        if stored.endswith(".gz"): check_gzip(pool, stored, entry)
+        else: check_file(pool, stored, entry)
+
+def restore(args, pool):
+    path, manifest = load(args.snapshots, args.name)
+    head = manifest["block_log"]["head"]
+    current, _ = block_log_head(args.dir)
+    #The node refuses a state whose head block isn't in block_log, or isn't the same block
+    if current < head: raise SnapshotError("block_log only has %d blocks, the snapshot is at block %d" % (current, head))
+    if head and block_id(args.dir, head) != manifest["block_log"]["head_id"]: raise SnapshotError("Block %d in block_log isn't the one the snapshot was taken at" % head)
+    wanted, current_plugins = manifest.get("plugins"), plugins(args.config)
+    if wanted is not None and current_plugins is not None and wanted != current_plugins and not args.force:
+        raise SnapshotError("The snapshot was built with plugins: %s\nconfig.ini has: %s\nUse --force to restore anyway" % (" ".join(wanted), " ".join(current_plugins)))
+
+    started = time.perf_counter()
+    for f, entry in manifest["files"].items():
+        stored = os.path.join(path, entry["stored"])
+        dst = os.path.join(args.dir, f)
+        tmp = dst + ".restoring"
+        try:
+            if stored.endswith(".gz"):
+                with open(tmp, "wb") as out:
+                    out.truncate(entry["size"])
+                    for _ in unpack(pool, stored, entry, out.fileno()): pass
+            else:
+                if not (manifest["method"] == "reflink" and reflink(stored, tmp)):
+                    with open(stored, "rb") as s: table = chunks(s.fileno(), entry["size"])
+                    sparse_copy(pool, stored, tmp, table)
+                check_file(pool, tmp, entry)
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+        os.replace(tmp, dst)
+    elapsed = time.perf_counter() - started
+
+    print("Restored snapshot %s (block %d) in %.1fs, block_log is at %d" % (manifest["name"], head, elapsed, current))
+    estimate, measured = replay_estimate(args.snapshots, current)
+    if estimate is None:
+        print("No replay time recorded yet: take a snapshot right after a replay to measure the time saved")
+    else:
+        print("A replay to block %d takes about %.0fs (measured %.0fs for %d blocks, snapshot of %s): %.0fs saved" % (current, estimate, measured["replay_seconds"], measured["block_log"]["head"], measured["created"], estimate - elapsed))
+
+def run(args):
+    try:
+        if args.action == "list":
+            for m in listing(args.snapshots):
+                stored = allocated(args.snapshots, m)
+                replay = "replay %.0fs" % m["replay_seconds"] if m.get("replay_seconds") else ""
+                print("{:<30} block {:>10}  {}  {:<7} {:>10.1f} MiB  {}".format(m["name"], m["block_log"]["head"], m["created"], m["method"], stored / 1048576.0, replay))
+            return 0
+        with ThreadPoolExecutor(max_workers=max(1, args.threads)) as pool:
+            if args.action == "create":
+                create(args, pool)
+            elif args.action == "restore":
+                restore(args, pool)
+            else:
+                path, manifest = load(args.snapshots, args.name)
+                started = time.perf_counter()
+                verify(path, manifest, pool)
+                print("Snapshot %s is intact (%.1fs)" % (manifest["name"], time.perf_counter() - started))
+    except (SnapshotError, OSError) as e:
+        sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
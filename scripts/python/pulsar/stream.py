@@ -0,0 +1,259 @@
+from concurrent.futures import ThreadPoolExecutor
+import json, os, queue, sys, threading, time
+from pulsar.util import window
+
+RESIDENT = False
+
+#Follows the chain over the node's websocket (or http) endpoint. The backlog up to the head is
+#fetched in batched ranges by a pool of connections and delivered in order; after that the head
+#is polled once per block interval on the same connection (the node has no block subscription
+#over appbase) and any gap is fetched the same way. Connection errors move to the next node after
+#a backoff and resume from the last delivered block. Events go through a bounded queue, so a slow
+#consumer stops the fetching instead of filling memory.
+#
+#    for event in BlockStream(urls, start=n).events(): ...
+#    async for event in BlockStream(urls).aevents(): ...
+#
+#Events: {"type": "block", "num", "block"}, {"type": "irreversible", "num"} when the last
+#irreversible block moves, {"type": "fork", "num"} when blocks after num were replaced.
+
+BLOCK_INTERVAL = 3
+END = object()
+
+def add_arguments(parser):
+    parser.add_argument('action', help="follow: print blocks or operations as NDJSON, bench: catch-up speed against a local mock node", choices=['follow', 'bench'])
+    parser.add_argument('--node', help="Node to follow, can be repeated. Default: REMOTE_WS, the local ws endpoint, then PULSAR_NODES", type=str, action='append', default=[])
+    parser.add_argument('--start', help="First block. Default: the head block, negative: that many blocks before the head", type=int)
+    parser.add_argument('--ops', help="Print operations instead of block summaries", action='store_true')
+    parser.add_argument('--irreversible', help="Only deliver irreversible blocks (no forks)", action='store_true')
+    parser.add_argument('--workers', help="Connections used for the catch-up", type=int, default=8)
+    parser.add_argument('--batch', help="Blocks per request", type=int, default=50)
+    parser.add_argument('--buffer', help="Events buffered ahead of the consumer", type=int, default=1000)
+    parser.add_argument('--blocks', help="bench: blocks to catch up", type=int, default=20000)
+    parser.add_argument('--latency', help="bench: mock node latency per request, in ms", type=float, default=20.0)
+
+class StreamError(Exception):
+    pass
+
+def default_urls():
+    urls = [os.environ.get("REMOTE_WS"), "ws://127.0.0.1:8089"] + os.environ.get("PULSAR_NODES", "").split(",")
+    return [u.strip() for u in dict.fromkeys(filter(None, urls)) if u.strip()]
+
+class BlockStream:
+    def __init__(self, urls, start=None, workers=8, batch=50, buffer=1000, irreversible=False, timeout=10, max_backoff=30):
+        from pulsar.nodes import Endpoint
+        if not urls: raise StreamError("No node to follow")
+        self.endpoints = [Endpoint(u, timeout=timeout) for u in urls]
+        self.current = 0
+        self.start = start
+        self.workers = max(1, workers)
+        self.batch = max(1, batch)
+        self.irreversible_only = irreversible
+        self.max_backoff = max_backoff
+        self.queue = queue.Queue(maxsize=max(1, buffer))
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+        #num -> block id of the delivered blocks that can still be replaced by a fork
+        self.recent = {}
+        self.last = None
+        self.lib = 0
+        self.fetched = 0
+
+    @property
+    def ep(self):
+        return self.endpoints[self.current]
+
+    def retry(self, fn, *args):
+        #Same call on the next node after a backoff, until it works or the stream is stopped
+        delay = 0.5
+        while not self.stop_event.is_set():
+            try:
+                return fn(*args)
+            except Exception as e:
+                self.ep._drop()
+                sys.stderr.write("%s: %s, retrying in %.1fs\n" % (self.ep.url, e, delay))
+                self.current = (self.current + 1) % len(self.endpoints)
+                self.stop_event.wait(delay)
+                delay = min(self.max_backoff, delay * 2)
+        raise StreamError("stopped")
+
+    def props(self):
+        from pulsar.nodes import RPCError
+        try:
+            return self.ep.call("condenser_api.get_dynamic_global_properties")
+        except RPCError as e:
+            raise StreamError(str(e))
+
+    def fetch(self, first, last, ep=None):
+        #Blocks first..last in one batched request
+        from pulsar.nodes import payload
+        ep = ep or self.ep
+        calls = [payload("condenser_api.get_block", [n]) for n in range(first, last + 1)]
+        by_id = {r.get("id"): r for r in ep.request(calls)}
+        out = []
+        for c in calls:
+            block = by_id.get(c["id"], {}).get("result")
+            if not block: raise StreamError("block %d isn't available on %s" % (c["params"][0], ep.url))
+            out.append(block)
+        self.fetched += len(out)
+        return out
+
+    def put(self, event):
+        #Blocks while the consumer is behind
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(event, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        raise StreamError("stopped")
+
+    def deliver(self, num, block):
+        self.put({"type": "block", "num": num, "block": block})
+        self.recent[num] = block.get("block_id")
+        self.last = num
+        for n in [n for n in self.recent if n <= self.lib]: del self.recent[n]
+
+    def mark(self, lib):
+        lib = min(lib, self.last if self.last is not None else lib)
+        if lib > self.lib:
+            self.lib = lib
+            self.put({"type": "irreversible", "num": lib})
+            for n in [n for n in self.recent if n <= lib]: del self.recent[n]
+
+    def catch_up(self, first, last):
+        #Ranges fetched concurrently, each worker thread with its own connection, delivered in order
+        ranges = [(a, min(a + self.batch - 1, last)) for a in range(first, last + 1, self.batch)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for blocks in window(pool, lambda r: self.retry(self.fetch, *r), ranges, self.workers * 2):
+                for block in blocks:
+                    num = int(block["block_id"][:8], 16)
+                    if not self.linked(num, block): return num
+                    self.deliver(num, block)
+                if self.stop_event.is_set(): return None
+        return None
+
+    def linked(self, num, block):
+        previous = self.recent.get(num - 1)
+        return previous is None or block.get("previous") == previous
+
+    def unwind(self, num):
+        #A fork replaced blocks up to num: walk back to the last block both chains share
+        while num - 1 in self.recent and num - 1 > self.lib:
+            block = self.retry(self.fetch, num - 1, num - 1)[0]
+            if block.get("block_id") == self.recent[num - 1]: break
+            del self.recent[num - 1]
+            num -= 1
+        self.last = num - 1
+        self.put({"type": "fork", "num": self.last})
+        return num
+
+    def produce(self):
+        try:
+            props = self.retry(self.props)
+            tip = props["last_irreversible_block_num"] if self.irreversible_only else props["head_block_number"]
+            if self.start is None: nxt = tip
+            elif self.start < 0: nxt = max(1, tip + self.start)
+            else: nxt = self.start
+            self.lib = min(props["last_irreversible_block_num"], nxt - 1)
+            while not self.stop_event.is_set():
+                if nxt <= tip:
+                    broken = self.catch_up(nxt, tip)
+                    nxt = self.unwind(broken) if broken is not None else (self.last or nxt - 1) + 1
+                    if broken is not None: continue
+                self.mark(props["last_irreversible_block_num"])
+                #Next poll just after the next block is due
+                self.stop_event.wait(BLOCK_INTERVAL / 2.0 if nxt <= tip else BLOCK_INTERVAL)
+                props = self.retry(self.props)
+                tip = props["last_irreversible_block_num"] if self.irreversible_only else props["head_block_number"]
+        except StreamError as e:
+            if not self.stop_event.is_set(): self.error = e
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self.queue.put(END, timeout=1)
+            except queue.Full:
+                pass
+
+    def events(self):
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+        try:
+            while True:
+                event = self.queue.get()
+                if event is END: break
+                yield event
+        finally:
+            self.stop()
+        if self.error is not None: raise StreamError(str(self.error))
+
+    def blocks(self):
+        for e in self.events():
+            if e["type"] == "block": yield e["num"], e["block"]
+
+    def operations(self):
+        for num, block in self.blocks():
+            for trx_id, tx in zip(block.get("transaction_ids", []), block.get("transactions", [])):
+                for op in tx["operations"]: yield num, trx_id, op
+
+    async def aevents(self):
+        import asyncio
+        #get_running_loop is 3.7+; inside a coroutine get_event_loop is the running loop too
+        loop = asyncio.get_event_loop()
+        it = self.events()
+        done = object()
+        try:
+            while True:
+                event = await loop.run_in_executor(None, next, it, done)
+                if event is done: break
+                yield event
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+
+def bench(args):
+    from pulsar.bench import Fixtures, MockNode
+    node = MockNode(Fixtures(21), args.latency / 1000, args.latency / 4000)
+    node.start()
+    print("Catching up %d blocks from a mock node with %.0f ms latency, %d blocks per request" % (args.blocks, args.latency, args.batch))
+    try:
+        for workers in sorted({1, 2, 4, 8, 16, args.workers}):
+            head = node.fixtures.head()
+            s = BlockStream([node.url], start=head - args.blocks + 1, workers=workers, batch=args.batch, buffer=args.buffer)
+            start, n = time.perf_counter(), 0
+            for num, _ in s.blocks():
+                n += 1
+                if num >= head: break
+            elapsed = time.perf_counter() - start
+            print("%3d workers  %8.0f blocks/s  (%d blocks in %.2fs)" % (workers, n / elapsed, n, elapsed))
+    finally:
+        node.stop()
+
+def run(args):
+    if args.action == "bench":
+        bench(args)
+        return 0
+    s = BlockStream(args.node or default_urls(), args.start, args.workers, args.batch, args.buffer, args.irreversible)
+    try:
+        for event in s.events():
+            if event["type"] != "block":
+                if not args.ops: print(json.dumps(event))
+                continue
+            block = event["block"]
+            if args.ops:
+                for trx_id, tx in zip(block.get("transaction_ids", []), block.get("transactions", [])):
+                    for op in tx["operations"]: print(json.dumps({"block": event["num"], "trx_id": trx_id, "op": op}))
+            else:
+                print(json.dumps({"type": "block", "num": event["num"], "id": block.get("block_id"), "timestamp": block.get("timestamp"), "witness": block.get("witness"),
+                                  "transactions": len(block.get("transactions", []))}))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    except StreamError as e:
+        sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
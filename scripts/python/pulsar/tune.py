@@ -0,0 +1,246 @@
+from datetime import datetime
+import difflib, json, math, os, random, re, socket, sys, time
+from pulsar.util import cache_path, plugins
+
+RESIDENT = False
+
+#Sizes config.ini and the kernel writeback settings for this host instead of fixed values: RAM and
+#cores from /proc, block_log size and growth, the enabled plugins and a short I/O probe of the data
+#directory. Every run is saved, so the growth and the disk can be followed over time.
+
+MEASUREMENTS = cache_path("tune.json")
+GIB = 1 << 30
+MIB = 1 << 20
+BLOCKS_PER_DAY = 28800
+#Rough shared memory to block_log ratios, only used until there is a shared_memory.bin to measure
+PLUGIN_WEIGHT = {"account_history": 2.0, "tags": 0.5, "follow": 0.5, "market_history": 0.1}
+RPC_PLUGINS = ("account_history_api", "tags_api", "follow_api", "market_history_api", "block_api")
+VM_KEYS = ("dirty_background_ratio", "dirty_background_bytes", "dirty_ratio", "dirty_bytes", "dirty_expire_centisecs", "dirty_writeback_centisecs")
+
+def add_arguments(parser):
+    parser.add_argument('action', help="show: measure and compare with the current settings, history: past measurements", choices=['show', 'history'], nargs='?', default='show')
+    parser.add_argument('--dir', help="Directory with block_log and shared_memory.bin", type=str)
+    parser.add_argument('--config', help="config.ini to tune", type=str)
+    parser.add_argument('--apply', help="Write the tuned config.ini (the old one is kept as config.ini.bak)", action='store_true')
+    parser.add_argument('--vm-only', help="Only the kernel settings, leave config.ini alone", action='store_true')
+    parser.add_argument('--sysctl', help="Write the tuned vm settings to this file, for sysctl -p", type=str)
+    parser.add_argument('--days', help="Days of growth shared-file-size must leave room for", type=int, default=180)
+    parser.add_argument('--flush-budget', help="Seconds the disk may take to write back all dirty pages", type=int, default=30)
+    parser.add_argument('--probe-size', help="MiB written by the I/O probe", type=int, default=256)
+    parser.add_argument('--probe-seconds', help="Duration of the random read probe", type=float, default=3.0)
+    parser.add_argument('--no-probe', help="Reuse the I/O figures of the last run", action='store_true')
+
+def meminfo():
+    out = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            out[key] = int(value.split()[0]) * 1024
+    return out
+
+def cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def vm_current():
+    out = {}
+    for name in VM_KEYS:
+        try:
+            with open("/proc/sys/vm/" + name) as f: out[name] = int(f.read())
+        except (OSError, ValueError):
+            pass
+    return out
+
+def file_sizes(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+    return st.st_size, st.st_blocks * 512
+
+def head_block(directory):
+    from pulsar.blocklog import BlockLog, BlockLogError
+    try:
+        with BlockLog(directory) as log: return log.head
+    except (BlockLogError, OSError, ValueError):
+        return None
+
+def probe(directory, size, seconds):
+    #Sequential write with fsync, then reads with the file dropped from the page cache: sequential,
+    #and 4 KiB reads at random offsets one at a time, like the page faults on shared_memory.bin
+    path = os.path.join(directory, ".pulsar-tune-probe")
+    buf = os.urandom(MIB)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        start = time.perf_counter()
+        for _ in range(size): os.write(fd, buf)
+        os.fsync(fd)
+        write = size * MIB / (time.perf_counter() - start)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        start = time.perf_counter()
+        for off in range(0, size * MIB, MIB): os.pread(fd, MIB, off)
+        read = size * MIB / (time.perf_counter() - start)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        pages = size * MIB // 4096
+        latencies = []
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end and len(latencies) < pages:
+            t = time.perf_counter()
+            os.pread(fd, 4096, random.randrange(pages) * 4096)
+            latencies.append(time.perf_counter() - t)
+    finally:
+        os.close(fd)
+        os.unlink(path)
+    latencies.sort()
+    return {"seq_write": int(write), "seq_read": int(read), "rand_read_iops": int(len(latencies) / sum(latencies)),
+            "rand_read_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3), "probe_mib": size}
+
+def growth(history, directory, size, head):
+    #block_log bytes per day: from the oldest measurement of the last 30 days, or the average since genesis
+    now = time.time()
+    for m in history:
+        if m["dir"] == directory and now - 30 * 86400 < m["time"] < now - 3600 and m["block_log"] and size > m["block_log"]:
+            return int((size - m["block_log"]) * 86400 / (now - m["time"])), "measured"
+    if head: return int(size / (head / BLOCKS_PER_DAY)), "average"
+    return 0, "none"
+
+def measure(args, history):
+    mem = meminfo()
+    block_log, _ = file_sizes(os.path.join(args.dir, "block_log"))
+    shm_size, shm_alloc = file_sizes(os.path.join(args.dir, "shared_memory.bin"))
+    head = head_block(args.dir) if block_log else None
+    per_day, source = growth(history, args.dir, block_log or 0, head)
+    m = {"time": int(time.time()), "host": socket.gethostname(), "dir": args.dir, "mem_total": mem["MemTotal"], "mem_available": mem.get("MemAvailable"),
+         "cpus": cpus(), "block_log": block_log, "head": head, "block_log_per_day": per_day, "growth_from": source,
+         "shared_memory": shm_size, "shared_memory_used": shm_alloc, "plugins": plugins(args.config) or [], "vm": vm_current()}
+    last = next((h["io"] for h in reversed(history) if h["dir"] == args.dir and h.get("io")), None)
+    if args.no_probe and last:
+        m["io"] = last
+    else:
+        st = os.statvfs(args.dir)
+        size = max(16, min(args.probe_size, st.f_bavail * st.f_frsize // MIB // 4))
+        m["io"] = probe(args.dir, size, args.probe_seconds)
+    return m
+
+def recommend(m, days, flush_budget):
+    plugins = set(m["plugins"])
+    #shared_memory.bin is sparse: the allocated part is what the state uses today
+    if m["shared_memory_used"]:
+        used = m["shared_memory_used"]
+        ratio = used / m["block_log"] if m["block_log"] else 0
+    else:
+        ratio = 1.0 + sum(w for p, w in PLUGIN_WEIGHT.items() if p in plugins)
+        used = (m["block_log"] or 0) * ratio
+    needed = (used + m["block_log_per_day"] * ratio * days) * 1.25
+    shared = max(2, int(math.ceil(needed / GIB)))
+    rpc = any(p in plugins for p in RPC_PLUGINS)
+    #API calls mostly wait on the database lock, so an RPC node wants many more threads than cores
+    threads = min(256, max(32, m["cpus"] * 16)) if rpc else max(4, m["cpus"])
+    fits = m["mem_total"] >= shared * GIB * 1.1 + GIB
+    config = {"shared-file-size": "%dG" % shared, "webserver-thread-pool-size": threads,
+              #With the state in RAM the kernel writes it back; flushing would only stall block processing
+              "flush-state-interval": 0 if fits else 10000}
+    if fits:
+        #Keep the state in the page cache and write it back rarely
+        vm = {"dirty_background_ratio": 75, "dirty_ratio": 80, "dirty_expire_centisecs": 1000, "dirty_writeback_centisecs": 30000}
+    else:
+        #Pages get evicted anyway: cap dirty memory to what the disk writes back in flush_budget seconds
+        dirty = max(256 * MIB, min(int(m["io"]["seq_write"] * flush_budget), int(m["mem_total"] * 0.5)))
+        vm = {"dirty_background_bytes": dirty // 4, "dirty_bytes": dirty, "dirty_expire_centisecs": 3000, "dirty_writeback_centisecs": 500}
+    notes = []
+    if not fits: notes.append("shared-file-size %dG doesn't fit in %.1fG of RAM, expect the node to be disk bound" % (shared, m["mem_total"] / GIB))
+    if m["io"]["rand_read_iops"] < 1000: notes.append("%d random reads/s: the data directory looks like a spinning disk" % m["io"]["rand_read_iops"])
+    if m["shared_memory"] and shared * GIB < m["shared_memory"]: notes.append("shared_memory.bin is already %s, it doesn't shrink" % gib(m["shared_memory"]))
+    return config, vm, notes
+
+def tuned_config(text, config):
+    lines = text.splitlines(True)
+    for key, value in config.items():
+        line = "%s = %s\n" % (key, value)
+        pattern = re.compile(r"^\s*#?\s*%s\s*=" % re.escape(key))
+        found = [i for i, l in enumerate(lines) if pattern.match(l)]
+        active = [i for i in found if not lines[i].lstrip().startswith("#")]
+        if active or found: lines[(active or found)[0]] = line
+        else:
+            if lines and not lines[-1].endswith("\n"): lines[-1] += "\n"
+            lines.append(line)
+    return "".join(lines)
+
+def vm_diff(current, vm):
+    #Setting a ratio zeroes the matching bytes setting and the other way round
+    out = []
+    for key in VM_KEYS:
+        old = current.get(key)
+        if key in vm: new = vm[key]
+        elif key.replace("_bytes", "_ratio") in vm or key.replace("_ratio", "_bytes") in vm: new = 0
+        else: continue
+        if old != new: out.append("vm.%-28s %12s -> %s" % (key, old, new))
+    return out
+
+def gib(n):
+    return "-" if n is None else "%.1fG" % (n / GIB)
+
+def load_history(path):
+    try:
+        with open(path) as f: return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".%d" % os.getpid()
+    with open(tmp, "w") as f: json.dump(history, f, indent=4)
+    os.replace(tmp, path)
+
+def show_history(history):
+    print("%-16s %-12s %6s %4s %9s %10s %9s %9s %8s %7s %7s" % ("date", "host", "RAM", "CPU", "block_log", "growth/d", "state", "seq w", "seq r", "IOPS", "shared"))
+    for m in history:
+        print("%-16s %-12s %6s %4d %9s %9.1fM %9s %7.0fM/s %6.0fM/s %7d %7s" % (datetime.fromtimestamp(m["time"]).strftime("%Y-%m-%d %H:%M"), m["host"][:12], gib(m["mem_total"]), m["cpus"],
+              gib(m["block_log"]), m["block_log_per_day"] / MIB, gib(m["shared_memory_used"]), m["io"]["seq_write"] / MIB, m["io"]["seq_read"] / MIB, m["io"]["rand_read_iops"], m["config"]["shared-file-size"]))
+
+def run(args):
+    history = load_history(MEASUREMENTS)
+    if args.action == "history":
+        show_history(history)
+        return 0
+    if not args.dir or not args.config: sys.exit("--dir and --config are needed")
+    if not os.path.isdir(args.dir): sys.exit("%s isn't a directory" % args.dir)
+    try:
+        m = measure(args, history)
+    except OSError as e:
+        sys.exit("I/O probe failed: %s" % e)
+    config, vm, notes = recommend(m, args.days, args.flush_budget)
+    m["config"], m["vm_tuned"] = config, vm
+    history.append(m)
+    save_history(MEASUREMENTS, history)
+
+    io = m["io"]
+    print("RAM %s (%s available), %d CPUs, block_log %s (+%.1fM/day, %s), state %s of %s" % (gib(m["mem_total"]), gib(m["mem_available"]), m["cpus"], gib(m["block_log"]),
+          m["block_log_per_day"] / MIB, m["growth_from"], gib(m["shared_memory_used"]), gib(m["shared_memory"])))
+    print("Disk: %.0f MiB/s write, %.0f MiB/s read, %d random reads/s (p99 %.2f ms)" % (io["seq_write"] / MIB, io["seq_read"] / MIB, io["rand_read_iops"], io["rand_read_p99_ms"]))
+    for n in notes: print("Note: " + n)
+    if not args.vm_only:
+        try:
+            with open(args.config) as f: current = f.read()
+        except OSError as e:
+            sys.exit("Can't read %s: %s" % (args.config, e))
+        tuned = tuned_config(current, config)
+        diff = list(difflib.unified_diff(current.splitlines(True), tuned.splitlines(True), args.config, args.config + " (tuned)"))
+        sys.stdout.writelines(diff or ["config.ini is already tuned\n"])
+        if args.apply and diff:
+            try:
+                with open(args.config + ".bak", "w") as f: f.write(current)
+                tmp = args.config + ".%d" % os.getpid()
+                with open(tmp, "w") as f: f.write(tuned)
+                os.replace(tmp, args.config)
+            except OSError as e:
+                sys.exit("Can't write %s: %s" % (args.config, e))
+            print("Written %s (restart the node to use it)" % args.config)
+    print("\n".join(vm_diff(m["vm"], vm)) or "vm settings are already tuned")
+    if args.sysctl:
+        with open(args.sysctl, "w") as f: f.writelines("vm.%s = %d\n" % kv for kv in vm.items())
+    return 0
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
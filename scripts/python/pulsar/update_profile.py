@@ -0,0 +1,56 @@
+import json, sys
+from pulsar.client import get_steem, get_account, checkkey, forget, agent_broadcast
+
+RESIDENT = True
+
+def add_arguments(parser):
+    parser.add_argument('account', help="Name of the Pulsar account", type=str, nargs=1)
+    parser.add_argument('privateactivekey', help="Private active key of the account, not needed with --agent", type=str, nargs='?')
+    parser.add_argument('--agent', help="Sign with the active key held by the signing agent (see: agent)", action='store_true')
+    parser.add_argument('--name', help="Display name", type=str)
+    parser.add_argument('--about', help="About", type=str)
+    parser.add_argument('--location', help="Location", type=str)
+    parser.add_argument('--profile_image', help="Profile picture URL", type=str)
+    parser.add_argument('--cover_image', help="Cover image URL", type=str)
+    parser.add_argument('--website', help="Website", type=str)
+    parser.set_defaults(parser=parser)
+
+def run(args):
+    from pulsar.agent import AgentError
+    if not args.agent and not args.privateactivekey: args.parser.error('The private active key is required, or --agent')
+    acc = get_account(args.account[0])
+
+    if acc is not None:
+        if not args.agent and not checkkey(args.account[0], args.privateactivekey, "active"): sys.exit("Private active key " + args.privateactivekey + " doesn't prove authority for user " + args.account[0])
+
+        profile = acc.profile
+
+        #Account exists
+        #take stuff from blockchain, if the user doesn't provide the args
+        if args.name: profile["name"] = str(args.name)
+
+        if args.about: profile["about"] = str(args.about)
+
+        if args.location: profile["location"] = str(args.location)
+
+        if args.profile_image: profile["profile_image"] = str(args.profile_image)
+
+        if args.cover_image: profile["cover_image"] = str(args.cover_image)
+
+        if args.website: profile["website"] = str(args.website)
+
+        get_steem(keys=[] if args.agent else [args.privateactivekey])
+
+        try:
+            if args.agent: output = agent_broadcast(lambda: acc.update_account_profile(profile), args.account[0])
+            else: output = acc.update_account_profile(profile)
+        except AgentError as e:
+            sys.exit(str(e))
+        forget(args.account[0])
+
+        print(json.dumps(output, indent=4))
+
+    else:
+        sys.exit("The account provided is not a valid account in the Pulsar Blockchain. Wrong account " + args.account[0])
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,104 @@
+import json, sys
+from pulsar.client import get_steem, get_witness, checkkey, forget, agent_broadcast
+from pulsar.util import NULL_KEY
+
+RESIDENT = True
+
+def add_arguments(parser):
+    parser.add_argument('operation', help="Type of operation (update/disable)", type=str, nargs=1)
+    parser.add_argument('account', help="Name of the Pulsar account", type=str, nargs=1)
+    parser.add_argument('privateactivekey', help="Private active key of the account, not needed with --agent", type=str, nargs='?')
+    parser.add_argument('--agent', help="Sign with the active key held by the signing agent (see: agent)", action='store_true')
+    parser.add_argument('--publicownerkey', help="Public owner key of the account", type=str)
+    parser.add_argument('--url', help="URL to display for this witness account", type=str)
+    parser.add_argument('--creationfee', help="Account creation fee to advertise as a witness", type=str)
+    parser.add_argument('--blocksize', help="Blocksize to advertise as a witness", type=int)
+    parser.add_argument('--interestrate', help="Interest rate to advertise as a witness", type=int)
+    parser.set_defaults(parser=parser)
+
+def run(args):
+    from beemgraphenebase.account import PublicKey
+    from pulsar.agent import AgentError
+    if not args.agent and not args.privateactivekey: args.parser.error('The private active key is required, or --agent')
+    if (args.operation[0] == "update"):   
+        wit = get_witness(args.account[0])
+        if wit is not None:
+            if not args.agent and not checkkey(args.account[0], args.privateactivekey, "active"): sys.exit("Private active key " + args.privateactivekey + " doesn't prove authority for user " + args.account[0])
+            wit_json = wit.json()
+            #Witness exists
+            #take stuff from blockchain, if the user doesn't provide the args
+            if not args.publicownerkey:
+                my_publickey = str(wit_json["signing_key"])
+            else:
+                try:
+                    PublicKey(args.publicownerkey, prefix="EUR")
+                except:
+                    sys.exit("Wrong public key syntax " + args.publicownerkey)
+                else:
+                    my_publickey = str(args.publicownerkey)
+
+            if not args.url:
+                my_url = str(wit_json["url"])
+            else:
+                my_url = str(args.url)
+
+            if not args.creationfee:
+                my_fee = str(wit_json["props"]["account_creation_fee"]) 
+            else:
+                my_fee = str(args.creationfee) 
+
+            if not args.blocksize:
+                my_blksize = int(wit_json["props"]["maximum_block_size"]) 
+            else:
+                my_blksize = int(args.blocksize) 
+
+            if not args.interestrate:
+                my_rate = int(wit_json["props"]["sbd_interest_rate"]) 
+            else:
+                my_rate = int(args.interestrate) 
+
+            current = { "account_creation_fee": my_fee, "maximum_block_size": my_blksize, "sbd_interest_rate": my_rate }
+        else:
+            #witness doesn't exist
+            #optional arguments are mandatory, the witness doesn't have stuff
+            if not args.agent and not checkkey(args.account[0], args.privateactivekey, "active"): sys.exit("Private active key " + args.privateactivekey + " doesn't prove authority for user " + args.account[0])
+            if not args.publicownerkey: args.parser.error('The following argument is required for this operation: --publicownerkey')
+            if not args.url: args.parser.error('The following argument is required for this operation: --url')
+            if not args.creationfee: args.parser.error('The following argument is required for this operation: --creationfee')
+            if not isinstance(args.blocksize, int): args.parser.error('The following argument is required for this operation: --blocksize')
+            if not isinstance(args.interestrate, int): args.parser.error('The following argument is required for this operation: --interestrate')
+            try:
+                PublicKey(args.publicownerkey, prefix="EUR")
+            except:
+                sys.exit("Wrong public key syntax " + args.publicownerkey)
+            else:
+                my_publickey = str(args.publicownerkey)
+            my_url = str(args.url)
+            current = { "account_creation_fee": str(args.creationfee), "maximum_block_size": int(args.blocksize), "sbd_interest_rate": int(args.interestrate) }
+
+    elif (args.operation[0] == "disable"):
+        wit = get_witness(args.account[0])
+        if wit is not None:
+            if not args.agent and not checkkey(args.account[0], args.privateactivekey, "active"): sys.exit("Private active key " + args.privateactivekey + " doesn't prove authority for user " + args.account[0])
+            wit_json = wit.json()
+            current = wit_json["props"]
+            my_url = str(wit_json["url"])
+        else:
+             sys.exit("The account provided is not a valid witness in the Pulsar Blockchain. Wrong witness " + args.account[0])
+
+    else:
+        args.parser.error('Invalid input for argument "operation". ' + args.operation[0] + ' is invalid.' + ' Valid options are update or disable') 
+
+    stm = get_steem(keys=[] if args.agent else [args.privateactivekey])
+    if args.operation[0] == "disable": my_publickey = stm.prefix + NULL_KEY
+
+    try:
+        if args.agent: output = agent_broadcast(lambda: stm.witness_update(my_publickey, my_url, current, args.account[0]), args.account[0])
+        else: output = stm.witness_update(my_publickey, my_url, current, args.account[0])
+    except AgentError as e:
+        sys.exit(str(e))
+    forget(args.account[0])
+
+    print(json.dumps(output, indent=4))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
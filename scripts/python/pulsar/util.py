@@ -0,0 +1,83 @@
+import calendar, functools, json, os, re, struct, time
+
+#Small helpers shared by the commands; nothing heavy is imported here
+
+#The public key of a disabled witness, without the chain's prefix (EUR...): compare with endswith,
+#prefix it when it is sent
+NULL_KEY = "1111111111111111111111111111111114T1Anm"
+
+#The timestamp docker puts in front of the lines with --timestamps
+TIMESTAMP = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?Z\s")
+
+def cache_path(name):
+    #Under $XDG_CACHE_HOME/pulsar-cli (~/.cache/pulsar-cli)
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "pulsar-cli", name)
+
+def plugins(config):
+    #The plugins enabled in a config.ini, None without one
+    if not config or not os.path.exists(config): return None
+    found = set()
+    with open(config) as f:
+        for line in f:
+            key, _, value = line.partition("=")
+            if key.strip() == "plugin": found.update(value.split())
+    return sorted(found)
+
+def window(pool, fn, items, size):
+    #pool.map that keeps at most size results in memory
+    pending = []
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= size: yield pending.pop(0).result()
+    for f in pending: yield f.result()
+
+def http_server(address, handler):
+    #http.server.ThreadingHTTPServer is 3.7+, Ubuntu 18.04 has 3.6. Imported here so the commands
+    #that don't serve HTTP don't pay for http.server
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+    return Server(address, handler)
+
+def chain_time(value):
+    #The node's UTC timestamps, E.G. the "time" of the global properties, as epoch seconds
+    return calendar.timegm(time.strptime(value, "%Y-%m-%dT%H:%M:%S"))
+
+def tapos(props):
+    #ref_block_num is the low 16 bits of the head block number, ref_block_prefix the 2nd word of its id
+    block_id = bytes.fromhex(props["head_block_id"])
+    return props["head_block_number"] & 0xffff, struct.unpack_from("<I", block_id, 4)[0]
+
+@functools.lru_cache(maxsize=64)
+def day_start(day):
+    return calendar.timegm(time.strptime(day, "%Y-%m-%d"))
+
+def parse_time(value):
+    #2019-07-29T10:00:00.123456789Z, nanoseconds are more than a float can hold. strptime is
+    #slow for every line of a big log, only the date goes through it
+    m = TIMESTAMP.match(value + " ")
+    if not m: return None
+    s = m.group(1)
+    return day_start(s[:10]) + int(s[11:13]) * 3600 + int(s[14:16]) * 60 + int(s[17:19]) + float((m.group(2) or ".0")[:7])
+
+def split(line):
+    #(timestamp or None, message) for docker json-file lines, --timestamps lines and plain lines
+    if line.startswith("{"):
+        try:
+            entry = json.loads(line)
+            return parse_time(entry["time"]), entry["log"].rstrip("\r\n")
+        except (ValueError, KeyError, TypeError):
+            pass
+    m = TIMESTAMP.match(line)
+    if m: return parse_time(line), line[m.end():].rstrip("\r\n")
+    return None, line.rstrip("\r\n")
+
+def human(seconds):
+    if seconds is None: return "-"
+    seconds = int(seconds)
+    if seconds >= 3600: return "%dh%02dm" % (seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60: return "%dm%02ds" % (seconds // 60, seconds % 60)
+    return "%ds" % seconds
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,168 @@
+from concurrent.futures import ProcessPoolExecutor
+import os, struct, sys, time
+from pulsar.blocklog import DEFAULT_DIR, Block, BlockLog, BlockLogError, num_from_id
+
+RESIDENT = False
+
+#Smallest possible signed_block: previous, timestamp, empty witness, merkle root, no extensions, signature, no transactions
+MIN_BLOCK = 20 + 4 + 1 + 20 + 1 + 65 + 1
+
+def add_arguments(parser):
+    parser.add_argument('--dir', help="Directory with block_log and block_log.index. Default: " + os.path.normpath(DEFAULT_DIR), type=str, default=DEFAULT_DIR)
+    parser.add_argument('--workers', help="Processes verifying ranges of blocks. Default: number of CPUs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--no-truncate', help="Only report, never offer to truncate", action='store_true')
+    parser.add_argument('--yes', help="Truncate without asking when corruption is found", action='store_true')
+
+def check(block, num, prev_id):
+    #(reason, first block to drop) or None. The id of num - 1 is a hash of its header, so a previous id
+    #that doesn't match it may as well mean num - 1 is the corrupt one: both go
+    if num_from_id(block.previous) != num - 1: return "previous id points at block %d" % num_from_id(block.previous), num
+    if prev_id is not None and bytes(block.previous) != prev_id: return "previous id doesn't match the id of block %d" % (num - 1), num - 1
+    return None
+
+def indexed_block(view, index, num):
+    #Block num read through the index, None when it can't be
+    indexed = len(index) // 8
+    if not 1 <= num <= indexed: return None
+    off = struct.unpack_from("<Q", index, (num - 1) * 8)[0]
+    end = struct.unpack_from("<Q", index, num * 8)[0] if num < indexed else len(view)
+    return decode(view, num, off, end - 8)[0] if off < end <= len(view) else None
+
+def link_reason(view, index, num):
+    #Block num doesn't link to num - 1. When num + 1 links to num, num's previous id is right
+    block, nxt = indexed_block(view, index, num), indexed_block(view, index, num + 1)
+    if block is not None and nxt is not None and bytes(nxt.previous) == block.id:
+        return "block %d is corrupt: block %d doesn't link to it, while block %d links to %d" % (num - 1, num, num + 1, num)
+    return "block %d doesn't link to block %d, either may be the corrupt one" % (num, num - 1)
+
+def decode(view, num, start, end):
+    try:
+        return Block(num, start, view[start:end]), None
+    except (IndexError, ValueError, struct.error, BlockLogError) as e:
+        return None, "block doesn't decode: %s" % (str(e) or type(e).__name__)
+
+def find_end(log, view, num, start, prev_id):
+    #Without an index entry for the next block, look for this block's trailing position:
+    #the first copy of its offset that is followed by the end of the log or by a block linking back to it.
+    #If only garbage follows, the first copy is the end of the last good block
+    needle = struct.pack("<Q", start)
+    pos = start + MIN_BLOCK
+    first = (None, None)
+    while True:
+        pos = log.find(needle, pos)
+        if pos < 0: return first
+        block, error = decode(view, num, start, pos)
+        if error is None and check(block, num, prev_id) is None:
+            after = pos + 8
+            if after == len(view): return block, after
+            nxt, _ = decode(view, num + 1, after, min(len(view), after + 4096))
+            if nxt is not None and bytes(nxt.previous) == block.id: return block, after
+            if first[0] is None: first = (block, after)
+        pos += 1
+
+def verify_range(directory, start, end):
+    #Runs in a worker: checks index position, stored position and chain links of start..end
+    with BlockLog(directory) as bl:
+        view, index = bl.view, bl.index_view
+        size = len(view)
+        indexed = len(index) // 8
+        first_previous = prev_id = None
+        for num in range(start, end + 1):
+            off = struct.unpack_from("<Q", index, (num - 1) * 8)[0]
+            nxt = struct.unpack_from("<Q", index, num * 8)[0] if num < indexed else size
+            if not off + MIN_BLOCK + 8 <= nxt <= size:
+                return {"start": start, "bad": num, "reason": "block %d: index position %d is out of bounds" % (num, off), "first_previous": first_previous, "last_id": prev_id}
+            stored = struct.unpack_from("<Q", view, nxt - 8)[0]
+            if stored != off:
+                if num == indexed:
+                    #Last indexed block of a log that kept growing: the index simply ends here
+                    return {"start": start, "bad": None, "open_end": True, "first_previous": first_previous, "last_id": prev_id}
+                return {"start": start, "bad": num, "reason": "block %d: stored position %d doesn't match the index (%d)" % (num, stored, off), "first_previous": first_previous, "last_id": prev_id}
+            block, reason = decode(view, num, off, nxt - 8)
+            bad = num
+            if reason is None: reason, bad = check(block, num, prev_id) or (None, num)
+            if reason: return {"start": start, "bad": bad, "reason": link_reason(view, index, num) if bad < num else "block %d: %s" % (num, reason),
+                               "first_previous": first_previous, "last_id": prev_id}
+            if first_previous is None: first_previous = bytes(block.previous)
+            prev_id = block.id
+        return {"start": start, "bad": None, "first_previous": first_previous, "last_id": prev_id}
+
+def ranges(first, last, parts):
+    step = max(1000, (last - first + parts) // parts)
+    return [(s, min(s + step - 1, last)) for s in range(first, last + 1, step)]
+
+def verify(directory, workers):
+    #Returns (last good block, end of that block in the log, reason or None, log size, index entries)
+    with BlockLog(directory) as bl:
+        size = len(bl.view)
+        indexed = len(bl.index_view) // 8 if bl.index_view is not None else 0
+        last_good, last_end, prev_id, reason, open_end = 0, 0, None, None, False
+
+        if indexed:
+            parts = ranges(1, indexed, workers * 4)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(verify_range, [directory] * len(parts), [s for s, _ in parts], [e for _, e in parts]))
+            for (start, end), r in zip(parts, results):
+                #Ranges were checked independently, link each one to the previous
+                if r["first_previous"] is not None and prev_id is not None and r["first_previous"] != prev_id:
+                    #Same as a link failure inside a range: the last block of the previous range goes too
+                    last_good, reason = start - 2, link_reason(bl.view, bl.index_view, start)
+                    break
+                if r["bad"] is not None:
+                    last_good, prev_id, reason = r["bad"] - 1, r["last_id"] or prev_id, r["reason"]
+                    break
+                if r.get("open_end"):
+                    last_good, prev_id, open_end = end - 1, r["last_id"] or prev_id, True
+                    break
+                last_good, prev_id = end, r["last_id"]
+            if last_good:
+                last_end = (struct.unpack_from("<Q", bl.index_view, last_good * 8)[0] if last_good < indexed else size)
+
+        if reason is None and (open_end or not indexed or last_end < size):
+            #Blocks the index doesn't know about (log grown locally, or no index): walk forward
+            off = last_end
+            while off < size:
+                block, end = find_end(bl.log, bl.view, last_good + 1, off, prev_id)
+                if block is None:
+                    reason = "block %d at offset %d: no valid block found, %d trailing bytes" % (last_good + 1, off, size - off)
+                    break
+                last_good, last_end, prev_id, off = last_good + 1, end, block.id, end
+                block = None
+        return last_good, last_end, reason, size, indexed
+
+def truncate(directory, last_good, last_end, indexed):
+    log = os.path.join(directory, "block_log")
+    index = os.path.join(directory, "block_log.index")
+    os.truncate(log, last_end)
+    if os.path.exists(index):
+        if indexed > last_good: os.truncate(index, last_good * 8)
+        elif indexed < last_good: os.remove(index)
+
+def run(args):
+    started = time.perf_counter()
+    try:
+        last_good, last_end, reason, size, indexed = verify(args.dir, max(1, args.workers))
+    except (BlockLogError, OSError) as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - started
+    print("Checked %d blocks in %.1fs (%.0f blocks/s, %d workers)" % (last_good, elapsed, last_good / elapsed if elapsed else 0, args.workers))
+    if indexed != last_good and reason is None:
+        print("block_log.index has %d entries for %d blocks, pulsard rebuilds it on the next start" % (indexed, last_good))
+    if reason is None:
+        print("block_log is consistent up to block %d" % last_good)
+        return 0
+
+    print("Corruption found: " + reason)
+    print("Last good block is %d, %d bytes of block_log after it would be removed" % (last_good, size - last_end))
+    if args.no_truncate: return 1
+    if not args.yes:
+        try:
+            answer = input("Truncate block_log and block_log.index to block %d? (yes/no) " % last_good)
+        except EOFError:
+            answer = ""
+        if not answer.lower().startswith("y"): return 1
+    truncate(args.dir, last_good, last_end, indexed)
+    print("Truncated to block %d. Replay with: pulsar-cli.sh replay" % last_good)
+    return 0
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import csv, itertools, json, os, sys, time
+
+RESIDENT = False
+
+def add_arguments(parser):
+    parser.add_argument('input', help="CSV (account,password) or NDJSON ({\"account\": ..., \"password\": ...}) file, \"-\" for stdin", type=str, nargs=1)
+    parser.add_argument('--format', help="Input format, guessed from the first line by default", choices=['auto', 'csv', 'ndjson'], default='auto')
+    parser.add_argument('--workers', help="Processes deriving keys. Default: number of CPUs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch', help="Accounts per get_accounts call", type=int, default=100)
+    parser.add_argument('--credentials', help="Also output all derived keys of verified accounts, same layout as .credentials.json", action='store_true')
+    parser.add_argument('--no-chain', help="Only derive keys, don't compare them with the chain", action='store_true')
+
+def read_rows(stream, fmt):
+    lines = (l for l in stream if l.strip())
+    first = next(lines, None)
+    if first is None: return
+    lines = itertools.chain([first], lines)
+    if fmt == "ndjson" or (fmt == "auto" and first.lstrip().startswith("{")):
+        for line in lines:
+            row = json.loads(line)
+            yield str(row.get("account", row.get("name", ""))).strip(), str(row.get("password", row.get("wif", "")))
+    else:
+        for row in csv.reader(lines):
+            if len(row) < 2 or row[0].strip().lower() in ("account", "name"): continue
+            yield row[0].strip(), row[1]
+
+def derive(prefix, row):
+    from pulsar.client import derive_keys
+    name, password = row
+    return derive_keys(name, password, prefix=prefix)
+
+def compare(name, password, keys, account, with_credentials):
+    from pulsar.client import ROLES, chain_auths, cred_data
+    result = {"account": name}
+    if account is None:
+        result.update(ok=False, error="account doesn't exist")
+        return result
+    on_chain = chain_auths(account)
+    mismatch = [role for role in ROLES if keys[role][0] != on_chain[role]]
+    result["ok"] = not mismatch
+    if mismatch: result["mismatch"] = mismatch
+    elif with_credentials: result["credentials"] = cred_data(name, password, keys)
+    return result
+
+def run(args):
+    from pulsar import client
+    stream = sys.stdin if args.input[0] == "-" else open(args.input[0], newline="")
+    prefix = "EUR" if args.no_chain else client.get_steem().prefix
+    rows = read_rows(stream, args.format)
+    total = verified = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            batch = list(itertools.islice(rows, args.batch))
+            if not batch: break
+            #Derivation runs in the pool while this process fetches the batch from the chain
+            derived = pool.map(partial(derive, prefix), batch, chunksize=max(1, len(batch) // (args.workers * 4)))
+            accounts = [None] * len(batch) if args.no_chain else client.get_accounts([name for name, _ in batch])
+            for (name, password), keys, account in zip(batch, derived, accounts):
+                if args.no_chain:
+                    result = {"account": name, "credentials": client.cred_data(name, password, keys)}
+                else:
+                    result = compare(name, password, keys, account, args.credentials)
+                    verified += result["ok"]
+                print(json.dumps(result), flush=True)
+                total += 1
+            client.forget()
+
+    if stream is not sys.stdin: stream.close()
+    elapsed = time.perf_counter() - start
+    summary = "%d accounts in %.2fs (%.1f accounts/s, %d workers)" % (total, elapsed, total / elapsed if elapsed else 0.0, args.workers)
+    if not args.no_chain: summary += ", %d verified, %d failed" % (verified, total - verified)
+    print(summary, file=sys.stderr)
+    if verified < total and not args.no_chain: return 1
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
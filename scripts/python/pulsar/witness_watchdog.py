@@ -0,0 +1,321 @@
+from datetime import datetime, timedelta, timezone
+import json, os, sys, time
+from pulsar.util import NULL_KEY, cache_path, chain_time, tapos
+
+RESIDENT = False
+
+#Follows the chain one block at a time and switches the witness signing key to the next backup
+#as soon as total_missed goes up. The witness_update for the switch is signed in advance and
+#re-signed with a fresh TaPoS reference and expiration while nothing happens, so on a miss the
+#only work left is sending it over the connection used for polling.
+
+BLOCK_INTERVAL = 3
+HISTORY = cache_path("watchdog.json")
+
+def add_arguments(parser):
+    parser.add_argument('--credentials', help="The witness .credentials.json (name and active key)", type=str)
+    parser.add_argument('--agent', help="Sign with the active key held by the signing agent (see: agent) instead of --credentials", action='store_true')
+    parser.add_argument('--witness', help="With --agent: the witness account", type=str)
+    parser.add_argument('--backup-key', help="Public signing key of a backup node, in order of use. Can be repeated", type=str, action='append', default=[])
+    parser.add_argument('--disable-last', help="When the last backup misses too, disable the witness", action='store_true')
+    parser.add_argument('--misses', help="Missed blocks that trigger a switch", type=int, default=1)
+    parser.add_argument('--node', help="Node to follow and broadcast to. Default: the best http node of PULSAR_NODES", type=str)
+    parser.add_argument('--expiration', help="Expiration of the prepared transaction, in seconds", type=int, default=600)
+    parser.add_argument('--refresh', help="Re-sign the prepared transaction when it's this old, in seconds", type=int, default=120)
+    parser.add_argument('--history', help="File recording every switch. Default: " + HISTORY, type=str, default=HISTORY)
+    parser.add_argument('--dry-run', help="Detect and prepare, but never broadcast", action='store_true')
+    parser.add_argument('--simulate', help="Run against a simulated chain where the producer stops after a few rounds", action='store_true')
+
+def log(msg):
+    print(time.strftime("%Y-%m-%d %H:%M:%S ") + msg, flush=True)
+
+class RpcChain:
+    #The real chain through one kept-alive connection
+    def __init__(self, url, witness, follow=False):
+        from pulsar.nodes import Endpoint
+        self.endpoint = Endpoint(url, timeout=5)
+        self.witness = witness
+        self.block_interval = BLOCK_INTERVAL
+        #Node taken from PULSAR_NODES: move to the best one as the background ranking changes
+        self.follow = follow
+
+    def follow_best(self):
+        from pulsar.nodes import Endpoint, get_manager
+        best = get_manager().best(ws=False, refresh=False)
+        if best is not None and best.url != self.endpoint.url:
+            log("Following the best node: " + best.url)
+            self.endpoint = Endpoint(best.url, timeout=5)
+
+    def poll(self):
+        from pulsar.nodes import RPCError, payload
+        if self.follow: self.follow_best()
+        reply = self.endpoint.request([payload("condenser_api.get_dynamic_global_properties", []), payload("condenser_api.get_witness_by_account", [self.witness])])
+        for r in reply:
+            if "error" in r: raise RPCError(r["error"].get("message", r["error"]))
+        props, wit = (r["result"] for r in sorted(reply, key=lambda r: r["id"]))
+        if wit is None: raise ValueError("Not a witness: " + self.witness)
+        return props, wit
+
+    def broadcast(self, tx):
+        return self.endpoint.call("condenser_api.broadcast_transaction", [tx])
+
+class BeemSigner:
+    #Signs witness_update locally: no lookups, the TaPoS reference comes from the last poll
+    def __init__(self, wif, expiration):
+        from pulsar.client import get_steem
+        self.steem = get_steem()
+        self.prefix = self.steem.prefix
+        self.wif = wif
+        self.expiration = expiration
+
+    def sign(self, witness, key, props):
+        from beem.amount import Amount
+        from beem.transactionbuilder import TransactionBuilder
+        from beembase import operations
+        op = operations.Witness_update(**{
+            "owner": witness["owner"],
+            "url": witness["url"],
+            "block_signing_key": key,
+            "props": witness["props"],
+            "fee": Amount(0, self.steem.steem_symbol, steem_instance=self.steem),
+            "prefix": self.steem.prefix,
+        })
+        tx = TransactionBuilder(expiration=self.expiration, steem_instance=self.steem)
+        tx.appendOps(op)
+        tx.appendWif(self.wif)
+        tx.constructTx(*tapos(props))
+        tx.sign(reconstruct_tx=False)
+        return tx.json()
+
+class AgentSigner:
+    #The same witness_update, signed by the signing agent: no key in this process. The connection
+    #to the agent is kept, like the one to the node
+    def __init__(self, expiration):
+        from pulsar.agent import AgentClient
+        from pulsar.client import get_steem
+        stm = get_steem()
+        self.chain = dict(stm.chain_params)
+        self.prefix = self.chain["prefix"]
+        self.fee = "0.000 " + stm.steem_symbol
+        self.client = AgentClient()
+        self.expiration = expiration
+
+    def sign(self, witness, key, props):
+        ref_num, ref_prefix = tapos(props)
+        expiration = datetime.fromtimestamp(chain_time(props["time"]) + self.expiration, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        op = {"owner": witness["owner"], "url": witness["url"], "block_signing_key": key, "props": witness["props"], "fee": self.fee}
+        tx = {"ref_block_num": ref_num, "ref_block_prefix": ref_prefix, "expiration": expiration, "operations": [["witness_update", op]], "extensions": []}
+        return self.client.sign(self.chain, [tx], [[[witness["owner"], "active"]]])[0]
+
+class SimChain:
+    #21 witnesses in turn, ours stops producing after a few rounds until its signing key is
+    #switched. Broadcasts apply with the next block
+    def __init__(self, witness, broken_key, interval=0.1, stop_after=3):
+        self.witness = witness
+        self.block_interval = interval
+        self.schedule = ["sim%02d" % i for i in range(20)] + [witness]
+        self.started = time.time()
+        self.head = 1000
+        self.slot = 0
+        self.stop_block = self.head + stop_after * len(self.schedule)
+        self.broken_key = broken_key
+        self.wit = {"owner": witness, "url": "https://example.com", "signing_key": "EUR6primary", "total_missed": 7, "last_confirmed_block_num": self.head, "props": {"account_creation_fee": "0.100 PULSE", "maximum_block_size": 131072, "sbd_interest_rate": 0}}
+        self.pending = []
+        self.broadcasts = []
+
+    def _advance(self):
+        due = int((time.time() - self.started) / self.block_interval)
+        while self.slot < due:
+            self.slot += 1
+            for tx in self.pending: self.wit["signing_key"] = tx["operations"][0][1]["block_signing_key"]
+            self.pending = []
+            if self.schedule[self.slot % len(self.schedule)] == self.witness:
+                if self.head >= self.stop_block and self.wit["signing_key"] == self.broken_key:
+                    self.wit["total_missed"] += 1
+                    continue
+                self.wit["last_confirmed_block_num"] = self.head + 1
+            self.head += 1
+
+    def poll(self):
+        self._advance()
+        t = self.started + self.slot * self.block_interval
+        props = {"head_block_number": self.head, "head_block_id": "%08x" % self.head + "%08x" % (self.head * 2654435761 % 2 ** 32) + "00" * 12,
+                 "time": datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"), "sim_time": t}
+        return props, dict(self.wit)
+
+    def broadcast(self, tx):
+        self._advance()
+        if tx["expiration"] < datetime.fromtimestamp(time.time(), timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"): raise ValueError("expired transaction")
+        self.pending.append(tx)
+        self.broadcasts.append(tx)
+        return {"id": "%040x" % len(self.broadcasts)}
+
+class SimSigner:
+    def __init__(self, expiration):
+        self.prefix = "EUR"
+        self.expiration = expiration
+
+    def sign(self, witness, key, props):
+        ref_num, ref_prefix = tapos(props)
+        expiration = (datetime.now(timezone.utc) + timedelta(seconds=self.expiration)).strftime("%Y-%m-%dT%H:%M:%S")
+        return {"ref_block_num": ref_num, "ref_block_prefix": ref_prefix, "expiration": expiration,
+                "operations": [["witness_update", dict(witness, block_signing_key=key)]], "extensions": [], "signatures": ["sim"]}
+
+class Watchdog:
+    def __init__(self, chain, signer, backups, misses=1, refresh=120, disable_last=False, dry_run=False, history=None):
+        self.chain = chain
+        self.signer = signer
+        self.backups = list(backups) + ([signer.prefix + NULL_KEY] if disable_last else [])
+        self.misses = misses
+        self.refresh = refresh
+        self.dry_run = dry_run
+        self.history = history
+        self.key = None
+        self.baseline = None
+        self.prepared = None #(key, transaction, monotonic time it was signed)
+        self.target = None #(key, transaction, poll number) of a switch waiting to show up on chain
+        self.polls = 0
+        self.switches = []
+
+    def next_key(self, current):
+        #The backup after the key in use, the first one if the primary is in use
+        if current in self.backups: i = self.backups.index(current) + 1
+        else: i = 0
+        return self.backups[i] if i < len(self.backups) else None
+
+    def prepare(self, props, wit):
+        key = self.next_key(wit["signing_key"])
+        self.prepared = (key, self.signer.sign(wit, key, props), time.monotonic())
+
+    def step(self):
+        props, wit = self.chain.poll()
+        self.polls += 1
+        missed = int(wit["total_missed"])
+        if wit["signing_key"] != self.key:
+            #First poll, a switch that went through or a key changed by hand: count misses from here
+            if self.target is not None and wit["signing_key"] == self.target[0]: log("Signing key of @%s is now %s" % (wit["owner"], wit["signing_key"]))
+            self.key, self.baseline, self.target = wit["signing_key"], missed, None
+        elif self.target is not None and self.polls - self.target[2] > 10:
+            log("The switch to %s didn't show up on chain, sending a new one" % self.target[0])
+            self.target = None
+            self.prepared = None
+        next_key = self.next_key(self.key)
+        if next_key is None or self.target is not None: return props
+        if missed - self.baseline >= self.misses:
+            self.switch(props, wit, missed)
+        elif self.prepared is None or self.prepared[0] != next_key or time.monotonic() - self.prepared[2] > self.refresh:
+            self.prepare(props, wit)
+        return props
+
+    def switch(self, props, wit, missed):
+        detected = time.perf_counter()
+        if self.prepared is None or self.prepared[0] != self.next_key(wit["signing_key"]): self.prepare(props, wit)
+        key, tx, _ = self.prepared
+        if self.dry_run:
+            error = "dry run"
+        else:
+            try:
+                self.chain.broadcast(tx)
+                error = None
+            except Exception as e:
+                error = str(e)
+        elapsed = time.perf_counter() - detected
+        record = {"time": time.time(), "witness": wit["owner"], "block": props["head_block_number"], "missed": missed - self.baseline,
+                  "from": wit["signing_key"], "to": key, "detect_to_broadcast_ms": round(elapsed * 1000, 3), "error": error}
+        self.switches.append(record)
+        self.save(record)
+        if self.dry_run:
+            log("@%s missed %d block(s) at %d: would switch signing key to %s (dry run)" % (wit["owner"], missed - self.baseline, props["head_block_number"], key))
+            self.baseline = missed
+            return
+        if error:
+            log("Switching @%s to %s FAILED after %.1f ms: %s" % (wit["owner"], key, elapsed * 1000, error))
+            self.prepared = None
+            return
+        log("@%s missed %d block(s) at %d: switched signing key to %s, %.3f ms from detection to broadcast" % (wit["owner"], missed - self.baseline, props["head_block_number"], key, elapsed * 1000))
+        self.target = (key, tx, self.polls)
+        self.prepared = None
+
+    def save(self, record):
+        if not self.history: return
+        try:
+            with open(self.history) as f: data = json.load(f)
+        except (OSError, ValueError):
+            data = []
+        data.append(record)
+        os.makedirs(os.path.dirname(os.path.abspath(self.history)), exist_ok=True)
+        tmp = self.history + ".%d" % os.getpid()
+        with open(tmp, "w") as f: json.dump(data, f, indent=4)
+        os.replace(tmp, self.history)
+
+    def wait(self, props):
+        #Poll just after the next block is due
+        now = time.time()
+        t = props.get("sim_time") or chain_time(props["time"])
+        interval = self.chain.block_interval
+        due = interval - (now - t) % interval + interval / 12
+        time.sleep(min(interval, max(interval / 12, due)))
+
+    def run(self, until=None):
+        while until is None or until():
+            try:
+                props = self.step()
+            except Exception as e:
+                log("Poll failed: %s" % e)
+                time.sleep(self.chain.block_interval / 3)
+                continue
+            self.wait(props)
+
+def load_credentials(path):
+    with open(path) as f: creds = json.load(f)
+    return creds["name"], next(k["value"] for k in creds["active"] if k["type"] == "private")
+
+def simulate(args):
+    backups = args.backup_key or ["EUR6backup1", "EUR6backup2"]
+    chain = SimChain("simwitness", broken_key="EUR6primary")
+    dog = Watchdog(chain, SimSigner(args.expiration), backups, args.misses, args.refresh, args.disable_last, args.dry_run, history=None)
+    log("Simulated chain: 21 witnesses, %.1fs blocks, @simwitness stops producing at block %d" % (chain.block_interval, chain.stop_block))
+    deadline = time.time() + 6 * len(chain.schedule) * chain.block_interval
+    #Until the witness produced a block with the backup key
+    dog.run(until=lambda: time.time() < deadline and not (dog.switches and chain.wit["last_confirmed_block_num"] > dog.switches[0]["block"]))
+    props, wit = chain.poll()
+    if not dog.switches: sys.exit("No switch happened")
+    s = dog.switches[0]
+    log("Detection to broadcast: %.3f ms, missed %d, signing key on chain: %s, produced again at block %d" % (s["detect_to_broadcast_ms"], wit["total_missed"] - 7, wit["signing_key"], wit["last_confirmed_block_num"]))
+    return 0 if args.dry_run or wit["signing_key"] == s["to"] else 1
+
+def run(args):
+    if args.simulate: return simulate(args)
+    if args.agent and not args.witness: sys.exit("--agent needs --witness")
+    if not args.agent and not args.credentials: sys.exit("--credentials (or --agent) is needed")
+    if not args.backup_key and not args.disable_last: sys.exit("Give at least one --backup-key (or --disable-last)")
+    if args.agent:
+        from pulsar.agent import AgentClient, AgentError
+        witness = args.witness
+        try:
+            status = AgentClient().request({"op": "status"})
+        except AgentError as e:
+            sys.exit(str(e))
+        if not any(k.startswith(witness + "/") for k in status["keys"]): sys.exit("The signing agent holds no key of @%s, unlock it or import the key" % witness)
+        #Switches are signed when they are prepared, a locked agent means no switch
+        if status["expires_in"] is not None: log("Warning: the agent locks its keys in %ds, start it with --ttl 0 for the watchdog" % status["expires_in"])
+        signer = AgentSigner(args.expiration)
+    else:
+        witness, wif = load_credentials(args.credentials)
+        signer = BeemSigner(wif, args.expiration)
+    url = args.node
+    if url is None:
+        from pulsar.nodes import get_manager
+        best = get_manager().best(ws=False)
+        if best is None: sys.exit("No http node in PULSAR_NODES")
+        url = best.url
+        get_manager().start()
+    chain = RpcChain(url, witness, follow=args.node is None)
+    dog = Watchdog(chain, signer, args.backup_key, args.misses, args.refresh, args.disable_last, args.dry_run, args.history)
+    log("Watching @%s on %s, switching after %d missed block(s) to: %s" % (witness, url, args.misses, ", ".join(dog.backups)))
+    try:
+        dog.run()
+    except KeyboardInterrupt:
+        pass
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
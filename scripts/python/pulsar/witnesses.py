@@ -0,0 +1,224 @@
+import csv, json, os, sys, time
+from pulsar.util import NULL_KEY, cache_path, chain_time
+
+RESIDENT = True
+
+#Witness queries from a local snapshot cache, one file per head block. A refresh only fetches the
+#witnesses touched since the cached head: the blocks in between are scanned for witness
+#operations, votes and producers, and the scheduled witnesses are always refetched (they are the
+#ones missing blocks). Stake changes of voters that don't show up as operations (power downs) are
+#caught by a full refresh every --full-every seconds.
+
+CACHE = cache_path("witnesses")
+SORTS = ("votes", "missed", "version", "feed_age", "name", "last_block")
+FIELDS = ("rank", "owner", "votes", "total_missed", "last_confirmed_block_num", "running_version", "feed", "feed_age", "enabled", "active", "url")
+#Operations that change a witness object, by the field naming the witness
+WITNESS_OPS = {"witness_update": "owner", "witness_set_properties": "owner", "feed_publish": "publisher", "account_witness_vote": "witness"}
+#Operations that change the vote weight of an account, so of every witness it votes for
+VOTER_OPS = {"account_witness_proxy": ("account",), "transfer_to_vesting": ("from", "to"), "withdraw_vesting": ("account",)}
+MAX_SCAN = 1200
+BLOCK_BATCH = 100
+WITNESS_BATCH = 200
+
+def add_arguments(parser):
+    parser.add_argument('action', help="list: query the witnesses, diff: compare two snapshots, snapshots: list the cached snapshots", choices=['list', 'diff', 'snapshots'], nargs='?', default='list')
+    parser.add_argument('snapshots', help="With diff: head blocks of the two snapshots. Default: the two latest", type=int, nargs='*')
+    parser.add_argument('--sort', help="Sort key", choices=SORTS, default='votes')
+    parser.add_argument('--reverse', help="Reverse the order", action='store_true')
+    parser.add_argument('--top', help="Only the first N after sorting", type=int)
+    parser.add_argument('--active', help="Only witnesses in the current schedule", action='store_true')
+    parser.add_argument('--enabled', help="Only witnesses with a signing key", action='store_true')
+    parser.add_argument('--version', help="Only witnesses running this version", type=str)
+    parser.add_argument('--stale', help="Feeds older than this many hours are stale (filter for list, threshold for diff, default 24)", type=float)
+    parser.add_argument('--format', help="Output format", choices=['table', 'json', 'csv'], default='table')
+    parser.add_argument('--max-age', help="Use the latest snapshot without any request if it is younger than this, in seconds", type=float, default=3.0)
+    parser.add_argument('--full-every', help="Refetch every witness when the last full refresh is older than this, in seconds", type=float, default=3600.0)
+    parser.add_argument('--keep', help="Snapshots kept in the cache", type=int, default=100)
+    parser.add_argument('--cache', help="Snapshot directory. Default: " + CACHE, type=str, default=CACHE)
+
+class WitnessError(Exception):
+    pass
+
+def batch(ep, calls):
+    from pulsar.nodes import payload
+    body = [payload(m, p) for m, p in calls]
+    by_id = {r.get("id"): r for r in ep.request(body)}
+    out = []
+    for (method, _), p in zip(calls, body):
+        r = by_id.get(p["id"], {})
+        if "result" not in r: raise WitnessError("%s: %s" % (method, (r.get("error") or {}).get("message", "no reply")))
+        out.append(r["result"])
+    return out
+
+def chunks(items, n):
+    items = list(items)
+    return [items[i:i + n] for i in range(0, len(items), n)]
+
+def fetch_witnesses(ep, names):
+    out = {}
+    for part in chunks(sorted(names), WITNESS_BATCH):
+        for name, w in zip(part, batch(ep, [("condenser_api.get_witness_by_account", [n]) for n in part])):
+            if w: out[name] = w
+    return out
+
+def all_names(ep):
+    names, start = [], ""
+    while True:
+        page = batch(ep, [("condenser_api.lookup_witness_accounts", [start, 1000])])[0]
+        new = [n for n in page if n > start or not names]
+        names += new
+        if len(page) < 1000 or not new: return names
+        start = page[-1]
+
+def touched(ep, first, last):
+    #Witnesses changed by blocks first..last: witness operations, producers, and the witnesses of
+    #voters whose stake or proxy changed
+    names, voters = set(), set()
+    for part in chunks(range(first, last + 1), BLOCK_BATCH):
+        for block in batch(ep, [("condenser_api.get_block", [n]) for n in part]):
+            if not block: continue
+            names.add(block["witness"])
+            for tx in block.get("transactions", []):
+                for kind, op in tx["operations"]:
+                    if kind in WITNESS_OPS: names.add(op[WITNESS_OPS[kind]])
+                    if kind == "account_witness_vote": voters.add(op["account"])
+                    for field in VOTER_OPS.get(kind, ()):
+                        if op.get(field): voters.add(op[field])
+    for part in chunks(sorted(voters), WITNESS_BATCH):
+        for acc in batch(ep, [("condenser_api.get_accounts", [part])])[0]:
+            names.update(acc.get("witness_votes", []))
+    return names
+
+def snapshot_paths(cache):
+    try:
+        files = [f for f in os.listdir(cache) if f.endswith(".json") and f[:-5].isdigit()]
+    except OSError:
+        return []
+    return [os.path.join(cache, f) for f in sorted(files, key=lambda f: int(f[:-5]))]
+
+def load(path):
+    with open(path) as f: return json.load(f)
+
+def save(cache, snap, keep):
+    os.makedirs(cache, exist_ok=True)
+    path = os.path.join(cache, "%d.json" % snap["head"])
+    tmp = path + ".%d" % os.getpid()
+    with open(tmp, "w") as f: json.dump(snap, f)
+    os.replace(tmp, path)
+    for old in snapshot_paths(cache)[:-keep]: os.unlink(old)
+
+def refresh(args):
+    paths = snapshot_paths(args.cache)
+    latest = load(paths[-1]) if paths else None
+    if latest and time.time() - latest["fetched"] < args.max_age: return latest
+    from pulsar.nodes import get_manager
+    ep = get_manager().best(ws=False)
+    if ep is None: raise WitnessError("No http node in PULSAR_NODES")
+    props, schedule = batch(ep, [("condenser_api.get_dynamic_global_properties", []), ("condenser_api.get_active_witnesses", [])])
+    head = props["head_block_number"]
+    if latest and latest["head"] == head:
+        latest["fetched"] = time.time()
+        return latest
+    now = time.time()
+    full = latest is None or now - latest["full"] > args.full_every or head - latest["head"] > MAX_SCAN or head < latest["head"]
+    if full:
+        witnesses = fetch_witnesses(ep, all_names(ep))
+        stats = "full refresh, %d witnesses" % len(witnesses)
+    else:
+        names = (touched(ep, latest["head"] + 1, head) | set(schedule)) - {""}
+        witnesses = dict(latest["witnesses"])
+        witnesses.update(fetch_witnesses(ep, names))
+        stats = "%d blocks scanned, %d witnesses refetched" % (head - latest["head"], len(names))
+    snap = {"head": head, "time": props["time"], "schedule": schedule, "witnesses": witnesses, "fetched": now, "full": now if full else latest["full"]}
+    save(args.cache, snap, args.keep)
+    sys.stderr.write("Block %d: %s\n" % (head, stats))
+    return snap
+
+def amount(value):
+    return float(value.split()[0]) if isinstance(value, str) else float(value["amount"]) / 10 ** value["precision"]
+
+def rows(snap):
+    #One flat row per witness, ranked by votes
+    now = chain_time(snap["time"])
+    active = set(snap["schedule"])
+    ranked = sorted(snap["witnesses"].values(), key=lambda w: (-int(w["votes"]), w["owner"]))
+    out = []
+    for rank, w in enumerate(ranked, 1):
+        rate = w.get("sbd_exchange_rate") or {}
+        quote = amount(rate["quote"]) if rate else 0
+        out.append({"rank": rank, "owner": w["owner"], "votes": round(int(w["votes"]) / 1e12, 3), "total_missed": w["total_missed"],
+                    "last_confirmed_block_num": w["last_confirmed_block_num"], "running_version": w["running_version"],
+                    "feed": round(amount(rate["base"]) / quote, 3) if quote else None,
+                    "feed_age": round((now - chain_time(w["last_sbd_exchange_update"])) / 3600.0, 1) if w.get("last_sbd_exchange_update") else None,
+                    "enabled": not w["signing_key"].endswith(NULL_KEY), "active": w["owner"] in active, "url": w["url"]})
+    return out
+
+def version_key(v):
+    return tuple(int(x) if x.isdigit() else 0 for x in (v or "0").split("."))
+
+SORT_KEYS = {"votes": lambda r: -r["votes"], "missed": lambda r: -r["total_missed"], "version": lambda r: tuple(-x for x in version_key(r["running_version"])),
+             "feed_age": lambda r: -(r["feed_age"] if r["feed_age"] is not None else float("inf")), "name": lambda r: r["owner"],
+             "last_block": lambda r: -r["last_confirmed_block_num"]}
+
+def query(snap, args):
+    out = rows(snap)
+    if args.active: out = [r for r in out if r["active"]]
+    if args.enabled: out = [r for r in out if r["enabled"]]
+    if args.version: out = [r for r in out if r["running_version"] == args.version]
+    if args.stale is not None: out = [r for r in out if r["feed_age"] is None or r["feed_age"] > args.stale]
+    out.sort(key=SORT_KEYS[args.sort], reverse=args.reverse)
+    return out[:args.top] if args.top else out
+
+def diff(a, b, stale):
+    #Changes from snapshot a to snapshot b, as rows
+    ra, rb = ({r["owner"]: r for r in rows(s)} for s in (a, b))
+    out = []
+    def change(owner, what, old, new): out.append({"owner": owner, "change": what, "old": old, "new": new})
+    for owner in sorted(set(a["schedule"]) - set(b["schedule"])): change(owner, "left schedule", True, False)
+    for owner in sorted(set(b["schedule"]) - set(a["schedule"])): change(owner, "joined schedule", False, True)
+    for owner in sorted(set(rb) - set(ra)): change(owner, "new witness", None, rb[owner]["rank"])
+    for owner in sorted(set(ra) & set(rb)):
+        x, y = ra[owner], rb[owner]
+        if x["enabled"] != y["enabled"]: change(owner, "enabled" if y["enabled"] else "disabled", x["enabled"], y["enabled"])
+        if y["total_missed"] > x["total_missed"]: change(owner, "missed blocks", x["total_missed"], y["total_missed"])
+        if x["running_version"] != y["running_version"]: change(owner, "version", x["running_version"], y["running_version"])
+        if x["feed"] != y["feed"]: change(owner, "feed", x["feed"], y["feed"])
+        if stale is not None and y["feed_age"] is not None and y["feed_age"] > stale and (x["feed_age"] is None or x["feed_age"] <= stale):
+            change(owner, "feed stale", x["feed_age"], y["feed_age"])
+        if x["rank"] != y["rank"] and min(x["rank"], y["rank"]) <= 21: change(owner, "rank", x["rank"], y["rank"])
+    return out
+
+def output(items, fields, fmt):
+    if fmt == "json":
+        print(json.dumps(items, indent=4))
+    elif fmt == "csv":
+        w = csv.DictWriter(sys.stdout, fieldnames=fields, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(items)
+    else:
+        cells = [[("-" if r[f] is None else str(r[f])) for f in fields] for r in items]
+        widths = [max([len(f)] + [len(c[i]) for c in cells]) for i, f in enumerate(fields)]
+        for line in [list(fields)] + cells: print("  ".join(c.ljust(w) for c, w in zip(line, widths)).rstrip())
+
+def run(args):
+    from pulsar.nodes import RPCError
+    try:
+        if args.action == "snapshots":
+            for path in snapshot_paths(args.cache):
+                s = load(path)
+                print("%10d  %s  %4d witnesses  %s" % (s["head"], s["time"], len(s["witnesses"]), "full" if s["full"] == s["fetched"] else "incremental"))
+            return 0
+        if args.action == "diff":
+            paths = {int(os.path.basename(p)[:-5]): p for p in snapshot_paths(args.cache)}
+            if args.snapshots and len(args.snapshots) != 2: raise WitnessError("diff takes two snapshot head blocks, or none")
+            heads = args.snapshots or sorted(paths)[-2:]
+            if len(heads) < 2 or any(h not in paths for h in heads): raise WitnessError("No such snapshots, see: witnesses snapshots")
+            a, b = (load(paths[h]) for h in heads)
+            output(diff(a, b, 24.0 if args.stale is None else args.stale), ("owner", "change", "old", "new"), args.format)
+            return 0
+        output(query(refresh(args), args), FIELDS, args.format)
+        return 0
+    except (WitnessError, RPCError, OSError, ValueError) as e:
+        sys.exit(str(e))
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et:
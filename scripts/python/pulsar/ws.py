@@ -0,0 +1,88 @@
+from urllib.parse import urlparse
+import base64, hashlib, os, socket, ssl, struct
+
+#Minimal RFC 6455 client, enough for JSON-RPC over the node's websocket endpoint (8089)
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+class WebSocketError(OSError):
+    pass
+
+class WebSocket:
+    def __init__(self, url, timeout=10):
+        u = urlparse(url)
+        port = u.port or (443 if u.scheme == "wss" else 80)
+        sock = socket.create_connection((u.hostname, port), timeout=timeout)
+        if u.scheme == "wss": sock = ssl.create_default_context().wrap_socket(sock, server_hostname=u.hostname)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.buf = b""
+        key = base64.b64encode(os.urandom(16)).decode()
+        path = (u.path or "/") + ("?" + u.query if u.query else "")
+        sock.sendall(("GET %s HTTP/1.1\r\nHost: %s:%d\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      "Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n" % (path, u.hostname, port, key)).encode())
+        head = self._read_until(b"\r\n\r\n").decode("latin-1")
+        if not head.startswith("HTTP/1.1 101"): raise WebSocketError("Handshake refused by %s: %s" % (url, head.splitlines()[0]))
+        accept = base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+        if ("sec-websocket-accept: " + accept).lower() not in head.lower(): raise WebSocketError("Bad handshake from " + url)
+
+    def _read(self, n):
+        while len(self.buf) < n:
+            data = self.sock.recv(max(65536, n - len(self.buf)))
+            if not data: raise WebSocketError("Connection closed")
+            self.buf += data
+        out, self.buf = self.buf[:n], self.buf[n:]
+        return out
+
+    def _read_until(self, marker):
+        while marker not in self.buf:
+            data = self.sock.recv(4096)
+            if not data: raise WebSocketError("Connection closed during handshake")
+            self.buf += data
+        i = self.buf.index(marker) + len(marker)
+        out, self.buf = self.buf[:i], self.buf[i:]
+        return out
+
+    def _frame(self, opcode, payload):
+        mask = os.urandom(4)
+        n = len(payload)
+        if n < 126: head = struct.pack("!BB", 0x80 | opcode, 0x80 | n)
+        elif n < 65536: head = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, n)
+        else: head = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, n)
+        self.sock.sendall(head + mask + _mask(payload, mask))
+
+    def send(self, text):
+        self._frame(0x1, text.encode())
+
+    def recv(self):
+        message = b""
+        while True:
+            b1, b2 = self._read(2)
+            opcode, n = b1 & 0x0f, b2 & 0x7f
+            if n == 126: n = struct.unpack("!H", self._read(2))[0]
+            elif n == 127: n = struct.unpack("!Q", self._read(8))[0]
+            mask = self._read(4) if b2 & 0x80 else None
+            payload = self._read(n)
+            if mask: payload = _mask(payload, mask)
+            if opcode == 0x9: self._frame(0xA, payload); continue
+            if opcode == 0xA: continue
+            if opcode == 0x8: raise WebSocketError("Closed by server")
+            message += payload
+            if b1 & 0x80: return message.decode()
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def close(self):
+        try:
+            self._frame(0x8, b"")
+        except OSError:
+            pass
+        self.sock.close()
+
+def _mask(payload, mask):
+    n = len(payload)
+    key = int.from_bytes((mask * (n // 4 + 1))[:n], "big")
+    return (int.from_bytes(payload, "big") ^ key).to_bytes(n, "big")
+
+# vim: set filetype=sh ts=4 sw=4 tw=0 wrap et: